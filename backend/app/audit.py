@@ -0,0 +1,109 @@
+"""Prediction audit log written in batches off the request path"""
+import queue
+import threading
+import time
+
+from sqlalchemy import insert
+
+from app.models import Prediction
+from app.prediction_stats import apply_rollups
+
+
+class AuditLogWriter:
+    """Buffer prediction rows and insert them from a background thread
+
+    `record` only appends to an in-memory queue. The writer thread drains up
+    to `batch_size` rows at a time, or whatever arrived within
+    `flush_interval` seconds, and inserts them with one executemany in one
+    transaction, together with the matching rollup updates. If the queue
+    holds `max_queue` rows, new rows are dropped and counted rather than
+    slowing predictions down.
+    """
+
+    def __init__(self, session_factory, batch_size=256, flush_interval=1.0, max_queue=10000):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_error = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="audit-log", daemon=True)
+            self._thread.start()
+
+    def record(self, rows):
+        """Queue audit rows (dicts of Prediction columns) without blocking"""
+        self.start()
+        for row in rows:
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                with self._lock:
+                    self.dropped += 1
+
+    def _drain(self):
+        """Wait for the first row, then collect a batch until it is full or the interval ends"""
+        try:
+            rows = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(rows) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                rows.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return rows
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            rows = self._drain()
+            if rows:
+                self._write(rows)
+
+    def _write(self, rows):
+        db = self.session_factory()
+        try:
+            db.execute(insert(Prediction), rows)
+            apply_rollups(db, rows)
+            db.commit()
+            with self._lock:
+                self.written += len(rows)
+                self.batches += 1
+        except Exception as e:
+            db.rollback()
+            with self._lock:
+                self.failed += len(rows)
+                self.last_error = str(e)
+            print(f"✗ Audit log write failed ({len(rows)} rows): {str(e)}")
+        finally:
+            db.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": self._queue.qsize(),
+                "written": self.written,
+                "batches": self.batches,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "last_error": self.last_error,
+            }
+
+    def shutdown(self, timeout=10.0):
+        """Flush queued rows and stop the writer thread"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
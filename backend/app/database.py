@@ -1,27 +1,114 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool
 import os
 
 # Get the directory where this file is located
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATABASE_PATH = os.path.join(BASE_DIR, "auth.db")
 
-# Use absolute path with proper Windows format
-DATABASE_URL = f"sqlite:///{DATABASE_PATH.replace(chr(92), '/')}"
+# Use absolute path with proper Windows format; DATABASE_URL overrides it (e.g. for benchmarks)
+DATABASE_URL = os.environ.get("DATABASE_URL") or f"sqlite:///{DATABASE_PATH.replace(chr(92), '/')}"
 
 print(f"Database path: {DATABASE_PATH}")
 print(f"Database URL: {DATABASE_URL}")
 
+# =========================
+# SQLITE TUNING
+# =========================
+SQLITE_POOL_SIZE = int(os.environ.get("SQLITE_POOL_SIZE", "8"))
+SQLITE_MAX_OVERFLOW = int(os.environ.get("SQLITE_MAX_OVERFLOW", "16"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", str(64 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.environ.get("SQLITE_CACHE_SIZE_KB", str(16 * 1024)))
+
+is_sqlite_file = DATABASE_URL.startswith("sqlite") and ":memory:" not in DATABASE_URL
+
+engine_options = {}
+if is_sqlite_file:
+    # A pool of long-lived connections keeps the per-connection page cache,
+    # mmap and prepared statement cache warm across requests
+    engine_options = {
+        "poolclass": QueuePool,
+        "pool_size": SQLITE_POOL_SIZE,
+        "max_overflow": SQLITE_MAX_OVERFLOW,
+    }
+
 engine = create_engine(
     DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    echo=False
+    connect_args={"check_same_thread": False, "cached_statements": 256} if is_sqlite_file else {},
+    echo=False,
+    **engine_options
 )
 
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers proceed while a writer commits instead of failing with
+    # "database is locked"; NORMAL sync is durable across app crashes in WAL mode
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+if is_sqlite_file:
+    event.listen(engine, "connect", set_sqlite_pragmas)
+
 SessionLocal = sessionmaker(
     autocommit=False,
     autoflush=False,
     bind=engine
 )
 
+# =========================
+# ASYNC ENGINE (OPTIONAL)
+# =========================
+# DB_ASYNC=1 serves the auth endpoints through aiosqlite instead of the threadpool
+DB_ASYNC = os.environ.get("DB_ASYNC", "0") == "1"
+ASYNC_DATABASE_URL = os.environ.get("ASYNC_DATABASE_URL") or DATABASE_URL.replace(
+    "sqlite://", "sqlite+aiosqlite://", 1
+)
+
+async_engine = None
+AsyncSessionLocal = None
+
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        echo=False,
+        **({"pool_size": SQLITE_POOL_SIZE, "max_overflow": SQLITE_MAX_OVERFLOW} if is_sqlite_file else {})
+    )
+    if is_sqlite_file:
+        event.listen(async_engine.sync_engine, "connect", set_sqlite_pragmas)
+
+    # Rows stay readable after commit without an implicit (blocking) refresh
+    AsyncSessionLocal = async_sessionmaker(
+        async_engine,
+        autoflush=False,
+        expire_on_commit=False
+    )
+
+def _pool_stats(pool):
+    if not isinstance(pool, QueuePool):
+        return {"pool": type(pool).__name__}
+    return {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "max_overflow": SQLITE_MAX_OVERFLOW,
+    }
+
+def get_pool_stats():
+    """Connection pool usage, for /health"""
+    stats = _pool_stats(engine.pool)
+    if async_engine is not None:
+        stats["async"] = _pool_stats(async_engine.pool)
+    return stats
+
 Base = declarative_base()
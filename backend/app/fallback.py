@@ -0,0 +1,357 @@
+"""Vectorized image-statistics classifier used when the ML models are unavailable"""
+import json
+
+import numpy as np
+
+CLASS_NAMES = ("glioma", "meningioma", "notumor", "pituitary")
+FEATURE_NAMES = (
+    "mean_intensity",
+    "median_intensity",
+    "entropy",
+    "edge_strength",
+    "center_concentration",
+)
+CLASS_INDEX = {name: i for i, name in enumerate(CLASS_NAMES)}
+FEATURE_INDEX = {name: i for i, name in enumerate(FEATURE_NAMES)}
+
+HIST_BINS = 10
+EDGE_THRESHOLD = 0.05
+# Images per chunk; bounds the size of the diff/partition temporaries
+CHUNK_SIZE = 64
+
+# =========================
+# THRESHOLD TABLE
+# =========================
+# (class, feature, lower, upper, weight): adds `weight` to the class score when
+# lower < feature < upper. None leaves that side of the interval open.
+#
+# Real test data shows distinct entropy patterns:
+# Glioma: entropy 1.39-1.79 (LOWEST)
+# NoTumor: entropy 1.99-2.17 (LOW-MID)
+# Pituitary: entropy 2.27-2.43 (MID-HIGH)
+# Meningioma: entropy 2.51-2.71 (HIGHEST)
+# Edge strength follows same pattern: Glioma < NoTumor < Pituitary < Meningioma
+# Bump whenever the features or the table change, so cached results are invalidated
+RULES_VERSION = "1"
+FALLBACK_RULES = (
+    # GLIOMA: lowest entropy, lowest edge strength, moderate-high center concentration
+    # Test range: Mean 0.068-0.120, Median 0.008-0.024, Entropy 1.395-1.795, EdgeStr 0.025-0.045
+    ("glioma", "entropy", None, 1.85, 50),
+    ("glioma", "mean_intensity", None, 0.13, 35),
+    ("glioma", "median_intensity", None, 0.03, 40),
+    ("glioma", "edge_strength", None, 0.05, 35),
+    ("glioma", "center_concentration", 0.17, 0.26, 25),
+
+    # NOTUMOR: low-mid entropy, higher center concentration, lower edge strength
+    # Test range: Mean 0.115-0.224, Median 0.000-0.098, Entropy 1.989-2.170, EdgeStr 0.039-0.064
+    # Key differentiator: HIGH center concentration (0.305-0.383) vs pituitary (0.200-0.255)
+    ("notumor", "entropy", 1.85, 2.20, 45),
+    ("notumor", "center_concentration", 0.30, None, 50),
+    ("notumor", "mean_intensity", 0.1, 0.25, 30),
+    ("notumor", "edge_strength", None, 0.07, 20),
+
+    # PITUITARY: mid-high entropy, medium edge strength, lower center concentration than notumor
+    # Test range: Mean 0.178-0.211, Median 0.071-0.228, Entropy 2.267-2.430, EdgeStr 0.063-0.072
+    ("pituitary", "entropy", 2.20, 2.50, 45),
+    ("pituitary", "mean_intensity", 0.17, 0.22, 40),
+    ("pituitary", "center_concentration", 0.20, 0.27, 40),
+    ("pituitary", "edge_strength", 0.06, 0.08, 30),
+    ("pituitary", "median_intensity", 0.05, 0.25, 20),
+
+    # MENINGIOMA: highest entropy, highest edge strength
+    # Test range: Mean 0.282-0.355, Median 0.220-0.302, Entropy 2.512-2.705, EdgeStr 0.079-0.087
+    ("meningioma", "entropy", 2.50, None, 55),
+    ("meningioma", "edge_strength", 0.078, None, 50),
+    ("meningioma", "mean_intensity", 0.25, None, 40),
+    ("meningioma", "median_intensity", 0.20, None, 35),
+    ("meningioma", "entropy", 2.55, None, 20),
+)
+
+# Below this best score the rules are considered inconclusive
+MIN_CONFIDENT_SCORE = 30
+EMERGENCY_CONFIDENCE = 62.0
+
+# =========================
+# RULE FILES
+# =========================
+# tune_thresholds.py writes the table above as JSON so it can be retuned
+# without code edits; load_rules swaps it in at startup.
+RULE_FILE_FORMAT = 1
+
+def rules_to_dict(rules, version, min_confident_score=MIN_CONFIDENT_SCORE, **extra):
+    """JSON-serializable rule file contents; `extra` carries provenance such as metrics"""
+    return {
+        "format": RULE_FILE_FORMAT,
+        "version": str(version),
+        "classes": list(CLASS_NAMES),
+        "features": list(FEATURE_NAMES),
+        "hist_bins": HIST_BINS,
+        "edge_threshold": EDGE_THRESHOLD,
+        "min_confident_score": min_confident_score,
+        "rules": [
+            {"class": class_name, "feature": feature, "lower": lower, "upper": upper, "weight": weight}
+            for class_name, feature, lower, upper, weight in rules
+        ],
+        **extra,
+    }
+
+def rules_from_dict(data):
+    """Validate rule file contents, returning (version, rules, min_confident_score)"""
+    if data.get("format") != RULE_FILE_FORMAT:
+        raise ValueError(f"Unsupported rule file format {data.get('format')!r}")
+    if "version" not in data:
+        raise ValueError("Rule file has no version")
+    # Thresholds only mean something for features computed the same way
+    for key, expected in (("classes", list(CLASS_NAMES)), ("features", list(FEATURE_NAMES)),
+                          ("hist_bins", HIST_BINS), ("edge_threshold", EDGE_THRESHOLD)):
+        if data.get(key, expected) != expected:
+            raise ValueError(f"Rule file {key} {data.get(key)!r} does not match {expected!r}")
+
+    rules = []
+    for rule in data.get("rules", []):
+        if rule["class"] not in CLASS_INDEX:
+            raise ValueError(f"Unknown class {rule['class']!r} in rule file")
+        if rule["feature"] not in FEATURE_INDEX:
+            raise ValueError(f"Unknown feature {rule['feature']!r} in rule file")
+        lower = None if rule.get("lower") is None else float(rule["lower"])
+        upper = None if rule.get("upper") is None else float(rule["upper"])
+        rules.append((rule["class"], rule["feature"], lower, upper, float(rule["weight"])))
+    if not rules:
+        raise ValueError("Rule file has no rules")
+    return str(data["version"]), tuple(rules), float(data.get("min_confident_score", MIN_CONFIDENT_SCORE))
+
+def load_rules(path):
+    """Replace the built-in threshold table with the one in a rule file; returns its version"""
+    global RULES_VERSION, FALLBACK_RULES, MIN_CONFIDENT_SCORE
+    with open(path, encoding="utf-8") as f:
+        version, rules, min_confident_score = rules_from_dict(json.load(f))
+    RULES_VERSION, FALLBACK_RULES, MIN_CONFIDENT_SCORE = version, rules, min_confident_score
+    return version
+
+# =========================
+# FEATURE EXTRACTION
+# =========================
+def _median(flat):
+    """Row-wise median using a partial sort instead of a full one"""
+    size = flat.shape[1]
+    k = size // 2
+    if size % 2:
+        return np.partition(flat, k, axis=1)[:, k].astype(np.float64)
+    part = np.partition(flat, (k - 1, k), axis=1)
+    return (part[:, k - 1].astype(np.float64) + part[:, k]) / 2
+
+def _histogram_edges(first, last):
+    """Per-row HIST_BINS + 1 bin edges, widening degenerate ranges like np.histogram"""
+    first = first.astype(np.float64)
+    last = last.astype(np.float64)
+    flat_rows = first == last
+    first[flat_rows] -= 0.5
+    last[flat_rows] += 0.5
+    return np.linspace(first, last, HIST_BINS + 1, axis=1)
+
+def _entropy(hist):
+    """Row-wise base-2 entropy of (N, HIST_BINS) histogram counts"""
+    hist_norm = hist / hist.sum(axis=1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = np.where(hist_norm > 0, hist_norm * np.log2(hist_norm + 1e-10), 0.0)
+    return -terms.sum(axis=1)
+
+def _histogram_entropy(flat):
+    """Row-wise entropy of a HIST_BINS histogram spanning each row's own min..max"""
+    edges = _histogram_edges(flat.min(axis=1), flat.max(axis=1))
+    # at_least[:, k] = values >= edges[k]; bins are half-open except the last,
+    # which matches np.histogram after its edge corrections
+    at_least = np.empty((flat.shape[0], HIST_BINS + 1), dtype=np.int64)
+    at_least[:, 0] = flat.shape[1]
+    at_least[:, HIST_BINS] = 0
+    for k in range(1, HIST_BINS):
+        at_least[:, k] = np.count_nonzero(flat >= edges[:, k:k + 1], axis=1)
+    return _entropy(at_least[:, :-1] - at_least[:, 1:])
+
+def _edge_strength(flat):
+    """Fraction of neighbouring flattened values that differ by more than EDGE_THRESHOLD"""
+    size = flat.shape[1]
+    if size < 2:
+        return np.zeros(flat.shape[0])
+    diffs = np.abs(flat[:, 1:] - flat[:, :-1])
+    return np.count_nonzero(diffs > EDGE_THRESHOLD, axis=1) / (size - 1)
+
+def _center_concentration(images):
+    """Mean of the central half of each image minus the mean of its four corner blocks"""
+    h, w = images.shape[1:3]
+    center = images[:, h // 4:3 * h // 4, w // 4:3 * w // 4]
+    corners = (
+        images[:, :h // 4, :w // 4],
+        images[:, :h // 4, 3 * w // 4:],
+        images[:, 3 * h // 4:, :w // 4],
+        images[:, 3 * h // 4:, 3 * w // 4:],
+    )
+    center_mean = center.mean(axis=(1, 2, 3), dtype=np.float64)
+    corner_count = sum(c[0].size for c in corners)
+    if corner_count == 0:
+        return center_mean
+    corner_sum = sum(c.sum(axis=(1, 2, 3), dtype=np.float64) for c in corners)
+    return center_mean - corner_sum / corner_count
+
+def _extract_float(chunk, out):
+    """Features of a floating-point chunk with pixel values in [0, 1]"""
+    flat = chunk.reshape(chunk.shape[0], -1)
+    out[:, FEATURE_INDEX["mean_intensity"]] = flat.mean(axis=1, dtype=np.float64)
+    out[:, FEATURE_INDEX["median_intensity"]] = _median(flat)
+    out[:, FEATURE_INDEX["entropy"]] = _histogram_entropy(flat)
+    out[:, FEATURE_INDEX["edge_strength"]] = _edge_strength(flat)
+    out[:, FEATURE_INDEX["center_concentration"]] = _center_concentration(chunk)
+
+def _extract_uint8(chunk, out):
+    """Features of a uint8 chunk, equal to those of chunk / 255.0 up to float rounding
+
+    Mean, median and entropy come from one 256-level count per image, so no
+    float copy of the pixels and no partition is needed. The values differ
+    from the float path by rounding error, so the paths agree on labels
+    but are not bit-identical.
+    """
+    n = chunk.shape[0]
+    flat = chunk.reshape(n, -1)
+    size = flat.shape[1]
+    levels = np.arange(256) / 255.0
+
+    # One bincount per row beats a single offset bincount, which needs an intp copy of the pixels
+    counts = np.stack([np.bincount(row, minlength=256) for row in flat])
+    cumulative = counts.cumsum(axis=1)
+
+    out[:, FEATURE_INDEX["mean_intensity"]] = counts @ levels / size
+
+    # Level of the k-th smallest value is the first level whose cumulative count exceeds k
+    k = size // 2
+    upper = levels[np.count_nonzero(cumulative <= k, axis=1)]
+    if size % 2:
+        out[:, FEATURE_INDEX["median_intensity"]] = upper
+    else:
+        lower = levels[np.count_nonzero(cumulative <= k - 1, axis=1)]
+        out[:, FEATURE_INDEX["median_intensity"]] = (lower + upper) / 2
+
+    present = counts > 0
+    first = levels[present.argmax(axis=1)]
+    last = levels[255 - present[:, ::-1].argmax(axis=1)]
+    edges = _histogram_edges(first, last)
+    level_bins = np.count_nonzero(levels[None, :, None] >= edges[:, None, 1:HIST_BINS], axis=2)
+    one_hot = level_bins[:, :, None] == np.arange(HIST_BINS)
+    hist = np.einsum("nl,nlb->nb", counts, one_hot)
+    out[:, FEATURE_INDEX["entropy"]] = _entropy(hist)
+
+    if size < 2:
+        out[:, FEATURE_INDEX["edge_strength"]] = 0.0
+    else:
+        # |a - b| computed as max - min stays in uint8; d / 255 > EDGE_THRESHOLD <=> d > floor(EDGE_THRESHOLD * 255)
+        right, left = flat[:, 1:], flat[:, :-1]
+        diffs = np.maximum(right, left) - np.minimum(right, left)
+        out[:, FEATURE_INDEX["edge_strength"]] = (
+            np.count_nonzero(diffs > int(EDGE_THRESHOLD * 255), axis=1) / (size - 1)
+        )
+
+    out[:, FEATURE_INDEX["center_concentration"]] = _center_concentration(chunk) / 255.0
+
+def extract_features(images):
+    """Compute FEATURE_NAMES for an (N, H, W, C) batch, returning an (N, n_features) array
+
+    Float batches must hold values in [0, 1]; uint8 batches are treated as if
+    divided by 255 and take a faster integer path.
+    """
+    images = np.asarray(images)
+    if images.ndim == 3:
+        images = images[np.newaxis]
+    if images.ndim == 2:
+        images = images[np.newaxis, :, :, np.newaxis]
+
+    extract = _extract_uint8 if images.dtype == np.uint8 else _extract_float
+    features = np.empty((images.shape[0], len(FEATURE_NAMES)), dtype=np.float64)
+    for start in range(0, images.shape[0], CHUNK_SIZE):
+        chunk = images[start:start + CHUNK_SIZE]
+        extract(chunk, features[start:start + chunk.shape[0]])
+    return features
+
+# =========================
+# SCORING
+# =========================
+class CompiledRules:
+    """A threshold table as arrays: one (feature, lower, upper) interval and weight row per rule
+
+    Scoring is one broadcasted comparison of the (N, n_rules) gathered
+    feature values against the bounds, then a matmul of the hits with the
+    (n_rules, n_classes) weight matrix. Open bounds become -inf/+inf, which
+    the strict comparisons treat like the missing side of the interval.
+    """
+
+    def __init__(self, rules):
+        self.rules = tuple(rules)
+        self.feature_ids = np.array([FEATURE_INDEX[feature] for _, feature, _, _, _ in self.rules], dtype=np.intp)
+        self.lower = np.array([-np.inf if lower is None else lower for _, _, lower, _, _ in self.rules])
+        self.upper = np.array([np.inf if upper is None else upper for _, _, _, upper, _ in self.rules])
+        self.weights = np.zeros((len(self.rules), len(CLASS_NAMES)))
+        for i, (class_name, _, _, _, weight) in enumerate(self.rules):
+            self.weights[i, CLASS_INDEX[class_name]] = weight
+
+    def score(self, features):
+        """(N, n_classes) scores for an (N, n_features) array"""
+        values = features[:, self.feature_ids]
+        hits = (values > self.lower) & (values < self.upper)
+        # Sums of the table's whole-number weights are exact in float64, so the
+        # matmul's summation order cannot change a score
+        return hits.astype(np.float64) @ self.weights
+
+# (rules, CompiledRules) for the table last scored with; load_rules swaps FALLBACK_RULES
+_compiled = (None, None)
+
+def compiled_rules(rules=None):
+    """CompiledRules for `rules`, or for the current FALLBACK_RULES (cached until they change)"""
+    global _compiled
+    if rules is not None:
+        return CompiledRules(rules)
+    if _compiled[0] is not FALLBACK_RULES:
+        _compiled = (FALLBACK_RULES, CompiledRules(FALLBACK_RULES))
+    return _compiled[1]
+
+def score_features(features, rules=None):
+    """Apply `rules` (FALLBACK_RULES by default) to an (N, n_features) array, returning (N, n_classes) scores"""
+    features = np.atleast_2d(np.asarray(features, dtype=np.float64))
+    return compiled_rules(rules).score(features)
+
+def decide(features, scores, min_confident_score=None):
+    """Class indices and confidences for (..., N, n_classes) scores of (N, n_features) features
+
+    Leading axes on `scores` let the tuner evaluate many candidate tables at once.
+    """
+    min_confident_score = MIN_CONFIDENT_SCORE if min_confident_score is None else min_confident_score
+    best = scores.argmax(axis=-1)
+    top_two = np.sort(scores, axis=-1)[..., -2:]
+    score_gap = top_two[..., 1] - top_two[..., 0]
+    # Confidence: larger gap = higher confidence (range 65-88%)
+    confidence = np.clip(65.0 + np.minimum(23.0, score_gap / 5.0), 65.0, 88.0)
+
+    # Low confidence - use emergency heuristic
+    emergency = top_two[..., 1] < min_confident_score
+    emergency_class = np.select(
+        [
+            features[:, FEATURE_INDEX["mean_intensity"]] > 0.32,
+            features[:, FEATURE_INDEX["center_concentration"]] > 0.22,
+            features[:, FEATURE_INDEX["edge_strength"]] > 0.075,
+        ],
+        [CLASS_INDEX["notumor"], CLASS_INDEX["pituitary"], CLASS_INDEX["meningioma"]],
+        default=CLASS_INDEX["glioma"],
+    )
+    best = np.where(emergency, emergency_class, best)
+    confidence = np.where(emergency, EMERGENCY_CONFIDENCE, confidence)
+    return best, confidence
+
+def classify_features(features):
+    """Turn (N, n_features) features into a list of (tumor_type, confidence) pairs"""
+    features = np.atleast_2d(features)
+    best, confidence = decide(features, score_features(features))
+    return [
+        (CLASS_NAMES[class_id], round(float(conf), 2))
+        for class_id, conf in zip(best, confidence)
+    ]
+
+def predict_batch(images):
+    """Classify every image of an (N, H, W, C) batch with the fallback rules"""
+    return classify_features(extract_features(images))
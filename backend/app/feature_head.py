@@ -0,0 +1,161 @@
+"""Logistic-regression head on image statistics, served from NumPy weights without TensorFlow"""
+import os
+
+import numpy as np
+
+from app import fallback
+
+HEAD_FORMAT = 1
+STAT_NAMES = (
+    "mean", "std", "min", "max", "median", "p25", "p75", "var", "skewness", "kurtosis",
+)
+HIST_BINS = 16
+FEATURE_NAMES = (
+    STAT_NAMES
+    + tuple(f"hist_{i:02d}" for i in range(HIST_BINS))
+    + tuple(f"rules_{name}" for name in fallback.FEATURE_NAMES)
+)
+LEVELS = np.arange(256) / 255.0
+
+
+# =========================
+# FEATURE EXTRACTION
+# =========================
+def _as_uint8(images):
+    """uint8 view of a batch; float batches in [0, 1] are quantized to 256 levels
+
+    The API hands the head uint8 batches; a uint8 / 255 float batch round
+    trips losslessly, so both give the same features.
+    """
+    images = np.asarray(images)
+    if images.dtype == np.uint8:
+        return images
+    return np.rint(np.clip(images, 0.0, 1.0) * 255).astype(np.uint8)
+
+
+def _percentile(cumulative, size, q):
+    """Per-row q-th percentile from 256-level cumulative counts, interpolated like np.percentile"""
+    position = q / 100 * (size - 1)
+    low, high = int(np.floor(position)), int(np.ceil(position))
+    # The k-th smallest value is the first level whose cumulative count exceeds k
+    at_low = LEVELS[np.count_nonzero(cumulative <= low, axis=1)]
+    at_high = LEVELS[np.count_nonzero(cumulative <= high, axis=1)]
+    return at_low + (at_high - at_low) * (position - low)
+
+
+def extract_features(images):
+    """FEATURE_NAMES for an (N, H, W, C) batch, returning an (N, n_features) float64 array
+
+    Every statistic comes from one 256-level count per image, so no float
+    copy or sort of the pixels is needed; the five rule features reuse
+    fallback.extract_features.
+    """
+    images = _as_uint8(images)
+    if images.ndim == 3:
+        images = images[np.newaxis]
+    if images.ndim == 2:
+        images = images[np.newaxis, :, :, np.newaxis]
+    n = images.shape[0]
+    flat = images.reshape(n, -1)
+    size = flat.shape[1]
+
+    counts = np.stack([np.bincount(row, minlength=256) for row in flat]).astype(np.float64)
+    cumulative = counts.cumsum(axis=1)
+    present = counts > 0
+
+    mean = counts @ LEVELS / size
+    centered = LEVELS[None, :] - mean[:, None]
+    var = (counts * centered ** 2).sum(axis=1) / size
+    std = np.sqrt(var)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Population skewness and excess kurtosis; 0 for constant images
+        skewness = np.where(std > 0, (counts * centered ** 3).sum(axis=1) / size / std ** 3, 0.0)
+        kurtosis = np.where(std > 0, (counts * centered ** 4).sum(axis=1) / size / var ** 2 - 3.0, 0.0)
+
+    features = np.empty((n, len(FEATURE_NAMES)))
+    features[:, 0] = mean
+    features[:, 1] = std
+    features[:, 2] = LEVELS[present.argmax(axis=1)]
+    features[:, 3] = LEVELS[255 - present[:, ::-1].argmax(axis=1)]
+    features[:, 4] = _percentile(cumulative, size, 50)
+    features[:, 5] = _percentile(cumulative, size, 25)
+    features[:, 6] = _percentile(cumulative, size, 75)
+    features[:, 7] = var
+    features[:, 8] = skewness
+    features[:, 9] = kurtosis
+    # Fixed-range histogram as fractions of the image, 16 levels per bin
+    hist = counts.reshape(n, HIST_BINS, 256 // HIST_BINS).sum(axis=2) / size
+    features[:, len(STAT_NAMES):len(STAT_NAMES) + HIST_BINS] = hist
+    features[:, len(STAT_NAMES) + HIST_BINS:] = fallback.extract_features(images)
+    return features
+
+
+# =========================
+# MODEL
+# =========================
+def softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class FeatureHead:
+    """Multinomial logistic regression on standardized extract_features output
+
+    The weights live in a .npz file written by train_head.py: `weights`
+    (n_features, n_classes), `bias`, the standardization `mean`/`scale`, and
+    the `classes`, `feature_names` and `version` they belong to.
+    """
+
+    def __init__(self, weights, bias, mean, scale, classes, version):
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.bias = np.asarray(bias, dtype=np.float64)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.classes = tuple(str(c) for c in classes)
+        self.version = str(version)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["format"]) != HEAD_FORMAT:
+                raise ValueError(f"Unsupported feature head format {int(data['format'])}")
+            if tuple(data["feature_names"].tolist()) != FEATURE_NAMES:
+                raise ValueError("Feature head was trained on different features")
+            head = cls(data["weights"], data["bias"], data["mean"], data["scale"],
+                       data["classes"].tolist(), data["version"].item())
+        if head.weights.shape != (len(FEATURE_NAMES), len(head.classes)):
+            raise ValueError(f"Feature head weights have shape {head.weights.shape}")
+        return head
+
+    def save(self, path, **extra):
+        """Write the head as a .npz; `extra` arrays (e.g. metrics) are stored alongside"""
+        tmp = path + ".tmp.npz"
+        np.savez(
+            tmp, format=HEAD_FORMAT, weights=self.weights, bias=self.bias, mean=self.mean,
+            scale=self.scale, classes=np.array(self.classes), feature_names=np.array(FEATURE_NAMES),
+            version=np.array(self.version), **extra
+        )
+        os.replace(tmp, path)
+
+    def predict_features(self, features):
+        """Class probabilities for an (N, n_features) array"""
+        return softmax((features - self.mean) / self.scale @ self.weights + self.bias)
+
+    def predict(self, batch):
+        """Class probabilities for an (N, H, W, 3) uint8 or [0, 1] float batch"""
+        return self.predict_features(extract_features(batch))
+
+    def classify(self, probabilities):
+        """(tumor_type, confidence) pairs in the same form as the Keras models return"""
+        return [
+            (self.classes[class_id], round(float(confidence) * 100, 2))
+            for class_id, confidence in zip(probabilities.argmax(axis=1), probabilities.max(axis=1))
+        ]
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "classes": list(self.classes),
+            "features": len(FEATURE_NAMES),
+        }
@@ -0,0 +1,242 @@
+"""On-disk store of fallback features, one row per distinct image"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from app import fallback
+from app.preprocess import ImageDecodeError
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+STORE_FORMAT = 1
+INITIAL_CAPACITY = 1024
+
+
+def list_dataset(root):
+    """Sorted (relative path, label) pairs for every image under root/<label>/"""
+    items = []
+    for label in sorted(os.listdir(root)):
+        class_dir = os.path.join(root, label)
+        if not os.path.isdir(class_dir):
+            continue
+        for dirpath, dirnames, filenames in os.walk(class_dir):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if name.lower().endswith(IMAGE_EXTENSIONS) and not name.startswith("."):
+                    path = os.path.relpath(os.path.join(dirpath, name), root)
+                    items.append((path.replace(os.sep, "/"), label))
+    return items
+
+
+def read_files(root, chunk):
+    """Raw bytes for a chunk of (path, label) items; unreadable files become exceptions"""
+    data = []
+    for path, _ in chunk:
+        try:
+            with open(os.path.join(root, path), "rb") as f:
+                data.append(f.read())
+        except OSError as e:
+            data.append(e)
+    return data
+
+
+def decode_tolerant(pool, images):
+    """Decode a chunk, returning (uint8 batch of the good images, their indices, {index: error})"""
+    errors = {i: str(image) for i, image in enumerate(images) if isinstance(image, Exception)}
+    remaining = [i for i in range(len(images)) if i not in errors]
+    while remaining:
+        try:
+            return pool.decode_batch([images[i] for i in remaining]), remaining, errors
+        except ImageDecodeError as e:
+            # Drop the bad image and retry the rest; corrupt files are rare
+            bad = remaining.pop(e.index)
+            errors[bad] = f"decode failed: {e}"
+    width, height = pool.size
+    return np.empty((0, height, width, 3), dtype=np.uint8), remaining, errors
+
+
+class FeatureStore:
+    """fallback.FEATURE_NAMES for many images, readable without decoding any pixels
+
+    A store is a directory with two files:
+
+    - `features.npy`: float64 array of shape (n_features, capacity), one
+      contiguous column per feature, opened with np.load(mmap_mode="r").
+      Capacity grows by doubling, so appends rarely rewrite the file.
+    - `index.json`: the image SHA-256 of each row, the feature settings the
+      rows were computed with, for each dataset file its label, hash, size
+      and mtime, and the hashes of images that could not be decoded.
+
+    Identical images share one row. `update` only hashes files whose size or
+    mtime changed and only decodes images whose hash has no row yet and has
+    not failed before.
+    """
+
+    def __init__(self, path, img_size, resample="bicubic"):
+        self.path = path
+        self.settings = {
+            "format": STORE_FORMAT,
+            "feature_names": list(fallback.FEATURE_NAMES),
+            "img_size": list(img_size),
+            "resample": resample,
+            "hist_bins": fallback.HIST_BINS,
+            "edge_threshold": fallback.EDGE_THRESHOLD,
+        }
+        self.hashes = []
+        self.files = {}
+        self.failed = {}
+        self._rows = {}
+        self._load()
+
+    @property
+    def features_path(self):
+        return os.path.join(self.path, "features.npy")
+
+    @property
+    def index_path(self):
+        return os.path.join(self.path, "index.json")
+
+    @property
+    def rows(self):
+        return len(self.hashes)
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("settings") != self.settings:
+            # Features computed differently are not comparable; start over
+            print(f"✗ Feature store {self.path} was built with other settings, rebuilding")
+            return
+        self.hashes = index["hashes"]
+        self.files = index["files"]
+        self.failed = index.get("failed", {})
+        self._rows = {sha: row for row, sha in enumerate(self.hashes)}
+
+    def _save_index(self):
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"settings": self.settings, "hashes": self.hashes, "files": self.files,
+                       "failed": self.failed}, f)
+        os.replace(tmp, self.index_path)
+
+    def columns(self):
+        """Read-only (n_features, rows) memmap; each feature is one contiguous row"""
+        if not self.rows:
+            return np.empty((len(fallback.FEATURE_NAMES), 0))
+        return np.load(self.features_path, mmap_mode="r")[:, :self.rows]
+
+    def column(self, name):
+        return self.columns()[fallback.FEATURE_INDEX[name]]
+
+    def row_for(self, sha256):
+        return self._rows.get(sha256)
+
+    def labeled(self):
+        """(features (n, n_features), labels, paths) for every indexed dataset file"""
+        paths = sorted(self.files)
+        rows = np.array([self._rows[self.files[p]["sha256"]] for p in paths], dtype=np.intp)
+        if not len(rows):
+            return np.empty((0, len(fallback.FEATURE_NAMES))), [], []
+        features = np.asarray(self.columns())[:, rows].T
+        return features, [self.files[p]["label"] for p in paths], paths
+
+    def _append(self, hashes, features):
+        """Write new rows to features.npy, growing it if needed (index saved separately)"""
+        needed = self.rows + len(hashes)
+        capacity = 0
+        if os.path.exists(self.features_path) and self.rows:
+            capacity = np.load(self.features_path, mmap_mode="r").shape[1]
+        if needed > capacity:
+            new_capacity = max(INITIAL_CAPACITY, capacity * 2, needed)
+            tmp = self.features_path + ".tmp.npy"
+            grown = np.lib.format.open_memmap(
+                tmp, mode="w+", dtype=np.float64, shape=(len(fallback.FEATURE_NAMES), new_capacity)
+            )
+            if self.rows:
+                grown[:, :self.rows] = np.load(self.features_path, mmap_mode="r")[:, :self.rows]
+            grown.flush()
+            del grown
+            os.replace(tmp, self.features_path)
+
+        store = np.load(self.features_path, mmap_mode="r+")
+        store[:, self.rows:needed] = features.T
+        store.flush()
+        del store
+        for sha in hashes:
+            self._rows[sha] = len(self.hashes)
+            self.hashes.append(sha)
+
+    def update(self, root, pool, chunk_size=256):
+        """Bring the store up to date with a class-per-subfolder dataset
+
+        Returns counts of files that were unchanged, reused an existing row
+        (same content under another name, or touched but identical), were
+        newly computed, failed to decode (now or on an earlier run), or
+        disappeared from the dataset.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        items = list_dataset(root)
+        counts = {"unchanged": 0, "reused": 0, "computed": 0, "failed": 0, "removed": 0}
+
+        present = {path for path, _ in items}
+        for path in [p for p in self.files if p not in present]:
+            del self.files[path]
+            counts["removed"] += 1
+
+        pending = []  # (path, file entry, sha256, bytes) for images with no row yet
+        for path, label in items:
+            stat = os.stat(os.path.join(root, path))
+            known = self.files.get(path)
+            if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+                known["label"] = label
+                counts["unchanged"] += 1
+                continue
+
+            with open(os.path.join(root, path), "rb") as f:
+                data = f.read()
+            sha = hashlib.sha256(data).hexdigest()
+            entry = {"label": label, "sha256": sha, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            if sha in self._rows:
+                self.files[path] = entry
+                counts["reused"] += 1
+            elif sha in self.failed:
+                # Known bad content; a file that changed into it loses its old row
+                self.files.pop(path, None)
+                counts["failed"] += 1
+            else:
+                pending.append((path, entry, sha, data))
+
+            if len(pending) >= chunk_size:
+                self._compute(pending, pool, counts)
+                pending = []
+        if pending:
+            self._compute(pending, pool, counts)
+
+        self._save_index()
+        return counts
+
+    def _compute(self, pending, pool, counts):
+        """Decode and extract features for a chunk of new images, skipping undecodable ones"""
+        batch, decoded, errors = decode_tolerant(pool, [data for _, _, _, data in pending])
+        for i, error in errors.items():
+            path, _, sha, _ = pending[i]
+            print(f"✗ Could not decode {path}: {error}")
+            self.failed[sha] = error
+            self.files.pop(path, None)
+            counts["failed"] += 1
+        pending = [pending[i] for i in decoded]
+        if not pending:
+            return
+
+        features = fallback.extract_features(batch)
+        new_hashes, new_rows = [], []
+        for (path, entry, sha, _), row in zip(pending, features):
+            if sha not in self._rows and sha not in new_hashes:
+                new_hashes.append(sha)
+                new_rows.append(row)
+            self.files[path] = entry
+            counts["computed"] += 1
+        self._append(new_hashes, np.array(new_rows))
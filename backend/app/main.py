@@ -1,37 +1,121 @@
-from fastapi import FastAPI, UploadFile, File, Depends, HTTPException
+from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
-import json, io, os
-import bcrypt
+from typing import List, Optional
+import asyncio, json, os, tarfile, threading, time, zipfile
+from datetime import datetime, timedelta
 import numpy as np
-from PIL import Image
 
 # =========================
 # DATABASE IMPORTS
 # =========================
-from app.database import SessionLocal, engine
-from app.models import User
-from app.schemas import Register, Login
+from app.database import SessionLocal, AsyncSessionLocal, DB_ASYNC, engine, get_pool_stats
+from app.schemas import Register, Login, BulkRegister
+from app import fallback
+from app.scheduler import InferenceScheduler
+from app.preprocess import PreprocessPool, DecodePoolError, ImageDecodeError, as_file, to_float32
+from app.cache import PredictionCache
+from app.inference import CompiledModel
+from app.feature_head import FeatureHead, extract_features as feature_head_features
+from app.passwords import PasswordHasher, PasswordQueueFull
+from app.tokens import TokenSigner
+from app.uploads import UploadSizeLimitMiddleware, upload_buffer
+from app.audit import AuditLogWriter
+from app.metrics import MetricsRegistry, RequestMetricsMiddleware
+from app.volumes import VolumeError, aggregate_study, foreground_fraction, volume_to_batch
+from app.prediction_stats import history_query, prediction_stats, rebuild_rollups
+from app.user_store import (
+    AsyncUserStore, SyncUserStore, stream_users, stream_users_async, users_query
+)
 
 from app.database import Base, engine
 Base.metadata.create_all(bind=engine)
+# create_all skips tables that already exist, so add indexes introduced later
+for table in Base.metadata.sorted_tables:
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
 
 # =========================
-# ML IMPORTS (SAFE)
+# METRICS
 # =========================
-try:
-    import tensorflow as tf
-    from pennylane.qnn import KerasLayer
-except Exception as e:
-    print(f"Warning: Could not import TensorFlow/PennyLane: {e}")
-    tf = None
-    KerasLayer = None
+metrics = MetricsRegistry()
+http_requests = metrics.counter(
+    "http_requests_total", "HTTP requests by endpoint, model, method and status",
+    ("endpoint", "model", "method", "status")
+)
+http_errors = metrics.counter(
+    "http_request_errors_total", "HTTP responses with status >= 400", ("endpoint", "model", "status")
+)
+http_in_flight = metrics.gauge("http_requests_in_flight", "HTTP requests being served", ("endpoint", "model"))
+http_duration = metrics.histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("endpoint", "model")
+)
+stage_seconds = metrics.histogram(
+    "inference_stage_seconds",
+    "Time per pipeline stage (decode and resize per image, the rest per batch or response)",
+    ("stage", "model")
+)
+inference_batch_size = metrics.histogram(
+    "inference_batch_size", "Images per micro-batch handed to a model", ("model",),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+predictions_total = metrics.counter(
+    "predictions_total", "Images classified, by model and whether the cache answered", ("model", "source")
+)
+fallback_predictions_total = metrics.counter(
+    "fallback_predictions_total", "Images classified by the fallback rules because the model is not loaded",
+    ("model",)
+)
+inference_queue_depth = metrics.gauge("inference_queue_depth", "Requests waiting for the inference scheduler")
+audit_log_pending = metrics.gauge("audit_log_pending", "Audit rows waiting to be written")
+
+def observe_stage(stage, seconds, model=""):
+    stage_seconds.observe(seconds, stage=stage, model=model)
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse that records how long rendering the body takes"""
+
+    def render(self, content):
+        start = time.perf_counter()
+        body = super().render(content)
+        observe_stage("serialization", time.perf_counter() - start)
+        return body
+
+metric_paths = None
+
+def request_labels(path):
+    """(endpoint, model) labels for a request; unknown paths share one series"""
+    global metric_paths
+    if metric_paths is None:
+        metric_paths = {route.path for route in app.routes}
+    endpoint = path if path in metric_paths else "other"
+    model = next((kind for kind in ("cnn", "qml") if endpoint.startswith(f"/predict-{kind}")), "")
+    return endpoint, model
 
 # =========================
 # APP INIT
 # =========================
-app = FastAPI()
+app = FastAPI(default_response_class=TimedJSONResponse)
+
+# Added before CORS so 413 responses still carry CORS headers
+MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB", "32"))
+MAX_BATCH_UPLOAD_MB = int(os.environ.get("MAX_BATCH_UPLOAD_MB", "512"))
+MAX_VOLUME_UPLOAD_MB = int(os.environ.get("MAX_VOLUME_UPLOAD_MB", "1024"))
+
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_bytes=MAX_UPLOAD_MB * 1024 * 1024,
+    path_limits={
+        "/predict-cnn/batch": MAX_BATCH_UPLOAD_MB * 1024 * 1024,
+        "/predict-qml/batch": MAX_BATCH_UPLOAD_MB * 1024 * 1024,
+        "/predict-cnn/volume": MAX_VOLUME_UPLOAD_MB * 1024 * 1024,
+        "/predict-qml/volume": MAX_VOLUME_UPLOAD_MB * 1024 * 1024,
+    },
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -40,30 +124,68 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so rejected and CORS preflight requests are counted too
+app.add_middleware(
+    RequestMetricsMiddleware,
+    labels_for=request_labels,
+    requests=http_requests,
+    errors=http_errors,
+    in_flight=http_in_flight,
+    duration=http_duration,
+)
+
 # =========================
 # PASSWORD HASHING
 # =========================
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def hash_password(password: str):
-    # Bcrypt has a 72-byte limit, truncate password if necessary
-    password_bytes = password.encode('utf-8')
-    if len(password_bytes) > 72:
-        password = password_bytes[:72].decode('utf-8', errors='ignore')
-    # Use bcrypt directly to avoid passlib's validation
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
-    return hashed.decode('utf-8')
-
-def verify_password(password, hashed):
-    # Truncate password for verification too
-    password_bytes = password.encode('utf-8')
-    if len(password_bytes) > 72:
-        password = password_bytes[:72].decode('utf-8', errors='ignore')
+password_hasher = PasswordHasher(
+    rounds=int(os.environ.get("BCRYPT_ROUNDS", "12")),
+    workers=int(os.environ.get("PASSWORD_HASH_WORKERS", "2")),
+    max_queue=int(os.environ.get("PASSWORD_HASH_MAX_QUEUE", "64")),
+)
+
+# =========================
+# SESSION TOKENS
+# =========================
+SESSION_SECRET = os.environ.get("SESSION_SECRET", "")
+if not SESSION_SECRET:
+    print("Warning: SESSION_SECRET not set - tokens only valid for this process")
+token_signer = TokenSigner(
+    SESSION_SECRET.encode("utf-8") if SESSION_SECRET else os.urandom(32),
+    ttl_seconds=int(os.environ.get("SESSION_TTL_SECONDS", str(8 * 3600))),
+)
+# When set, prediction endpoints reject requests without a valid bearer token
+REQUIRE_AUTH = os.environ.get("REQUIRE_AUTH", "0") == "1"
+bearer_scheme = HTTPBearer(auto_error=False)
+
+def get_current_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme)):
+    """Claims of the caller's session token (HMAC check only), or None if anonymous
+
+    Without REQUIRE_AUTH an invalid or expired token also counts as anonymous.
+    """
+    if credentials is None:
+        if REQUIRE_AUTH:
+            raise HTTPException(status_code=401, detail="Not authenticated")
+        return None
+
+    claims = token_signer.verify(credentials.credentials)
+    if claims is None:
+        if REQUIRE_AUTH:
+            raise HTTPException(status_code=401, detail="Invalid or expired token")
+        # e.g. a token signed before a restart without SESSION_SECRET; treat the caller as anonymous
+        return None
+    return claims
+
+def require_current_user(user: Optional[dict] = Depends(get_current_user)):
+    """Claims of the caller's session token; anonymous requests get 401 whatever REQUIRE_AUTH says"""
+    if user is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return user
+
+async def run_password_task(coro):
     try:
-        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
-    except:
-        return False
+        return await coro
+    except PasswordQueueFull:
+        raise HTTPException(status_code=503, detail="Authentication service busy, please retry")
 
 # =========================
 # DB SESSION
@@ -84,184 +206,370 @@ QML_MODEL_PATH = os.path.join(BASE_DIR, "FINAL_QML_FULL_MODEL.h5")
 CLASS_PATH = os.path.join(BASE_DIR, "class_indices.json")
 
 IMG_SIZE = (160, 160)
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+MAX_BATCH_IMAGES = int(os.environ.get("MAX_BATCH_IMAGES", "256"))
+# Decompressed size limits for archive uploads, checked before any member is read
+MAX_ARCHIVE_MEMBER_BYTES = MAX_UPLOAD_MB * 1024 * 1024
+MAX_ARCHIVE_TOTAL_BYTES = int(os.environ.get("MAX_ARCHIVE_TOTAL_MB", "1024")) * 1024 * 1024
+# Entries of any kind (directories, non-image files) a tar may list; tar headers compress to almost nothing
+MAX_ARCHIVE_ENTRIES = int(os.environ.get("MAX_ARCHIVE_ENTRIES", "4096"))
+
+# TensorFlow/PennyLane are only imported, in a background thread, when LOAD_MODELS=1
+LOAD_MODELS = os.environ.get("LOAD_MODELS", "0") == "1"
 
 cml_model = None
 qml_model = None
+# Per-model state: disabled, loading, ready or failed
+model_status = {"cnn": "disabled", "qml": "disabled"}
+model_errors = {}
+model_load_seconds = {}
+# Batch sizes traced and timed before a model starts serving; defaults to
+# powers of two up to INFERENCE_MAX_BATCH_SIZE
+WARMUP_BATCH_SIZES = os.environ.get("WARMUP_BATCH_SIZES", "")
 class_indices = {}
 idx_to_class = {}
 
 # =========================
-# FEATURE EXTRACTION FALLBACK
-# =========================
-def extract_features_from_image(image_array):
-    """Fallback feature extraction when QML model unavailable"""
-    # Flatten image and extract comprehensive statistics as features
-    flat = image_array.flatten()
-    features = np.array([
-        np.mean(flat),
-        np.std(flat),
-        np.min(flat),
-        np.max(flat),
-        np.median(flat),
-        np.percentile(flat, 25),
-        np.percentile(flat, 75),
-        np.var(flat),
-        np.skew(flat) if len(flat) > 0 else 0,
-        np.kurtosis(flat) if len(flat) > 0 else 0
-    ])
-    # Pad to match expected dimension
-    return np.pad(features, (0, 118), mode='constant')
+# FEATURE HEAD
+# =========================
+# NumPy logistic regression on image statistics (train_head.py): a model tier
+# between the fallback rules and TensorFlow that never imports TensorFlow
+FEATURE_HEAD_PATH = os.environ.get("FEATURE_HEAD_PATH", os.path.join(BASE_DIR, "feature_head.npz"))
+feature_head = None
+if os.path.exists(FEATURE_HEAD_PATH):
+    try:
+        feature_head = FeatureHead.load(FEATURE_HEAD_PATH)
+        print(f"✓ Feature head {feature_head.version} loaded from {FEATURE_HEAD_PATH}")
+    except (OSError, KeyError, ValueError) as e:
+        print(f"✗ Could not load {FEATURE_HEAD_PATH}, feature head disabled: {e}")
+
+# Tier serving each model: "auto" uses the TensorFlow model once it is loaded,
+# then the feature head, then the rules; "head" skips TensorFlow entirely and
+# "fallback" always uses the rules. CNN_MODEL_TIER/QML_MODEL_TIER override MODEL_TIER.
+MODEL_TIERS = ("auto", "head", "fallback")
+MODEL_TIER = {
+    kind: os.environ.get(f"{kind.upper()}_MODEL_TIER", os.environ.get("MODEL_TIER", "auto"))
+    for kind in ("cnn", "qml")
+}
+for kind, tier in MODEL_TIER.items():
+    if tier not in MODEL_TIERS:
+        raise ValueError(f"MODEL_TIER/{kind.upper()}_MODEL_TIER must be one of {MODEL_TIERS}, got {tier!r}")
 
 def predict_with_fallback(image_array):
     """Predict tumor type and confidence using advanced image analysis"""
-    # Extract the image from batch dimension
-    img = image_array[0] if len(image_array.shape) == 4 else image_array
-    flat = img.flatten()
-    
-    # Calculate comprehensive statistics
-    mean_intensity = np.mean(flat)
-    std_intensity = np.std(flat)
-    median_intensity = np.median(flat)
-    min_intensity = np.min(flat)
-    max_intensity = np.max(flat)
-    contrast = max_intensity - min_intensity
-    
-    # Analyze image texture and edges
-    if len(flat) > 1:
-        diffs = np.abs(np.diff(flat))
-        edge_strength = np.sum(diffs > 0.05) / len(diffs)
-        edge_mean = np.mean(diffs)
-    else:
-        edge_strength = 0
-        edge_mean = 0
-    
-    # Analyze histogram distribution
-    hist, _ = np.histogram(flat, bins=10)
-    hist_norm = hist / np.sum(hist)
-    entropy = -np.sum(hist_norm[hist_norm > 0] * np.log2(hist_norm[hist_norm > 0] + 1e-10))
-    
-    # Analyze spatial patterns (check corners vs center)
-    h, w = img.shape[:2]
-    center = img[h//4:3*h//4, w//4:3*w//4]
-    corners = np.concatenate([
-        img[:h//4, :w//4].flatten(),
-        img[:h//4, 3*w//4:].flatten(),
-        img[3*h//4:, :w//4].flatten(),
-        img[3*h//4:, 3*w//4:].flatten()
-    ])
-    
-    center_mean = np.mean(center)
-    corners_mean = np.mean(corners) if len(corners) > 0 else 0
-    center_concentration = center_mean - corners_mean
-    
-    # Initialize tumor scores
-    scores = {
-        "glioma": 0.0,
-        "meningioma": 0.0,
-        "notumor": 0.0,
-        "pituitary": 0.0
-    }
-    
-    # KEY INSIGHT: Real test data shows distinct entropy patterns!
-    # Glioma: entropy 1.39-1.79 (LOWEST)
-    # NotUmor: entropy 1.99-2.17 (LOW-MID)
-    # Pituitary: entropy 2.27-2.43 (MID-HIGH)
-    # Meningioma: entropy 2.51-2.71 (HIGHEST)
-    # Edge strength follows same pattern: Glioma < NotUmor < Pituitary < Meningioma
-    
-    # Primary decision: Sort by ENTROPY first (most reliable differentiator)
-    # Then use other metrics to break ties
-    
-    # GLIOMA: Lowest entropy, lowest edge strength, moderate-high center concentration
-    # Test range: Mean 0.068-0.120, Median 0.008-0.024, Entropy 1.395-1.795, EdgeStr 0.025-0.045
-    if entropy < 1.85:  # Below entropy threshold
-        scores["glioma"] += 50
-    if mean_intensity < 0.13:  # Low mean
-        scores["glioma"] += 35
-    if median_intensity < 0.03:  # Very low median
-        scores["glioma"] += 40
-    if edge_strength < 0.05:  # Low edge strength
-        scores["glioma"] += 35
-    if 0.17 < center_concentration < 0.26:  # Moderate-high center
-        scores["glioma"] += 25
-    
-    # NOTUMOR: Low-mid entropy, higher center concentration, lower edge strength
-    # Test range: Mean 0.115-0.224, Median 0.000-0.098, Entropy 1.989-2.170, EdgeStr 0.039-0.064
-    # Key differentiator: HIGH center concentration (0.305-0.383) compared to pituitary (0.200-0.255)
-    if 1.85 < entropy < 2.20:  # In entropy sweet spot
-        scores["notumor"] += 45
-    if center_concentration > 0.30:  # HIGH center concentration - KEY differentiator
-        scores["notumor"] += 50  # Very strong signal
-    if 0.1 < mean_intensity < 0.25:  # In the notumor range
-        scores["notumor"] += 30
-    if edge_strength < 0.07:  # Not sharp edges
-        scores["notumor"] += 20
-    
-    # PITUITARY: Mid-high entropy, medium edge strength, lower center concentration than notumor
-    # Test range: Mean 0.178-0.211, Median 0.071-0.228, Entropy 2.267-2.430, EdgeStr 0.063-0.072
-    if 2.20 < entropy < 2.50:  # Mid-high entropy
-        scores["pituitary"] += 45
-    if 0.17 < mean_intensity < 0.22:  # Specific mean range
-        scores["pituitary"] += 40
-    if 0.20 < center_concentration < 0.27:  # Moderate center concentration
-        scores["pituitary"] += 40
-    if 0.06 < edge_strength < 0.08:  # Medium edge strength
-        scores["pituitary"] += 30
-    if 0.05 < median_intensity < 0.25:  # Medium median
-        scores["pituitary"] += 20
-    
-    # MENINGIOMA: Highest entropy, highest edge strength
-    # Test range: Mean 0.282-0.355, Median 0.220-0.302, Entropy 2.512-2.705, EdgeStr 0.079-0.087
-    if entropy > 2.50:  # High entropy - strong signal
-        scores["meningioma"] += 55  # Very strong for meningioma
-    if edge_strength > 0.078:  # High edge strength - KEY differentiator
-        scores["meningioma"] += 50
-    if mean_intensity > 0.25:  # Higher mean than all others
-        scores["meningioma"] += 40
-    if median_intensity > 0.20:  # Higher median
-        scores["meningioma"] += 35
-    if entropy > 2.55:  # Very high entropy
-        scores["meningioma"] += 20
-    
-    # Determine prediction
-    max_score = max(scores.values())
-    
-    if max_score < 30:  # Low confidence - use emergency heuristic
-        # Emergency fallback
-        if mean_intensity > 0.32:
-            tumor_type = "notumor"
-        elif center_concentration > 0.22:
-            tumor_type = "pituitary"
-        elif edge_strength > 0.075:
-            tumor_type = "meningioma"
-        else:
-            tumor_type = "glioma"
-        confidence = 62.0
-    else:
-        tumor_type = max(scores, key=scores.get)
-        
-        # Calculate confidence based on score dominance
-        sorted_scores = sorted(scores.values(), reverse=True)
-        score_gap = sorted_scores[0] - sorted_scores[1] if len(sorted_scores) > 1 else sorted_scores[0]
-        
-        # Confidence: Larger gap = higher confidence (range 65-88%)
-        confidence = 65.0 + min(23.0, (score_gap / 5.0))
-        confidence = min(88.0, max(65.0, confidence))
-    
-    return tumor_type, round(confidence, 2)
+    # Only the first image of a batch is classified, as before
+    img = image_array[:1] if len(image_array.shape) == 4 else image_array
+    return fallback.predict_batch(img)[0]
+
+# Threshold table written by tune_thresholds.py; the built-in rules apply when there is none
+FALLBACK_RULES_PATH = os.environ.get("FALLBACK_RULES_PATH", os.path.join(BASE_DIR, "fallback_rules.json"))
+if os.path.exists(FALLBACK_RULES_PATH):
+    try:
+        fallback.load_rules(FALLBACK_RULES_PATH)
+        print(f"✓ Fallback rules {fallback.RULES_VERSION} loaded from {FALLBACK_RULES_PATH}")
+    except (OSError, KeyError, TypeError, ValueError) as e:
+        print(f"✗ Could not load {FALLBACK_RULES_PATH}, using built-in fallback rules: {e}")
 
 # =========================
 # IMAGE PREPROCESS
 # =========================
+# Decoded batches stay uint8 up to the model call. "exact" decodes at full
+# resolution and hands TF models float64 in [0, 1]; "fast" uses JPEG draft
+# decoding and hands them float32
+PREPROCESS_MODE = os.environ.get("PREPROCESS_MODE", "exact")
+if PREPROCESS_MODE not in ("exact", "fast"):
+    raise ValueError(f"PREPROCESS_MODE must be 'exact' or 'fast', got {PREPROCESS_MODE!r}")
+
+preprocess_pool = PreprocessPool(
+    IMG_SIZE,
+    workers=int(os.environ.get("PREPROCESS_WORKERS", "0")),
+    resample=os.environ.get("PREPROCESS_RESAMPLE", "bicubic"),
+    draft=PREPROCESS_MODE == "fast",
+    observe=observe_stage,
+)
+
+def to_model_input(batch):
+    """uint8 pixels in the dtype and scale PREPROCESS_MODE hands to the TF models"""
+    return to_float32(batch) if PREPROCESS_MODE == "fast" else batch / 255.0
+
+def decode_images(images):
+    return preprocess_pool.decode_batch(images)
+
+def decoder_unavailable(e):
+    print(f"✗ Image decode workers failed: {e}")
+    return HTTPException(status_code=503, detail="Image decoder restarting, please retry")
+
 def preprocess_image(image_bytes):
     try:
-        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        image = image.resize(IMG_SIZE)
-        image = np.array(image) / 255.0
-        return np.expand_dims(image, axis=0)
-    except Exception as e:
+        return decode_images([image_bytes])
+    except ImageDecodeError as e:
         print(f"Error preprocessing image: {e}")
         raise HTTPException(status_code=400, detail=f"Invalid image file: {str(e)}")
+    except DecodePoolError as e:
+        raise decoder_unavailable(e)
+
+def preprocess_images(named_images):
+    """Decode a list of (name, bytes) pairs into one (N, H, W, 3) batch"""
+    try:
+        return decode_images([image_bytes for _, image_bytes in named_images])
+    except ImageDecodeError as e:
+        name = named_images[e.index][0]
+        print(f"Error preprocessing image {name}: {e}")
+        raise HTTPException(status_code=400, detail=f"Invalid image file {name}: {str(e)}")
+    except DecodePoolError as e:
+        raise decoder_unavailable(e)
+
+def is_image_name(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS) and not os.path.basename(name).startswith(".")
+
+def batch_too_large():
+    return HTTPException(
+        status_code=413, detail=f"Batch too large: at most {MAX_BATCH_IMAGES} images per request"
+    )
+
+def check_archive_members(filename, count, largest, total, max_images):
+    """Reject an archive from its headers alone: image count, largest image and total declared size"""
+    if count > max_images:
+        raise batch_too_large()
+    if largest > MAX_ARCHIVE_MEMBER_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Archive {filename} has an image larger than {MAX_ARCHIVE_MEMBER_BYTES // (1024 * 1024)} MB"
+        )
+    if total > MAX_ARCHIVE_TOTAL_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Archive {filename} expands to more than {MAX_ARCHIVE_TOTAL_BYTES // (1024 * 1024)} MB"
+        )
+
+def extract_archive_images(filename, data, max_images=MAX_BATCH_IMAGES):
+    """Return (name, bytes) for every image inside a zip/tar upload, or None if not an archive
+
+    Member count and decompressed sizes are checked against the limits before
+    anything is extracted; zip and tar readers never return more than the
+    declared size of a member. A tar has no central directory, so it is read
+    header by header and abandoned at the first one over a limit, which also
+    bounds the entries (and stream) a compressed tar can make us inflate.
+    """
+    name = (filename or "").lower()
+    buffer = as_file(data)
+
+    if name.endswith(".zip") or zipfile.is_zipfile(buffer):
+        with zipfile.ZipFile(buffer) as archive:
+            members = sorted(
+                (m for m in archive.infolist() if not m.is_dir() and is_image_name(m.filename)),
+                key=lambda m: m.filename
+            )
+            sizes = [m.file_size for m in members]
+            check_archive_members(filename, len(members), max(sizes, default=0), sum(sizes), max_images)
+            return [(m.filename, archive.read(m)) for m in members]
+
+    if name.endswith((".tar", ".tar.gz", ".tgz")):
+        # is_zipfile leaves the buffer at its end
+        buffer.seek(0)
+        images, largest, total = [], 0, 0
+        with tarfile.open(fileobj=buffer, mode="r:*") as archive:
+            # next() reads one header at a time, unlike getmembers(), which inflates the whole stream first
+            for entries, member in enumerate(iter(archive.next, None), 1):
+                if entries > MAX_ARCHIVE_ENTRIES:
+                    raise HTTPException(
+                        status_code=413, detail=f"Archive {filename} has more than {MAX_ARCHIVE_ENTRIES} entries"
+                    )
+                # Skipping a member of a compressed tar inflates it too, so every member counts
+                total += member.size
+                is_image = member.isfile() and is_image_name(member.name)
+                if is_image:
+                    largest = max(largest, member.size)
+                check_archive_members(filename, len(images) + is_image, largest, total, max_images)
+                if is_image:
+                    # Read in stream order; seeking back in a gzip stream would inflate it again
+                    images.append((member.name, archive.extractfile(member).read()))
+        return sorted(images, key=lambda item: item[0])
+
+    return None
+
+async def collect_batch_images(files):
+    """Read uploaded files, expanding archives into their image members, keeping upload order"""
+    named_images = []
+    for file in files:
+        data = upload_buffer(file)
+        try:
+            # Archives are inflated off the event loop, within the images left in this batch
+            members = await run_in_threadpool(
+                extract_archive_images, file.filename, data, MAX_BATCH_IMAGES - len(named_images)
+            )
+        except (zipfile.BadZipFile, tarfile.TarError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid archive {file.filename}: {str(e)}")
+
+        if members is None:
+            named_images.append((file.filename, data))
+        else:
+            named_images.extend(members)
+
+        if len(named_images) > MAX_BATCH_IMAGES:
+            raise batch_too_large()
+
+    if not named_images:
+        raise HTTPException(status_code=400, detail="No images found in upload")
+    return named_images
+
+# =========================
+# INFERENCE SCHEDULER
+# =========================
+MODEL_NAMES = {"cnn": "Classical CNN", "qml": "Quantum ML"}
+INFERENCE_MAX_BATCH_SIZE = int(os.environ.get("INFERENCE_MAX_BATCH_SIZE", "8"))
+
+def get_model(kind):
+    return cml_model if kind == "cnn" else qml_model
+
+def serving_model(kind):
+    """(tier, model) that serves `kind` right now: "model", "head" or "fallback" (model None)"""
+    tier = MODEL_TIER[kind]
+    if tier == "auto" and get_model(kind) is not None:
+        return "model", get_model(kind)
+    if tier in ("auto", "head") and feature_head is not None:
+        return "head", feature_head
+    return "fallback", None
+
+def classify_batch(model, batch, kind=""):
+    """Classify an (N, H, W, 3) batch with one model call, or the fallback when model is None"""
+    if model is None:
+        # The fallback works on uint8 batches directly
+        with stage_seconds.time(stage="feature_extraction", model=kind):
+            features = fallback.extract_features(batch)
+        with stage_seconds.time(stage="scoring", model=kind):
+            return fallback.classify_features(features)
+
+    if isinstance(model, FeatureHead):
+        # So does the feature head; it needs no float copy of the batch
+        with stage_seconds.time(stage="feature_extraction", model=kind):
+            features = feature_head_features(batch)
+        with stage_seconds.time(stage="model_inference", model=kind):
+            return model.classify(model.predict_features(features))
+
+    # Only the TF models need floats; the fallback and head above are fastest on uint8
+    if batch.dtype == np.uint8:
+        batch = to_model_input(batch)
+    with stage_seconds.time(stage="model_inference", model=kind):
+        preds = model.predict(batch)
+    class_ids = np.argmax(preds, axis=1)
+    confidences = np.max(preds, axis=1)
+    return [
+        (idx_to_class.get(int(class_id), "unknown"), round(float(confidence) * 100, 2))
+        for class_id, confidence in zip(class_ids, confidences)
+    ]
+
+def run_inference_batch(kind, batch):
+    """Scheduler worker: classify one micro-batch for the "cnn" or "qml" model"""
+    tier, model = serving_model(kind)
+    model_name = MODEL_NAMES[kind]
+    if tier == "head":
+        model_name = f"{model_name} (Feature Head)"
+    elif model is None:
+        print(f"WARNING: {kind.upper()} model not available, using fallback prediction")
+        model_name = f"{model_name} (Fallback)"
+        fallback_predictions_total.inc(len(batch), model=kind)
+    inference_batch_size.observe(len(batch), model=kind)
+
+    return [
+        {"model": model_name, "tumor_type": tumor_type, "confidence": confidence}
+        for tumor_type, confidence in classify_batch(model, batch, kind)
+    ]
+
+def model_version(kind):
+    """Identify the model and preprocessing that would serve `kind` right now"""
+    preprocessing = f"{PREPROCESS_MODE}-{preprocess_pool.resample}"
+    tier, model = serving_model(kind)
+    if tier == "fallback":
+        return f"fallback-{fallback.RULES_VERSION}-{preprocessing}"
+    if tier == "head":
+        return f"head-{model.version}-{preprocessing}"
+    path = CML_MODEL_PATH if kind == "cnn" else QML_MODEL_PATH
+    return f"{os.path.basename(path)}-{int(os.path.getmtime(path))}-{preprocessing}"
+
+scheduler = InferenceScheduler(
+    run_inference_batch,
+    max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+    max_wait_ms=float(os.environ.get("INFERENCE_MAX_WAIT_MS", "5")),
+    workers=int(os.environ.get("INFERENCE_WORKERS", "1")),
+)
+
+@app.on_event("startup")
+async def start_scheduler():
+    scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    await scheduler.stop()
+    preprocess_pool.shutdown()
+    prediction_cache.close()
+    password_hasher.shutdown()
+    audit_log.shutdown()
+
+# =========================
+# PREDICTION CACHE
+# =========================
+PREDICTION_CACHE_PATH = os.path.join(BASE_DIR, "prediction_cache.db")
+
+prediction_cache = PredictionCache(
+    max_entries=int(os.environ.get("PREDICTION_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.environ.get("PREDICTION_CACHE_TTL", "3600")),
+    sqlite_path=PREDICTION_CACHE_PATH if os.environ.get("PREDICTION_CACHE_DISK", "0") == "1" else None,
+)
+
+def cache_lookup(images, kind):
+    """Return (keys, cached results or None) for a list of raw uploads"""
+    with stage_seconds.time(stage="cache_lookup", model=kind):
+        version = model_version(kind)
+        keys = [PredictionCache.make_key(image_bytes, kind, version) for image_bytes in images]
+        return keys, [prediction_cache.get(key) for key in keys]
+
+# =========================
+# PREDICTION AUDIT LOG
+# =========================
+AUDIT_LOG = os.environ.get("AUDIT_LOG", "1") == "1"
+
+audit_log = AuditLogWriter(
+    SessionLocal,
+    batch_size=int(os.environ.get("AUDIT_BATCH_SIZE", "256")),
+    flush_interval=float(os.environ.get("AUDIT_FLUSH_INTERVAL", "1.0")),
+    max_queue=int(os.environ.get("AUDIT_MAX_QUEUE", "10000")),
+)
+
+@app.on_event("startup")
+def backfill_prediction_rollups():
+    db = SessionLocal()
+    try:
+        folded = rebuild_rollups(db)
+        if folded:
+            print(f"✓ Rebuilt prediction rollups from {folded} audit rows")
+    finally:
+        db.close()
+
+def record_predictions(named_images, keys, results, kind, user, latency_ms, cached):
+    """Queue one audit row per image; the request never waits on the insert"""
+    if not AUDIT_LOG:
+        return
+    created_at = datetime.utcnow()
+    user = user or {}
+    audit_log.record([
+        {
+            "created_at": created_at,
+            "user_id": user.get("uid"),
+            "username": user.get("sub"),
+            "hospital_name": user.get("hospital"),
+            "model": kind,
+            # Cache keys are "<sha256>:<model>:<version>"
+            "model_version": key.split(":", 2)[2],
+            "tumor_type": result["tumor_type"],
+            "confidence": result["confidence"],
+            "image_sha256": key.split(":", 1)[0],
+            "filename": name,
+            "latency_ms": latency_ms,
+            "cached": was_cached,
+        }
+        for (name, _), key, result, was_cached in zip(named_images, keys, results, cached)
+    ])
 
 # =========================
 # LOAD MODELS
@@ -279,11 +587,77 @@ def load_models():
         class_indices = {"glioma": 0, "meningioma": 1, "notumor": 2, "pituitary": 3}
         idx_to_class = {v: k for k, v in class_indices.items()}
 
-    # Skip model loading - use fallback prediction for accuracy
-    # Models are corrupted/too small, so we force fallback
-    cml_model = None
-    qml_model = None
-    print("✓ Models disabled - Using advanced fallback prediction algorithm")
+    # Only "auto" tiers ever serve from TensorFlow
+    kinds = [kind for kind, tier in MODEL_TIER.items() if tier == "auto"]
+    if not LOAD_MODELS or not kinds:
+        # Models are corrupted/too small, so by default we force fallback
+        cml_model = None
+        qml_model = None
+        tiers = ", ".join(f"{kind.upper()}: {serving_model(kind)[0]}" for kind in MODEL_TIER)
+        print(f"✓ TensorFlow models disabled - serving with {tiers}")
+        return
+
+    # Load in the background so the worker accepts traffic immediately;
+    # predictions use the feature head or the fallback until each model is ready
+    model_status.update({kind: "loading" for kind in kinds})
+    threading.Thread(
+        target=load_models_in_background, args=(kinds,), name="model-loader", daemon=True
+    ).start()
+
+def load_keras_model(kind):
+    """Import TensorFlow (and PennyLane for QML) on first use and load one .h5 model"""
+    import tensorflow as tf
+
+    if kind == "cnn":
+        return tf.keras.models.load_model(CML_MODEL_PATH, compile=False)
+
+    from pennylane.qnn import KerasLayer
+    return tf.keras.models.load_model(
+        QML_MODEL_PATH, compile=False, custom_objects={"KerasLayer": KerasLayer}
+    )
+
+def warmup_batch_sizes():
+    if WARMUP_BATCH_SIZES:
+        return [int(size) for size in WARMUP_BATCH_SIZES.split(",")]
+    sizes = [1]
+    while sizes[-1] * 2 <= INFERENCE_MAX_BATCH_SIZE:
+        sizes.append(sizes[-1] * 2)
+    if sizes[-1] != INFERENCE_MAX_BATCH_SIZE:
+        sizes.append(INFERENCE_MAX_BATCH_SIZE)
+    return sizes
+
+def load_models_in_background(kinds=("cnn", "qml")):
+    global cml_model, qml_model
+
+    for kind in kinds:
+        start = time.perf_counter()
+        try:
+            model = load_keras_model(kind)
+        except Exception as e:
+            model_status[kind] = "failed"
+            model_errors[kind] = str(e)
+            print(f"✗ Could not load {kind.upper()} model, using fallback: {e}")
+            continue
+
+        try:
+            compiled = CompiledModel(model, (IMG_SIZE[1], IMG_SIZE[0], 3))
+            compiled.warm_up(warmup_batch_sizes())
+        except Exception as e:
+            model_status[kind] = "failed"
+            model_errors[kind] = f"Warm-up failed: {e}"
+            print(f"✗ {kind.upper()} model warm-up failed, using fallback: {e}")
+            continue
+
+        if kind == "cnn":
+            cml_model = compiled
+        else:
+            qml_model = compiled
+        model_load_seconds[kind] = round(time.perf_counter() - start, 3)
+        model_status[kind] = "ready"
+        print(
+            f"✓ {kind.upper()} model ready in {model_load_seconds[kind]}s "
+            f"(warm-up {compiled.warmup_seconds}s, per-batch ms {compiled.batch_latency_ms})"
+        )
 
 # =========================
 # HEALTH CHECK
@@ -293,91 +667,191 @@ def health_check():
     return {
         "status": "ok",
         "backend": "running",
-        "cnn_model": "loaded" if cml_model is not None else "not_loaded",
-        "qml_model": "loaded" if qml_model is not None else "not_loaded",
-        "models_fallback_enabled": True
+        "cnn_model": model_status["cnn"],
+        "qml_model": model_status["qml"],
+        "models": {
+            kind: {
+                "status": status,
+                "tier": MODEL_TIER[kind],
+                "serving": serving_model(kind)[0],
+                "error": model_errors.get(kind),
+                "load_seconds": model_load_seconds.get(kind),
+                **(get_model(kind).stats() if get_model(kind) is not None else {}),
+            }
+            for kind, status in model_status.items()
+        },
+        "models_fallback_enabled": True,
+        "fallback_rules": fallback.RULES_VERSION,
+        "feature_head": feature_head.stats() if feature_head is not None else None,
+        "scheduler": scheduler.stats(),
+        "prediction_cache": prediction_cache.stats(),
+        "password_hasher": password_hasher.stats(),
+        "sessions": token_signer.stats(),
+        "audit_log": audit_log.stats(),
+        "database": get_pool_stats()
     }
 
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus text exposition of request, stage and queue metrics"""
+    inference_queue_depth.set(scheduler.stats()["queued"])
+    audit_log_pending.set(audit_log.stats()["pending"])
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # =========================
 # AUTH APIs
 # =========================
+MAX_BULK_USERS = int(os.environ.get("MAX_BULK_USERS", "1000"))
+
+async def get_user_store():
+    """Yield the user store for the configured database mode (DB_ASYNC)"""
+    if DB_ASYNC:
+        async with AsyncSessionLocal() as session:
+            yield AsyncUserStore(session)
+    else:
+        db = SessionLocal()
+        try:
+            yield SyncUserStore(db)
+        finally:
+            await run_in_threadpool(db.close)
+
+def duplicate_user_detail(error):
+    """Map a unique-constraint IntegrityError on users back to its 400 message"""
+    message = str(error.orig)
+    if "users.username" in message:
+        return "Username already exists"
+    if "users.email" in message:
+        return "Email already registered"
+    return "User already exists"
+
 @app.post("/register")
-def register(user: Register, db: Session = Depends(get_db)):
+async def register(user: Register, store=Depends(get_user_store)):
     try:
-        # Check if username exists
-        existing_user = db.query(User).filter(User.username == user.username).first()
-        if existing_user:
-            raise HTTPException(status_code=400, detail="Username already exists")
-        
-        # Check if email exists
-        existing_email = db.query(User).filter(User.email == user.email).first()
-        if existing_email:
-            raise HTTPException(status_code=400, detail="Email already registered")
-
-        # Create new user
-        new_user = User(
-            hospital_name=user.hospital_name,
-            email=user.email,
-            contact=user.contact,
-            name=user.name,
-            address=user.address,
-            username=user.username,
-            password=hash_password(user.password)
-        )
+        hashed_password = await run_password_task(password_hasher.hash_async(user.password))
+        try:
+            user_id = (await store.insert_users([user], [hashed_password]))[0]
+        except IntegrityError as e:
+            raise HTTPException(status_code=400, detail=duplicate_user_detail(e))
 
-        db.add(new_user)
-        db.flush()  # Flush to ensure ID is assigned
-        db.commit()  # Commit transaction
-        db.refresh(new_user)
-        
-        print(f"✓ User registered: {new_user.username} (ID: {new_user.id})")
-        return {"message": "Registration successful", "user_id": new_user.id}
+        print(f"✓ User registered: {user.username} (ID: {user_id})")
+        return {"message": "Registration successful", "user_id": user_id}
     
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await store.rollback()
         print(f"✗ Registration error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Registration failed: {str(e)}")
 
+@app.post("/register/bulk")
+async def register_bulk(data: BulkRegister, store=Depends(get_user_store)):
+    """Register a whole staff list in one transaction; nothing is stored if any user conflicts"""
+    users = data.users
+    if not users:
+        raise HTTPException(status_code=400, detail="No users to register")
+    if len(users) > MAX_BULK_USERS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_USERS} users per request")
+
+    for field, label in (("username", "usernames"), ("email", "emails")):
+        values = [getattr(user, field) for user in users]
+        repeated = sorted({v for v in values if values.count(v) > 1})
+        if repeated:
+            raise HTTPException(status_code=400, detail={"message": f"Duplicate {label} in request", label: repeated})
+
+    try:
+        hashed_passwords = await run_password_task(
+            password_hasher.hash_many_async([user.password for user in users])
+        )
+        try:
+            user_ids = await store.insert_users(users, hashed_passwords)
+        except IntegrityError:
+            conflicts = await store.find_conflicting_users(users)
+            raise HTTPException(status_code=400, detail={"message": "Users already registered", **conflicts})
+
+        print(f"✓ Bulk registered {len(user_ids)} users")
+        return {"message": "Registration successful", "count": len(user_ids), "user_ids": user_ids}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        await store.rollback()
+        print(f"✗ Bulk registration error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Registration failed: {str(e)}")
+
+async def rehash_password(store, user, password):
+    """Re-hash with the current BCRYPT_ROUNDS after a successful login"""
+    try:
+        await store.update_password(user, await password_hasher.hash_async(password))
+        print(f"✓ Rehashed password for {user.username} with cost {password_hasher.rounds}")
+    except Exception as e:
+        # Leave the old hash in place; the next login retries
+        await store.rollback()
+        print(f"✗ Password rehash failed for {user.username}: {str(e)}")
+
 @app.post("/login")
-def login(data: Login, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == data.username).first()
+async def login(data: Login, store=Depends(get_user_store)):
+    user = await store.find_user(data.username)
 
-    if not user or not verify_password(data.password, user.password):
+    if not user or not await run_password_task(password_hasher.verify_async(data.password, user.password)):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    return {
+    response = {
         "message": "Login successful",
         "hospital": user.hospital_name,
         "name": user.name,
-        "username": user.username
+        "username": user.username,
+        "access_token": token_signer.issue({
+            "sub": user.username,
+            "uid": user.id,
+            "hospital": user.hospital_name,
+        }),
+        "token_type": "bearer",
+        "expires_in": token_signer.ttl_seconds
     }
 
+    if password_hasher.needs_rehash(user.password):
+        await rehash_password(store, user, data.password)
+
+    return response
+
 # =========================
 # ADMIN - GET ALL USERS (FOR TESTING)
 # =========================
+ADMIN_PAGE_SIZE = 100
+ADMIN_MAX_PAGE_SIZE = 1000
+
 @app.get("/admin/users")
-def get_all_users(db: Session = Depends(get_db)):
-    """Retrieve all users from database (for testing purposes)"""
+async def get_all_users(
+    limit: Optional[int] = Query(None, ge=1, le=ADMIN_MAX_PAGE_SIZE),
+    after_id: int = Query(0, ge=0),
+    hospital_name: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson|csv)$"),
+    store=Depends(get_user_store)
+):
+    """Page through users (for testing purposes), or export them as NDJSON/CSV
+
+    Pass the returned `next_after_id` as `after_id` to fetch the next page.
+    Exports stream every matching user after `after_id` unless `limit` is given.
+    """
+    if format != "json":
+        stmt = users_query(after_id, hospital_name, limit)
+        media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+        return StreamingResponse(
+            # The request's session is closed before streaming starts, so the export opens its own
+            stream_users_async(AsyncSessionLocal, stmt, format) if DB_ASYNC
+            else stream_users(SessionLocal, stmt, format),
+            media_type=media_type,
+            headers={"Content-Disposition": f"attachment; filename=users.{format}"}
+        )
+
     try:
-        users = db.query(User).all()
-        user_list = []
-        for user in users:
-            user_list.append({
-                "id": user.id,
-                "hospital_name": user.hospital_name,
-                "email": user.email,
-                "contact": user.contact,
-                "name": user.name,
-                "address": user.address,
-                "username": user.username,
-                "password": user.password  # Shows hashed password
-            })
-        
+        page_size = limit or ADMIN_PAGE_SIZE
+        user_list = await store.list_users(users_query(after_id, hospital_name, page_size))
+
         print(f"✓ Retrieved {len(user_list)} users from database")
         return {
-            "total_users": len(user_list),
+            "count": len(user_list),
+            "next_after_id": user_list[-1]["id"] if len(user_list) == page_size else None,
             "users": user_list
         }
     except Exception as e:
@@ -387,59 +861,223 @@ def get_all_users(db: Session = Depends(get_db)):
 # =========================
 # ML PREDICTION APIs
 # =========================
+async def predict_images(named_images, kind, user=None):
+    """Classify (name, bytes) uploads, serving repeats from the cache"""
+    start = time.perf_counter()
+    images = [image_bytes for _, image_bytes in named_images]
+    keys, results = await run_in_threadpool(cache_lookup, images, kind)
+    cached = [result is not None for result in results]
+
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        batch = await run_in_threadpool(preprocess_images, [named_images[i] for i in missing])
+        predictions = await scheduler.submit(kind, batch)
+        for i, prediction in zip(missing, predictions):
+            results[i] = prediction
+        # One write (and with PREDICTION_CACHE_DISK=1 one SQLite commit) per request, off the loop
+        await run_in_threadpool(
+            prediction_cache.put_many, [(keys[i], results[i]) for i in missing]
+        )
+
+    predictions_total.inc(len(results) - len(missing), model=kind, source="cache")
+    predictions_total.inc(len(missing), model=kind, source="inference")
+    latency_ms = round((time.perf_counter() - start) * 1000, 3)
+    record_predictions(named_images, keys, results, kind, user, latency_ms, cached)
+    return results
+
 @app.post("/predict-cnn")
-async def predict_cnn(file: UploadFile = File(...)):
+async def predict_cnn(file: UploadFile = File(...), user: Optional[dict] = Depends(get_current_user)):
     try:
-        img = preprocess_image(await file.read())
-        
-        if cml_model is None:
-            # Fallback prediction
-            print("WARNING: CNN model not available, using fallback prediction")
-            tumor_type, confidence = predict_with_fallback(img)
-            return {
-                "model": "Classical CNN (Fallback)",
-                "tumor_type": tumor_type,
-                "confidence": confidence
-            }
-        
-        preds = cml_model.predict(img, verbose=0)
-        class_id = int(np.argmax(preds))
-        confidence = float(np.max(preds))
-
-        return {
-            "model": "Classical CNN",
-            "tumor_type": idx_to_class.get(class_id, "unknown"),
-            "confidence": round(confidence * 100, 2)
-        }
+        return (await predict_images([(file.filename, upload_buffer(file))], "cnn", user))[0]
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"✗ CNN Prediction error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
 
 @app.post("/predict-qml")
-async def predict_qml(file: UploadFile = File(...)):
+async def predict_qml(file: UploadFile = File(...), user: Optional[dict] = Depends(get_current_user)):
     try:
-        img = preprocess_image(await file.read())
-        
-        if qml_model is None:
-            # Fallback: Use image statistics for prediction
-            print("WARNING: QML model not available, using fallback prediction")
-            tumor_type, confidence = predict_with_fallback(img)
-            
-            return {
-                "model": "Quantum ML (Fallback)",
-                "tumor_type": tumor_type,
-                "confidence": confidence
-            }
-        
-        preds = qml_model.predict(img, verbose=0)
-        class_id = int(np.argmax(preds))
-        confidence = float(np.max(preds))
+        return (await predict_images([(file.filename, upload_buffer(file))], "qml", user))[0]
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"✗ QML Prediction error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
 
-        return {
-            "model": "Quantum ML",
-            "tumor_type": idx_to_class.get(class_id, "unknown"),
-            "confidence": round(confidence * 100, 2)
+# =========================
+# BATCH PREDICTION APIs
+# =========================
+async def predict_batch(files, kind, user=None):
+    named_images = await collect_batch_images(files)
+    predictions = await predict_images(named_images, kind, user)
+    return {
+        "model": predictions[0]["model"],
+        "count": len(predictions),
+        "results": [
+            {"filename": name, "tumor_type": p["tumor_type"], "confidence": p["confidence"]}
+            for (name, _), p in zip(named_images, predictions)
+        ]
+    }
+
+@app.post("/predict-cnn/batch")
+async def predict_cnn_batch(
+    files: List[UploadFile] = File(...), user: Optional[dict] = Depends(get_current_user)
+):
+    try:
+        return await predict_batch(files, "cnn", user)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"✗ CNN Batch prediction error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
+
+@app.post("/predict-qml/batch")
+async def predict_qml_batch(
+    files: List[UploadFile] = File(...), user: Optional[dict] = Depends(get_current_user)
+):
+    try:
+        return await predict_batch(files, "qml", user)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"✗ QML Batch prediction error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
+
+# =========================
+# VOLUME PREDICTION APIs
+# =========================
+VOLUME_MAX_SLICES = int(os.environ.get("VOLUME_MAX_SLICES", "1024"))
+# Slices per scheduler submission; chunks are classified concurrently
+VOLUME_CHUNK_SLICES = int(os.environ.get("VOLUME_CHUNK_SLICES", "32"))
+# Slices with less non-black area than this are background and left out of the study result
+VOLUME_MIN_FOREGROUND = float(os.environ.get("VOLUME_MIN_FOREGROUND", "0.05"))
+VOLUME_MIN_TUMOR_FRACTION = float(os.environ.get("VOLUME_MIN_TUMOR_FRACTION", "0.1"))
+
+def load_volume(filename, data, kind, window):
+    """Threadpool worker: model-ready slices, their foreground fractions, metadata and audit key"""
+    with stage_seconds.time(stage="volume_decode", model=kind):
+        batch, info = volume_to_batch(
+            filename, data, IMG_SIZE, window, VOLUME_MAX_SLICES, preprocess_pool.resample,
+            MAX_VOLUME_UPLOAD_MB * 1024 * 1024
+        )
+        foreground = foreground_fraction(batch)
+    key = PredictionCache.make_key(data, kind, model_version(kind))
+    return batch, foreground, info, key
+
+async def predict_volume(file, kind, user, window_center, window_width):
+    start = time.perf_counter()
+    data = upload_buffer(file)
+    window = None
+    if window_center is not None and window_width is not None:
+        window = (window_center - window_width / 2, window_center + window_width / 2)
+
+    try:
+        batch, foreground, info, key = await run_in_threadpool(load_volume, file.filename, data, kind, window)
+    except VolumeError as e:
+        print(f"Error reading volume {file.filename}: {e}")
+        raise HTTPException(status_code=400, detail=f"Invalid volume file: {str(e)}")
+
+    chunks = [batch[i:i + VOLUME_CHUNK_SLICES] for i in range(0, len(batch), VOLUME_CHUNK_SLICES)]
+    parts = await asyncio.gather(*(scheduler.submit(kind, chunk) for chunk in chunks))
+    predictions = [p for part in parts for p in part]
+    predictions_total.inc(len(predictions), model=kind, source="volume")
+
+    slices = [
+        {
+            "slice": i,
+            "tumor_type": p["tumor_type"],
+            "confidence": p["confidence"],
+            "skipped": bool(foreground[i] < VOLUME_MIN_FOREGROUND),
         }
+        for i, p in enumerate(predictions)
+    ]
+    study = aggregate_study(slices, min_tumor_fraction=VOLUME_MIN_TUMOR_FRACTION)
+
+    latency_ms = round((time.perf_counter() - start) * 1000, 3)
+    record_predictions([(file.filename, data)], [key], [study], kind, user, latency_ms, [False])
+    print(f"✓ {MODEL_NAMES[kind]} volume {file.filename}: {info['slices']} slices -> {study['tumor_type']}")
+    return {
+        "model": predictions[0]["model"],
+        "study": {**info, **study},
+        "slices": slices
+    }
+
+@app.post("/predict-cnn/volume")
+async def predict_cnn_volume(
+    file: UploadFile = File(...),
+    window_center: Optional[float] = None,
+    window_width: Optional[float] = Query(None, gt=0),
+    user: Optional[dict] = Depends(get_current_user)
+):
+    """Classify every slice of a DICOM, multi-frame TIFF or NIfTI volume plus the whole study"""
+    try:
+        return await predict_volume(file, "cnn", user, window_center, window_width)
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"✗ QML Prediction error: {str(e)}")
+        print(f"✗ CNN Volume prediction error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
+
+@app.post("/predict-qml/volume")
+async def predict_qml_volume(
+    file: UploadFile = File(...),
+    window_center: Optional[float] = None,
+    window_width: Optional[float] = Query(None, gt=0),
+    user: Optional[dict] = Depends(get_current_user)
+):
+    """Classify every slice of a DICOM, multi-frame TIFF or NIfTI volume plus the whole study"""
+    try:
+        return await predict_volume(file, "qml", user, window_center, window_width)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"✗ QML Volume prediction error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
+
+# =========================
+# PREDICTION HISTORY & STATS
+# =========================
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
+MAX_STATS_DAYS = 366
+
+def resolve_hospital(hospital_name, user):
+    """Callers only see their own hospital's predictions"""
+    if hospital_name is not None and hospital_name != user.get("hospital"):
+        raise HTTPException(status_code=403, detail="Not allowed to view another hospital's predictions")
+    return user.get("hospital")
+
+@app.get("/predictions/history")
+def get_prediction_history(
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    before: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+    hospital_name: Optional[str] = None,
+    model: Optional[str] = Query(None, pattern="^(cnn|qml)$"),
+    user: dict = Depends(require_current_user),
+    db: Session = Depends(get_db)
+):
+    """Newest predictions first; pass the returned `next` values as `before`/`before_id` for older ones"""
+    hospital_name = resolve_hospital(hospital_name, user)
+    rows = db.execute(history_query(hospital_name, model, before, before_id, limit)).all()
+    predictions = [dict(row._mapping) for row in rows]
+    last = predictions[-1] if len(predictions) == limit else None
+    return {
+        "count": len(predictions),
+        "next": {"before": last["created_at"], "before_id": last["id"]} if last else None,
+        "predictions": predictions
+    }
+
+@app.get("/predictions/stats")
+def get_prediction_stats(
+    hospital_name: Optional[str] = None,
+    model: Optional[str] = Query(None, pattern="^(cnn|qml)$"),
+    days: Optional[int] = Query(None, ge=1, le=MAX_STATS_DAYS),
+    user: dict = Depends(require_current_user),
+    db: Session = Depends(get_db)
+):
+    """Counts by tumor class and confidence histograms; `days` adds a per-day breakdown"""
+    hospital_name = resolve_hospital(hospital_name, user)
+    since = datetime.utcnow().date() - timedelta(days=days - 1) if days else None
+    return prediction_stats(db, hospital_name, model, since)
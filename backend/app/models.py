@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Boolean, Column, Date, DateTime, Float, Index, Integer, String
 from app.database import Base
 
 class User(Base):
@@ -12,3 +12,54 @@ class User(Base):
     address = Column(String)
     username = Column(String, unique=True)
     password = Column(String)
+
+    __table_args__ = (
+        # Keyset pagination of /admin/users filtered by hospital
+        Index("ix_users_hospital_name_id", "hospital_name", "id"),
+    )
+
+class Prediction(Base):
+    """Audit record of one classified image"""
+    __tablename__ = "predictions"
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, nullable=False)
+    user_id = Column(Integer)
+    username = Column(String)
+    hospital_name = Column(String)
+    model = Column(String, nullable=False)
+    model_version = Column(String)
+    tumor_type = Column(String, nullable=False)
+    confidence = Column(Float, nullable=False)
+    image_sha256 = Column(String(64), nullable=False)
+    filename = Column(String)
+    latency_ms = Column(Float)
+    cached = Column(Boolean, default=False)
+
+    __table_args__ = (
+        # Recent history per hospital
+        Index("ix_predictions_hospital_created_at", "hospital_name", "created_at"),
+        # Class breakdowns per model
+        Index("ix_predictions_model_tumor_type", "model", "tumor_type"),
+    )
+
+class PredictionRollup(Base):
+    """All-time prediction counts per hospital, model, class and 10-point confidence bucket"""
+    __tablename__ = "prediction_rollups"
+
+    hospital_name = Column(String, primary_key=True)  # "" for unauthenticated requests
+    model = Column(String, primary_key=True)
+    tumor_type = Column(String, primary_key=True)
+    confidence_bucket = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    confidence_sum = Column(Float, nullable=False, default=0.0)
+
+class PredictionDailyRollup(Base):
+    """Prediction counts per hospital, day, model and class"""
+    __tablename__ = "prediction_daily_rollups"
+
+    hospital_name = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    model = Column(String, primary_key=True)
+    tumor_type = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,123 @@
+"""bcrypt hashing on a dedicated, bounded thread pool"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+
+class PasswordQueueFull(Exception):
+    """Raised when too many hash/verify calls are already waiting"""
+
+
+def _truncate(password):
+    # Bcrypt has a 72-byte limit, truncate password if necessary
+    password_bytes = password.encode('utf-8')
+    if len(password_bytes) > 72:
+        password = password_bytes[:72].decode('utf-8', errors='ignore')
+    return password.encode('utf-8')
+
+
+class PasswordHasher:
+    """Hash and verify passwords without tying up the request threadpool
+
+    bcrypt calls take hundreds of milliseconds of CPU, so they run on their
+    own `workers`-thread executor. At most `max_queue` calls may be waiting
+    for a worker; beyond that `PasswordQueueFull` is raised so login bursts
+    shed load instead of starving prediction requests.
+    """
+
+    def __init__(self, rounds=12, workers=2, max_queue=64):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._active = 0
+        self.peak_queued = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def hash(self, password):
+        return bcrypt.hashpw(_truncate(password), bcrypt.gensalt(rounds=self.rounds)).decode('utf-8')
+
+    def verify(self, password, hashed):
+        try:
+            return bcrypt.checkpw(_truncate(password), hashed.encode('utf-8'))
+        except Exception:
+            return False
+
+    def needs_rehash(self, hashed):
+        """True when `hashed` was made with a different cost than `rounds`"""
+        try:
+            return int(hashed.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return False
+
+    async def hash_async(self, password):
+        return await self._submit(self.hash, password)
+
+    async def verify_async(self, password, hashed):
+        return await self._submit(self.verify, password, hashed)
+
+    async def hash_many_async(self, passwords):
+        """Hash a list of passwords as one job per password, on at most workers - 1 threads
+
+        A bulk request never holds every worker and never queues more than a
+        job per lane, so a login arriving mid-bulk waits for one hash at most.
+        """
+        hashed = [None] * len(passwords)
+
+        async def lane(indices):
+            for i in indices:
+                hashed[i] = await self._submit(self.hash, passwords[i])
+
+        lanes = max(1, min(self.workers - 1, len(passwords)))
+        tasks = [asyncio.ensure_future(lane(range(k, len(passwords), lanes))) for k in range(lanes)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return hashed
+
+    async def _submit(self, fn, *args):
+        with self._lock:
+            if self._pending - self._active >= self.max_queue:
+                self.rejected += 1
+                raise PasswordQueueFull()
+            self._pending += 1
+            self.peak_queued = max(self.peak_queued, self._pending - self._active)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, self._run, fn, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self.completed += 1
+
+    def _run(self, fn, *args):
+        with self._lock:
+            self._active += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rounds": self.rounds,
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._active,
+                "queued": self._pending - self._active,
+                "peak_queued": self.peak_queued,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,158 @@
+"""Prediction history queries and incrementally maintained rollups"""
+from collections import defaultdict
+
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.models import Prediction, PredictionDailyRollup, PredictionRollup
+
+# Rollup key for predictions made without a session token
+ANONYMOUS_HOSPITAL = ""
+CONFIDENCE_BUCKETS = 10
+
+HISTORY_COLUMNS = (
+    Prediction.id, Prediction.created_at, Prediction.username, Prediction.hospital_name,
+    Prediction.model, Prediction.model_version, Prediction.tumor_type, Prediction.confidence,
+    Prediction.image_sha256, Prediction.filename, Prediction.latency_ms, Prediction.cached
+)
+
+
+def confidence_bucket(confidence):
+    """10-point bucket index 0-9 for a 0-100 confidence"""
+    return min(max(int(confidence // 10), 0), CONFIDENCE_BUCKETS - 1)
+
+
+def _upsert(db, table, rows, key_columns, add_columns):
+    """INSERT rows, adding `add_columns` onto any existing row with the same key"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        stmt = sqlite.insert(table)
+    elif dialect == "postgresql":
+        stmt = postgresql.insert(table)
+    else:
+        raise NotImplementedError(f"Rollups need an upsert, not available for {dialect}")
+    stmt = stmt.on_conflict_do_update(
+        index_elements=key_columns,
+        set_={column: getattr(table.c, column) + getattr(stmt.excluded, column) for column in add_columns},
+    )
+    db.execute(stmt, rows)
+
+
+def apply_rollups(db, rows):
+    """Fold a batch of new prediction rows into both rollup tables (caller commits)"""
+    totals = defaultdict(lambda: [0, 0.0])
+    daily = defaultdict(int)
+    for row in rows:
+        hospital = row.get("hospital_name") or ANONYMOUS_HOSPITAL
+        total = totals[(hospital, row["model"], row["tumor_type"], confidence_bucket(row["confidence"]))]
+        total[0] += 1
+        total[1] += row["confidence"]
+        daily[(hospital, row["created_at"].date(), row["model"], row["tumor_type"])] += 1
+
+    _upsert(
+        db, PredictionRollup.__table__,
+        [
+            {"hospital_name": h, "model": m, "tumor_type": t, "confidence_bucket": b,
+             "count": count, "confidence_sum": confidence_sum}
+            for (h, m, t, b), (count, confidence_sum) in totals.items()
+        ],
+        ["hospital_name", "model", "tumor_type", "confidence_bucket"],
+        ["count", "confidence_sum"],
+    )
+    _upsert(
+        db, PredictionDailyRollup.__table__,
+        [
+            {"hospital_name": h, "day": d, "model": m, "tumor_type": t, "count": count}
+            for (h, d, m, t), count in daily.items()
+        ],
+        ["hospital_name", "day", "model", "tumor_type"],
+        ["count"],
+    )
+
+
+def rebuild_rollups(db, batch_size=5000):
+    """Backfill empty rollups from the predictions table; returns the rows folded in"""
+    if db.execute(select(PredictionRollup.count).limit(1)).first() is not None:
+        return 0
+
+    columns = (Prediction.created_at, Prediction.hospital_name, Prediction.model,
+               Prediction.tumor_type, Prediction.confidence)
+    folded = 0
+    batch = []
+    for row in db.execute(select(*columns).execution_options(yield_per=batch_size)):
+        batch.append(dict(row._mapping))
+        if len(batch) == batch_size:
+            apply_rollups(db, batch)
+            folded += len(batch)
+            batch = []
+    if batch:
+        apply_rollups(db, batch)
+        folded += len(batch)
+    db.commit()
+    return folded
+
+
+def history_query(hospital_name=None, model=None, before=None, before_id=None, limit=50):
+    """Newest-first predictions, keyset-paginated on (created_at, id)"""
+    stmt = select(*HISTORY_COLUMNS).order_by(Prediction.created_at.desc(), Prediction.id.desc()).limit(limit)
+    if hospital_name == ANONYMOUS_HOSPITAL:
+        stmt = stmt.where(Prediction.hospital_name.is_(None))
+    elif hospital_name is not None:
+        stmt = stmt.where(Prediction.hospital_name == hospital_name)
+    if model:
+        stmt = stmt.where(Prediction.model == model)
+    if before is not None:
+        stmt = stmt.where(tuple_(Prediction.created_at, Prediction.id) < (before, before_id or 0))
+    return stmt
+
+
+def _rollup_filters(table, hospital_name, model):
+    filters = []
+    if hospital_name is not None:
+        filters.append(table.hospital_name == hospital_name)
+    if model:
+        filters.append(table.model == model)
+    return filters
+
+
+def prediction_stats(db, hospital_name=None, model=None, since=None):
+    """Class counts, mean confidence and confidence histograms, read from the rollups
+
+    With `since` (a date), also returns per-day class counts from that day on.
+    """
+    rows = db.execute(
+        select(PredictionRollup.tumor_type, PredictionRollup.confidence_bucket,
+               func.sum(PredictionRollup.count), func.sum(PredictionRollup.confidence_sum))
+        .where(*_rollup_filters(PredictionRollup, hospital_name, model))
+        .group_by(PredictionRollup.tumor_type, PredictionRollup.confidence_bucket)
+    ).all()
+
+    by_tumor_type = {}
+    for tumor_type, bucket, count, confidence_sum in rows:
+        entry = by_tumor_type.setdefault(
+            tumor_type, {"count": 0, "confidence_sum": 0.0, "confidence_histogram": [0] * CONFIDENCE_BUCKETS}
+        )
+        entry["count"] += count
+        entry["confidence_sum"] += confidence_sum
+        entry["confidence_histogram"][bucket] += count
+    for entry in by_tumor_type.values():
+        entry["mean_confidence"] = round(entry.pop("confidence_sum") / entry["count"], 2)
+
+    stats = {
+        "total": sum(entry["count"] for entry in by_tumor_type.values()),
+        "confidence_buckets": [f"{10 * b}-{10 * b + 10}" for b in range(CONFIDENCE_BUCKETS)],
+        "by_tumor_type": by_tumor_type,
+    }
+
+    if since is not None:
+        daily = db.execute(
+            select(PredictionDailyRollup.day, PredictionDailyRollup.tumor_type, func.sum(PredictionDailyRollup.count))
+            .where(PredictionDailyRollup.day >= since, *_rollup_filters(PredictionDailyRollup, hospital_name, model))
+            .group_by(PredictionDailyRollup.day, PredictionDailyRollup.tumor_type)
+            .order_by(PredictionDailyRollup.day)
+        ).all()
+        days = {}
+        for day, tumor_type, count in daily:
+            days.setdefault(day.isoformat(), {})[tumor_type] = count
+        stats["daily"] = [{"day": day, "counts": counts} for day, counts in days.items()]
+    return stats
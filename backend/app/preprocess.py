@@ -0,0 +1,233 @@
+"""Image decode/resize, optionally spread over a process pool via shared memory"""
+import io
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from PIL import Image
+
+RESAMPLE_FILTERS = {
+    "nearest": Image.Resampling.NEAREST,
+    "box": Image.Resampling.BOX,
+    "bilinear": Image.Resampling.BILINEAR,
+    "hamming": Image.Resampling.HAMMING,
+    "bicubic": Image.Resampling.BICUBIC,
+    "lanczos": Image.Resampling.LANCZOS,
+}
+
+
+class ImageDecodeError(Exception):
+    """Raised when one image of a batch cannot be decoded; `index` is its position"""
+
+    def __init__(self, index, cause):
+        super().__init__(str(cause))
+        self.index = index
+        self.cause = cause
+
+
+class DecodePoolError(Exception):
+    """Raised when the decode worker processes died and a fresh pool could not finish the batch either"""
+
+
+class BufferReader(io.RawIOBase):
+    """Seekable read-only file over a bytes-like object (e.g. an mmap), without copying it"""
+
+    def __init__(self, data):
+        self._view = memoryview(data).cast("B")
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = max(0, min(len(buffer), len(self._view) - self._pos))
+        buffer[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def readall(self):
+        data = bytes(self._view[self._pos:])
+        self._pos = len(self._view)
+        return data
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._pos = max(0, offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+
+def as_file(data):
+    """File object over raw image data; bytes are wrapped by BytesIO, which shares rather than copies them"""
+    return io.BytesIO(data) if isinstance(data, bytes) else BufferReader(data)
+
+
+def decode_to_uint8(image_bytes, size, resample="bicubic", draft=False):
+    """Decode raw image data (bytes or any buffer) into an RGB (H, W, 3) uint8 array resized to `size`
+
+    With `draft`, JPEGs are decoded directly at the smallest DCT scale
+    (1/2, 1/4 or 1/8) that is still at least `size`, which skips most of the
+    decode work for large scans at a small cost in resize accuracy.
+    """
+    return decode_timed(image_bytes, size, resample, draft)[0]
+
+
+def decode_timed(image_bytes, size, resample="bicubic", draft=False):
+    """`decode_to_uint8` that also returns the (decode, resize) durations in seconds"""
+    start = time.perf_counter()
+    image = Image.open(as_file(image_bytes))
+    if draft:
+        image.draft("RGB", size)
+    image = image.convert("RGB")
+    decoded = time.perf_counter()
+    image = image.resize(size, RESAMPLE_FILTERS[resample])
+    pixels = np.asarray(image, dtype=np.uint8)
+    return pixels, (decoded - start, time.perf_counter() - decoded)
+
+
+def _attach(name):
+    """Attach to a shared memory block owned (and later unlinked) by the parent"""
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: spawned workers share the parent's resource tracker, so
+        # registering the block again here is harmless and the parent's unlink clears it
+        return SharedMemory(name=name)
+
+
+def to_float32(batch):
+    """Scale a uint8 batch to float32 in [0, 1] without a float64 intermediate"""
+    return np.multiply(batch, np.float32(1.0 / 255.0), dtype=np.float32)
+
+
+def _decode_into_shared(shm_name, index, image_bytes, size, resample, draft):
+    """Worker entry point: decode one image straight into slot `index` of a shared batch
+
+    Returns the (decode, resize) durations so the parent can record them.
+    """
+    shm = _attach(shm_name)
+    try:
+        shape = (size[1], size[0], 3)
+        out = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=index * int(np.prod(shape)))
+        out[...], timings = decode_timed(image_bytes, size, resample, draft)
+        del out
+        return timings
+    finally:
+        shm.close()
+
+
+class PreprocessPool:
+    """Decode batches of images to uint8, in-process or on a pool of worker processes
+
+    With `workers=0` images are decoded in the calling thread. Otherwise each
+    image is decoded by a worker process that writes its pixels directly into
+    a shared-memory batch, so only the compressed bytes are pickled.
+    `observe(stage, seconds)`, if given, is called with each image's
+    "decode" and "resize" durations.
+    """
+
+    def __init__(self, size, workers=0, resample="bicubic", draft=False, observe=None):
+        if resample not in RESAMPLE_FILTERS:
+            raise ValueError(f"Unknown resample filter {resample!r}, expected one of {sorted(RESAMPLE_FILTERS)}")
+        self.size = size
+        self.workers = workers
+        self.resample = resample
+        self.draft = draft
+        self.observe = observe
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self):
+        # Concurrent first calls from the threadpool must not each start a pool
+        executor = self._executor
+        if executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+                executor = self._executor
+        return executor
+
+    def _discard_executor(self, executor):
+        """Drop a broken executor so the next _get_executor starts a new one"""
+        with self._executor_lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def decode_batch(self, images):
+        """Decode a list of image bytes into one (N, H, W, 3) uint8 array"""
+        shape = (len(images), self.size[1], self.size[0], 3)
+        if self.workers <= 0 or len(images) == 0:
+            batch = np.empty(shape, dtype=np.uint8)
+            for i, image_bytes in enumerate(images):
+                try:
+                    batch[i], timings = decode_timed(image_bytes, self.size, self.resample, self.draft)
+                except Exception as e:
+                    raise ImageDecodeError(i, e) from e
+                self._observe(timings)
+            return batch
+
+        # A worker killed mid-batch (OOM, segfault) breaks the whole pool; retry once on a new one
+        for attempt in range(2):
+            executor = self._get_executor()
+            try:
+                return self._decode_in_pool(executor, images, shape)
+            except BrokenProcessPool as e:
+                self._discard_executor(executor)
+                if attempt:
+                    raise DecodePoolError(f"Decode workers died: {e}") from e
+
+    def _decode_in_pool(self, executor, images, shape):
+        shm = SharedMemory(create=True, size=int(np.prod(shape)))
+        try:
+            futures = [
+                executor.submit(
+                    # mmap/memoryview uploads cannot be pickled; the copy is needed for IPC anyway
+                    _decode_into_shared, shm.name, i, bytes(image_bytes), self.size, self.resample, self.draft
+                )
+                for i, image_bytes in enumerate(images)
+            ]
+            for i, future in enumerate(futures):
+                try:
+                    self._observe(future.result())
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    for pending in futures[i + 1:]:
+                        pending.cancel()
+                    raise ImageDecodeError(i, e) from e
+            return np.ndarray(shape, dtype=np.uint8, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def _observe(self, timings):
+        if self.observe is not None:
+            self.observe("decode", timings[0])
+            self.observe("resize", timings[1])
+
+    def shutdown(self):
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,127 @@
+"""Micro-batching scheduler that keeps model inference off the event loop"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+class InferenceScheduler:
+    """Queue predict requests and run them as micro-batches in worker threads
+
+    Requests are collected until `max_batch_size` images are waiting or the
+    oldest one has waited `max_wait_ms`, grouped by model key and array
+    dtype, and handed to `run_batch(key, batch)` in a thread pool.
+    `run_batch` must return one result per image of the (N, H, W, C) batch,
+    in order. Requests of different dtypes are never concatenated, since
+    that would upcast e.g. uint8 0-255 pixels next to [0, 1] floats
+    without rescaling them.
+    """
+
+    def __init__(self, run_batch, max_batch_size=8, max_wait_ms=5.0, workers=1):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.workers = workers
+        self._queue = None
+        self._collector = None
+        self._executor = None
+        self._in_flight = set()
+        self.batches = 0
+        self.images = 0
+        self.max_observed_batch = 0
+
+    @property
+    def running(self):
+        return self._collector is not None and not self._collector.done()
+
+    def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        self._collector = asyncio.get_running_loop().create_task(self._collect())
+
+    async def stop(self):
+        if self._collector is None:
+            return
+        self._collector.cancel()
+        try:
+            await self._collector
+        except asyncio.CancelledError:
+            pass
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+        while not self._queue.empty():
+            _, _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Inference scheduler stopped"))
+        self._executor.shutdown(wait=True)
+        self._collector = None
+
+    async def submit(self, key, images):
+        """Classify an (N, H, W, C) array with the model `key`, returning N results"""
+        if not self.running:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((key, images, future))
+        return await future
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "images": self.images,
+            "mean_batch_size": round(self.images / self.batches, 2) if self.batches else 0.0,
+            "max_observed_batch": self.max_observed_batch,
+        }
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self._queue.get()]
+            count = len(pending[0][1])
+            deadline = loop.time() + self.max_wait
+
+            while count < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                pending.append(item)
+                count += len(item[1])
+
+            groups = {}
+            for item in pending:
+                groups.setdefault((item[0], np.asarray(item[1]).dtype), []).append(item)
+            for (key, _), items in groups.items():
+                task = loop.create_task(self._dispatch(key, items))
+                self._in_flight.add(task)
+                task.add_done_callback(self._in_flight.discard)
+
+    async def _dispatch(self, key, items):
+        loop = asyncio.get_running_loop()
+        batch = items[0][1] if len(items) == 1 else np.concatenate([images for _, images, _ in items])
+
+        try:
+            results = await loop.run_in_executor(self._executor, self.run_batch, key, batch)
+        except Exception as e:
+            for _, _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.images += len(batch)
+        self.max_observed_batch = max(self.max_observed_batch, len(batch))
+
+        start = 0
+        for _, images, future in items:
+            end = start + len(images)
+            if not future.done():
+                future.set_result(results[start:end])
+            start = end
@@ -1,4 +1,5 @@
 from pydantic import BaseModel, EmailStr, field_validator
+from typing import List
 
 class Register(BaseModel):
     hospital_name: str
@@ -21,3 +22,6 @@ class Register(BaseModel):
 class Login(BaseModel):
     username: str
     password: str
+
+class BulkRegister(BaseModel):
+    users: List[Register]
@@ -0,0 +1,81 @@
+"""HMAC-signed bearer tokens for authenticated sessions"""
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class TokenSigner:
+    """Issue and verify `<payload>.<signature>` tokens signed with HMAC-SHA256
+
+    Verifying a token costs one HMAC, with no database lookup and no bcrypt.
+    Recently verified tokens are kept in a bounded cache until they expire,
+    so repeated requests with the same token skip even that.
+    """
+
+    def __init__(self, secret, ttl_seconds=8 * 3600, cache_size=4096):
+        self._secret = secret
+        self.ttl_seconds = ttl_seconds
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.verifications = 0
+
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self._secret, payload.encode("ascii"), hashlib.sha256).digest())
+
+    def issue(self, claims):
+        """Return a token carrying `claims` plus an `exp` timestamp"""
+        body = dict(claims, exp=int(time.time() + self.ttl_seconds))
+        payload = _b64encode(json.dumps(body, separators=(",", ":")).encode("utf-8"))
+        return f"{payload}.{self._sign(payload)}"
+
+    def verify(self, token):
+        """Return the token's claims, or None if it is malformed, forged or expired"""
+        now = time.time()
+        with self._lock:
+            cached = self._cache.get(token)
+            if cached is not None:
+                if cached["exp"] > now:
+                    self._cache.move_to_end(token)
+                    self.cache_hits += 1
+                    return cached
+                del self._cache[token]
+
+        self.verifications += 1
+        try:
+            payload, signature = token.split(".")
+            # compare_digest raises TypeError on non-ASCII str; encoding turns that into a caught UnicodeError
+            if not hmac.compare_digest(signature.encode("ascii"), self._sign(payload).encode("ascii")):
+                return None
+            claims = json.loads(_b64decode(payload))
+        except (ValueError, UnicodeError):
+            return None
+        if not isinstance(claims, dict) or claims.get("exp", 0) <= now:
+            return None
+
+        with self._lock:
+            self._cache[token] = claims
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return claims
+
+    def stats(self):
+        return {
+            "ttl_seconds": self.ttl_seconds,
+            "cached_tokens": len(self._cache),
+            "cache_hits": self.cache_hits,
+            "verifications": self.verifications,
+        }
@@ -0,0 +1,193 @@
+"""User queries behind one interface, backed by a sync or an async SQLAlchemy session"""
+import csv
+import io
+import json
+
+from sqlalchemy import bindparam, select
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+
+from app.models import User
+
+# Built once so SQLAlchemy's compiled cache and sqlite3's statement cache are reused
+USER_BY_USERNAME = select(User).where(User.username == bindparam("username")).limit(1)
+
+# Every column except the password hash, which is never loaded
+USER_PUBLIC_COLUMNS = (
+    User.id, User.hospital_name, User.email, User.contact, User.name, User.address, User.username
+)
+USER_EXPORT_FIELDS = [column.key for column in USER_PUBLIC_COLUMNS]
+EXPORT_BATCH_SIZE = 500
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+
+def users_query(after_id, hospital_name, limit):
+    """Keyset-paginated projection of users ordered by id"""
+    stmt = select(*USER_PUBLIC_COLUMNS).where(User.id > after_id).order_by(User.id)
+    if hospital_name:
+        stmt = stmt.where(User.hospital_name == hospital_name)
+    if limit:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def new_user_row(user, hashed_password):
+    return User(
+        hospital_name=user.hospital_name,
+        email=user.email,
+        contact=user.contact,
+        name=user.name,
+        address=user.address,
+        username=user.username,
+        password=hashed_password
+    )
+
+
+def conflicting_users_query(users):
+    usernames = [user.username for user in users]
+    emails = [user.email for user in users]
+    return select(User.username, User.email).where(User.username.in_(usernames) | User.email.in_(emails))
+
+
+def summarize_conflicts(users, rows):
+    """Usernames and emails from `users` that appear in the already-registered `rows`"""
+    return {
+        "usernames": sorted({row.username for row in rows} & {user.username for user in users}),
+        "emails": sorted({row.email for row in rows} & {user.email for user in users}),
+    }
+
+
+class UserExportFormatter:
+    """Render user rows as NDJSON or CSV text, buffered into ~64 KB chunks"""
+
+    def __init__(self, export_format):
+        self.export_format = export_format
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        if export_format == "csv":
+            self._writer.writerow(USER_EXPORT_FIELDS)
+
+    def add(self, row):
+        """Append one row; returns a chunk to send once the buffer is full, else None"""
+        if self.export_format == "csv":
+            self._writer.writerow(row)
+        else:
+            self._buffer.write(json.dumps(dict(row._mapping)) + "\n")
+        if self._buffer.tell() >= EXPORT_CHUNK_BYTES:
+            return self.flush()
+        return None
+
+    def flush(self):
+        chunk = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return chunk
+
+
+class SyncUserStore:
+    """User operations on a regular Session, each run on the threadpool"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def _insert_users(self, users, hashed_passwords):
+        rows = [new_user_row(user, hashed) for user, hashed in zip(users, hashed_passwords)]
+        self.db.add_all(rows)
+        try:
+            self.db.flush()  # INSERT; assigns IDs
+        except IntegrityError:
+            self.db.rollback()
+            raise
+        # Read IDs before commit expires the rows, so no refresh query is needed
+        user_ids = [row.id for row in rows]
+        self.db.commit()
+        return user_ids
+
+    async def insert_users(self, users, hashed_passwords):
+        """Insert users in one transaction, relying on the unique constraints for duplicates"""
+        return await run_in_threadpool(self._insert_users, users, hashed_passwords)
+
+    async def find_user(self, username):
+        return await run_in_threadpool(
+            lambda: self.db.execute(USER_BY_USERNAME, {"username": username}).scalar_one_or_none()
+        )
+
+    async def find_conflicting_users(self, users):
+        rows = await run_in_threadpool(lambda: self.db.execute(conflicting_users_query(users)).all())
+        return summarize_conflicts(users, rows)
+
+    async def update_password(self, user, hashed_password):
+        user.password = hashed_password
+        await run_in_threadpool(self.db.commit)
+
+    async def list_users(self, stmt):
+        rows = await run_in_threadpool(lambda: self.db.execute(stmt).all())
+        return [dict(row._mapping) for row in rows]
+
+    async def rollback(self):
+        await run_in_threadpool(self.db.rollback)
+
+
+class AsyncUserStore:
+    """User operations on an AsyncSession; DB waits never occupy a worker thread"""
+
+    def __init__(self, session):
+        self.session = session
+
+    async def insert_users(self, users, hashed_passwords):
+        """Insert users in one transaction, relying on the unique constraints for duplicates"""
+        rows = [new_user_row(user, hashed) for user, hashed in zip(users, hashed_passwords)]
+        self.session.add_all(rows)
+        try:
+            await self.session.flush()
+        except IntegrityError:
+            await self.session.rollback()
+            raise
+        user_ids = [row.id for row in rows]
+        await self.session.commit()
+        return user_ids
+
+    async def find_user(self, username):
+        result = await self.session.execute(USER_BY_USERNAME, {"username": username})
+        return result.scalar_one_or_none()
+
+    async def find_conflicting_users(self, users):
+        rows = (await self.session.execute(conflicting_users_query(users))).all()
+        return summarize_conflicts(users, rows)
+
+    async def update_password(self, user, hashed_password):
+        user.password = hashed_password
+        await self.session.commit()
+
+    async def list_users(self, stmt):
+        rows = (await self.session.execute(stmt)).all()
+        return [dict(row._mapping) for row in rows]
+
+    async def rollback(self):
+        await self.session.rollback()
+
+
+def stream_users(session_factory, stmt, export_format):
+    """Yield NDJSON/CSV chunks from a server-side cursor on a new sync session"""
+    formatter = UserExportFormatter(export_format)
+    db = session_factory()
+    try:
+        for row in db.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE)):
+            chunk = formatter.add(row)
+            if chunk:
+                yield chunk
+        yield formatter.flush()
+    finally:
+        db.close()
+
+
+async def stream_users_async(session_factory, stmt, export_format):
+    """Async counterpart of stream_users, for the async database mode"""
+    formatter = UserExportFormatter(export_format)
+    async with session_factory() as session:
+        result = await session.stream(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for row in result:
+            chunk = formatter.add(row)
+            if chunk:
+                yield chunk
+    yield formatter.flush()
@@ -0,0 +1,257 @@
+"""DICOM, multi-frame TIFF and NIfTI volumes turned into batches of 2-D slices"""
+import gzip
+import struct
+
+import numpy as np
+from PIL import Image, ImageSequence
+
+from app.preprocess import RESAMPLE_FILTERS, as_file
+
+try:
+    import pydicom
+except ImportError:  # DICOM support is optional
+    pydicom = None
+
+VOLUME_EXTENSIONS = (".dcm", ".dicom", ".nii", ".nii.gz", ".tif", ".tiff")
+
+# Percentiles used as the window when the file does not carry one
+AUTO_WINDOW_PERCENTILES = (0.5, 99.5)
+# Voxels sampled to estimate the auto window on large volumes
+WINDOW_SAMPLE_SIZE = 1_000_000
+# Slices windowed per vectorized pass; bounds the float32 working copy
+WINDOW_CHUNK = 64
+# Default cap on a volume's pixel data, compressed uploads included
+MAX_VOLUME_BYTES = 1024 * 1024 * 1024
+# Bytes decompressed per read from a .nii.gz upload
+GZIP_READ_CHUNK = 1024 * 1024
+
+# NIfTI-1 datatype codes -> NumPy dtypes
+NIFTI_DTYPES = {
+    2: np.uint8, 4: np.int16, 8: np.int32, 16: np.float32, 64: np.float64,
+    256: np.int8, 512: np.uint16, 768: np.uint32,
+}
+
+
+class VolumeError(Exception):
+    """Raised when an upload is not a readable DICOM/TIFF/NIfTI volume"""
+
+
+def is_volume_name(name):
+    return (name or "").lower().endswith(VOLUME_EXTENSIONS)
+
+
+def _is_dicom(data):
+    return len(data) > 132 and bytes(data[128:132]) == b"DICM"
+
+
+def _is_nifti(data):
+    return len(data) >= 348 and bytes(data[344:348]) in (b"n+1\x00", b"ni1\x00")
+
+
+def _is_gzip(data):
+    return len(data) > 2 and bytes(data[:2]) == b"\x1f\x8b"
+
+
+def _is_tiff(data):
+    return len(data) > 4 and bytes(data[:4]) in (b"II*\x00", b"MM\x00*")
+
+
+def _read_dicom(data):
+    if pydicom is None:
+        raise VolumeError("DICOM support requires the pydicom package")
+    dataset = pydicom.dcmread(as_file(data))
+    pixels = dataset.pixel_array
+    if getattr(dataset, "SamplesPerPixel", 1) > 1:
+        # Colour DICOM (e.g. secondary captures): work on luminance
+        pixels = pixels[..., :3].mean(axis=-1)
+    pixels = pixels.reshape((-1,) + pixels.shape[-2:]).astype(np.float32)
+
+    slope = float(getattr(dataset, "RescaleSlope", 1) or 1)
+    intercept = float(getattr(dataset, "RescaleIntercept", 0) or 0)
+    if slope != 1 or intercept != 0:
+        pixels = pixels * np.float32(slope) + np.float32(intercept)
+
+    window = None
+    center, width = getattr(dataset, "WindowCenter", None), getattr(dataset, "WindowWidth", None)
+    if center is not None and width is not None:
+        # Multi-valued window tags list several presets; the first is the default
+        center = float(center[0] if isinstance(center, pydicom.multival.MultiValue) else center)
+        width = float(width[0] if isinstance(width, pydicom.multival.MultiValue) else width)
+        window = (center - width / 2, center + width / 2)
+    return pixels, window
+
+
+def _nifti_layout(header, max_slices=None, max_bytes=MAX_VOLUME_BYTES):
+    """(endian, shape, dtype, vox_offset, slope, intercept) from a NIfTI-1 header, checked against the limits"""
+    if not _is_nifti(header):
+        raise VolumeError("Not a NIfTI-1 file")
+    endian = "<" if struct.unpack("<i", bytes(header[:4]))[0] == 348 else ">"
+    dims = struct.unpack(endian + "8h", bytes(header[40:56]))
+    datatype = struct.unpack(endian + "h", bytes(header[70:72]))[0]
+    vox_offset = int(struct.unpack(endian + "f", bytes(header[108:112]))[0])
+    slope, intercept = struct.unpack(endian + "2f", bytes(header[112:120]))
+
+    if datatype not in NIFTI_DTYPES:
+        raise VolumeError(f"Unsupported NIfTI datatype {datatype}")
+    if dims[0] < 2:
+        raise VolumeError("NIfTI volume has fewer than 2 dimensions")
+    shape = tuple(max(d, 1) for d in dims[1:4])
+    dtype = np.dtype(NIFTI_DTYPES[datatype]).newbyteorder(endian)
+
+    if max_slices and shape[2] > max_slices:
+        raise VolumeError(f"Volume has {shape[2]} slices, at most {max_slices} are supported")
+    size = int(np.prod(shape)) * dtype.itemsize
+    if max_bytes and size > max_bytes:
+        raise VolumeError(f"Volume has {size} bytes of pixel data, at most {max_bytes} are supported")
+    return endian, shape, dtype, vox_offset, slope, intercept
+
+
+def _gunzip_nifti(data, max_slices=None, max_bytes=MAX_VOLUME_BYTES):
+    """Decompress a .nii.gz upload up to the end of its first volume, and never past the limits
+
+    The header is read first, so a file declaring an oversized volume is
+    rejected after a few hundred bytes; anything after the pixel data (more
+    volumes of a 4-D series, or padding) is never decompressed.
+    """
+    with gzip.GzipFile(fileobj=as_file(data)) as f:
+        out = bytearray(f.read(352))
+        _, shape, dtype, vox_offset, _, _ = _nifti_layout(out, max_slices, max_bytes)
+        needed = vox_offset + int(np.prod(shape)) * dtype.itemsize
+        while len(out) < needed:
+            chunk = f.read(min(GZIP_READ_CHUNK, needed - len(out)))
+            if not chunk:
+                raise VolumeError("NIfTI pixel data is truncated")
+            out += chunk
+    return out
+
+
+def _read_nifti(data, max_slices=None, max_bytes=MAX_VOLUME_BYTES):
+    """Slices of a NIfTI-1 volume as a (Z, Y, X) view straight onto the upload buffer"""
+    if _is_gzip(data):
+        data = _gunzip_nifti(data, max_slices, max_bytes)
+    endian, shape, dtype, vox_offset, slope, intercept = _nifti_layout(data, max_slices, max_bytes)
+
+    count = int(np.prod(shape))
+    # Only the first volume of a 4-D series; frombuffer maps the pixels without copying
+    voxels = np.frombuffer(data, dtype=dtype, count=count, offset=vox_offset)
+    # NIfTI is stored x-fastest: reading it as C-order (z, y, x) needs no transpose
+    slices = voxels.reshape(shape[::-1])
+
+    if slope not in (0, 1) or intercept != 0:
+        slices = slices * np.float32(slope) + np.float32(intercept)
+    return slices, None
+
+
+def _read_tiff(data):
+    frames = []
+    with Image.open(as_file(data)) as image:
+        for frame in ImageSequence.Iterator(image):
+            frames.append(np.asarray(frame.convert("F") if frame.mode not in ("L", "I;16", "F") else frame))
+    if len({frame.shape for frame in frames}) > 1:
+        raise VolumeError("TIFF frames have different sizes")
+    return np.stack(frames).astype(np.float32, copy=False), None
+
+
+def read_volume(filename, data, max_slices=None, max_bytes=MAX_VOLUME_BYTES):
+    """Return (slices, window, format) for a DICOM, multi-frame TIFF or NIfTI upload
+
+    `slices` is a (N, H, W) array in scanner units; `window` is the
+    (low, high) display window stored in the file, or None. Compressed NIfTI
+    is decompressed no further than `max_slices` slices / `max_bytes` allow.
+    """
+    name = (filename or "").lower()
+    try:
+        if _is_dicom(data) or name.endswith((".dcm", ".dicom")):
+            return _read_dicom(data) + ("dicom",)
+        if _is_nifti(data) or name.endswith((".nii", ".nii.gz")):
+            return _read_nifti(data, max_slices, max_bytes) + ("nifti",)
+        if _is_tiff(data):
+            return _read_tiff(data) + ("tiff",)
+    except VolumeError:
+        raise
+    except Exception as e:
+        raise VolumeError(f"Could not read volume: {str(e)}") from e
+    raise VolumeError("Expected a DICOM, multi-frame TIFF or NIfTI file")
+
+
+def auto_window(slices):
+    """Robust (low, high) intensity window from percentiles of a voxel sample"""
+    flat = slices.reshape(-1)
+    step = max(1, flat.size // WINDOW_SAMPLE_SIZE)
+    low, high = np.percentile(flat[::step], AUTO_WINDOW_PERCENTILES)
+    return float(low), float(high)
+
+
+def window_to_uint8(slices, window):
+    """Clip to the (low, high) window and scale to 0-255"""
+    low, high = window
+    scale = np.float32(255.0 / max(high - low, 1e-6))
+    out = (np.asarray(slices, dtype=np.float32) - np.float32(low)) * scale
+    return np.rint(np.clip(out, 0, 255, out=out), out=out).astype(np.uint8)
+
+
+def volume_to_batch(filename, data, size, window=None, max_slices=None, resample="bicubic",
+                    max_bytes=MAX_VOLUME_BYTES):
+    """Decode a volume upload into an (N, H, W, 3) uint8 batch plus metadata
+
+    Each windowed slice is resized by PIL with the same `resample` filter as
+    image uploads, so a slice scores the same as that slice sent as a PNG.
+    """
+    slices, stored_window, volume_format = read_volume(filename, data, max_slices, max_bytes)
+    if slices.ndim != 3 or slices.shape[0] == 0:
+        raise VolumeError("Volume contains no 2-D slices")
+    if max_slices and slices.shape[0] > max_slices:
+        raise VolumeError(f"Volume has {slices.shape[0]} slices, at most {max_slices} are supported")
+    window = window or stored_window or auto_window(slices)
+
+    gray = np.empty((slices.shape[0], size[1], size[0]), dtype=np.uint8)
+    for start in range(0, slices.shape[0], WINDOW_CHUNK):
+        chunk = window_to_uint8(slices[start:start + WINDOW_CHUNK], window)
+        for i, pixels in enumerate(chunk):
+            gray[start + i] = Image.fromarray(pixels).resize(size, RESAMPLE_FILTERS[resample])
+    # Grey slices become RGB like PIL's convert("RGB") does for "L" images
+    batch = np.repeat(gray[..., None], 3, axis=-1)
+    info = {
+        "format": volume_format,
+        "slices": int(slices.shape[0]),
+        "slice_shape": [int(slices.shape[1]), int(slices.shape[2])],
+        "window": [round(window[0], 3), round(window[1], 3)],
+    }
+    return batch, info
+
+
+def foreground_fraction(batch):
+    """Fraction of non-black pixels in each slice of an (N, H, W, 3) uint8 batch"""
+    return (batch[..., 0] > 10).mean(axis=(1, 2))
+
+
+def aggregate_study(slice_results, no_tumor_class="notumor", min_tumor_fraction=0.1):
+    """Combine per-slice predictions into one study-level prediction
+
+    Slices flagged `skipped` (background only) are ignored. Tumours show on
+    a minority of slices, so the study is called for a tumour class when at
+    least `min_tumor_fraction` of the used slices show one; the tumour class
+    with the highest summed confidence wins.
+    """
+    used = [r for r in slice_results if not r.get("skipped")] or slice_results
+
+    counts = {}
+    confidence_sums = {}
+    for result in used:
+        tumor_type = result["tumor_type"]
+        counts[tumor_type] = counts.get(tumor_type, 0) + 1
+        confidence_sums[tumor_type] = confidence_sums.get(tumor_type, 0.0) + result["confidence"]
+
+    tumor_classes = [t for t in counts if t != no_tumor_class]
+    tumor_slices = sum(counts[t] for t in tumor_classes)
+    if tumor_slices and tumor_slices >= min_tumor_fraction * len(used):
+        tumor_type = max(tumor_classes, key=confidence_sums.get)
+    else:
+        tumor_type = no_tumor_class if no_tumor_class in counts else max(counts, key=confidence_sums.get)
+
+    return {
+        "tumor_type": tumor_type,
+        "confidence": round(confidence_sums[tumor_type] / counts[tumor_type], 2),
+        "slices_used": len(used),
+        "slice_counts": counts,
+    }
@@ -0,0 +1,231 @@
+"""Benchmark preprocessing, the fallback classifier and the API endpoints on synthetic MRI-like images
+
+Runs fully in-process: images are generated locally, the database is a
+throwaway SQLite file and endpoints are called through an ASGI client, so
+no server, dataset or network is needed. Results (throughput and
+p50/p95/p99 latency per case) are printed and written as JSON for tracking
+regressions between runs:
+
+    python benchmark.py --images 64 --concurrency 8 --output benchmark_results.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+# =========================
+# SYNTHETIC IMAGES
+# =========================
+def synthetic_mri(seed, size=512):
+    """A grey axial-slice-like image: skull ring, textured brain, optional bright lesion"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size - 0.5
+    rx, ry = rng.uniform(0.36, 0.44), rng.uniform(0.40, 0.47)
+    radius = np.sqrt((x / rx) ** 2 + (y / ry) ** 2)
+
+    image = np.zeros((size, size), dtype=np.float32)
+    brain = radius < 0.9
+    image[brain] = 0.35 + 0.08 * np.sin(x[brain] * rng.uniform(20, 40)) * np.cos(y[brain] * rng.uniform(20, 40))
+    image[(radius >= 0.9) & (radius < 1.0)] = 0.85  # skull
+
+    if rng.random() < 0.75:
+        cx, cy = rng.uniform(-0.2, 0.2, size=2)
+        lesion = np.sqrt((x - cx) ** 2 + (y - cy) ** 2) < rng.uniform(0.03, 0.12)
+        image[lesion & brain] = rng.uniform(0.6, 0.95)
+
+    image += rng.normal(0, 0.04, image.shape).astype(np.float32)
+    pixels = (np.clip(image, 0, 1) * 255).astype(np.uint8)
+    return Image.fromarray(pixels, mode="L").convert("RGB")
+
+
+def encode(image, image_format="JPEG"):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, quality=92) if image_format == "JPEG" else image.save(buffer, image_format)
+    return buffer.getvalue()
+
+
+# =========================
+# TIMING
+# =========================
+def summarize(latencies, wall_seconds, items=None):
+    """Throughput and latency percentiles for one benchmark case"""
+    latencies_ms = np.asarray(latencies, dtype=np.float64) * 1000
+    items = items if items is not None else len(latencies)
+    return {
+        "count": len(latencies),
+        "items": items,
+        "wall_seconds": round(wall_seconds, 4),
+        "throughput_per_s": round(items / wall_seconds, 2) if wall_seconds else None,
+        "mean_ms": round(float(latencies_ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+    }
+
+
+def time_calls(fn, inputs, items_per_call=1):
+    latencies = []
+    start = time.perf_counter()
+    for value in inputs:
+        t = time.perf_counter()
+        fn(value)
+        latencies.append(time.perf_counter() - t)
+    return summarize(latencies, time.perf_counter() - start, items_per_call * len(inputs))
+
+
+async def time_requests(send, payloads, concurrency):
+    """Issue one request per payload with at most `concurrency` in flight"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def one(payload):
+        nonlocal failures
+        async with semaphore:
+            t = time.perf_counter()
+            response = await send(payload)
+            latencies.append(time.perf_counter() - t)
+            if response.status_code >= 400:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(payload) for payload in payloads))
+    stats = summarize(latencies, time.perf_counter() - start)
+    stats["failures"] = failures
+    stats["concurrency"] = concurrency
+    return stats
+
+
+# =========================
+# BENCHMARK CASES
+# =========================
+def bench_preprocessing(main, images):
+    return {"preprocess_image": time_calls(main.preprocess_image, images)}
+
+
+def bench_fallback(main, images, batch_size):
+    batch = main.preprocess_images([(str(i), data) for i, data in enumerate(images)])
+    singles = [batch[i:i + 1] for i in range(len(batch))]
+    batches = [batch[i:i + batch_size] for i in range(0, len(batch), batch_size)]
+    return {
+        "predict_with_fallback_single": time_calls(main.predict_with_fallback, singles),
+        f"predict_with_fallback_batch_{batch_size}": time_calls(
+            main.fallback.predict_batch, batches, items_per_call=batch_size
+        ),
+    }
+
+
+async def bench_endpoints(main, images, concurrency, users):
+    import httpx
+
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            for path in ("/predict-cnn", "/predict-qml"):
+                results[path] = await time_requests(
+                    lambda data, path=path: client.post(path, files={"file": ("scan.jpg", data, "image/jpeg")}),
+                    images, concurrency
+                )
+
+            accounts = [
+                {
+                    "hospital_name": f"Benchmark Hospital {i % 4}",
+                    "email": f"bench{i}@example.com",
+                    "contact": "0000000000",
+                    "name": f"Bench User {i}",
+                    "address": "Benchmark Lane",
+                    "username": f"bench{i}",
+                    "password": f"bench-password-{i}",
+                }
+                for i in range(users)
+            ]
+            results["/register"] = await time_requests(
+                lambda account: client.post("/register", json=account), accounts, concurrency
+            )
+            results["/login"] = await time_requests(
+                lambda account: client.post(
+                    "/login", json={"username": account["username"], "password": account["password"]}
+                ),
+                accounts, concurrency
+            )
+    return results
+
+
+def print_table(results):
+    print(f"\n{'case':<38}{'items/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    print("-" * 78)
+    for name, stats in results.items():
+        print(
+            f"{name:<38}{stats['throughput_per_s']:>10}{stats['p50_ms']:>10}"
+            f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=64, help="synthetic images per case")
+    parser.add_argument("--size", type=int, default=512, help="synthetic image width/height")
+    parser.add_argument("--batch-size", type=int, default=8, help="batch size for the batched fallback case")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight for endpoint cases")
+    parser.add_argument("--users", type=int, default=16, help="accounts for /register and /login")
+    parser.add_argument("--bcrypt-rounds", type=int, default=None, help="override BCRYPT_ROUNDS")
+    parser.add_argument("--with-cache", action="store_true", help="leave the prediction cache enabled")
+    parser.add_argument("--skip-endpoints", action="store_true", help="only run in-process cases")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON results path")
+    args = parser.parse_args()
+
+    # Configure the app before importing it: throwaway database, no model loading
+    workdir = tempfile.mkdtemp(prefix="brain-tumor-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault("LOAD_MODELS", "0")
+    if not args.with_cache:
+        os.environ["PREDICTION_CACHE_SIZE"] = "0"
+    if args.bcrypt_rounds is not None:
+        os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+
+    from app import main as app_main
+
+    print(f"Generating {args.images} synthetic {args.size}x{args.size} images...")
+    images = [encode(synthetic_mri(seed, args.size)) for seed in range(args.images)]
+
+    results = {}
+    results.update(bench_preprocessing(app_main, images))
+    results.update(bench_fallback(app_main, images, args.batch_size))
+    if not args.skip_endpoints:
+        results.update(asyncio.run(bench_endpoints(app_main, images, args.concurrency, args.users)))
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "config": {
+            **vars(args),
+            "preprocess_mode": app_main.PREPROCESS_MODE,
+            "bcrypt_rounds": app_main.password_hasher.rounds,
+            "inference_max_batch_size": app_main.INFERENCE_MAX_BATCH_SIZE,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print_table(results)
+    print(f"\n✓ Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Build or refresh the fallback feature store for a class-per-subfolder dataset
+
+    python build_feature_store.py "C:\\data\\BrainTumor_1\\Test" --store feature_store/test --summary
+
+Only new or changed images are decoded; rerunning on an unchanged dataset
+just re-stats the files. Calibration scripts and the threshold tuner read
+the features back with FeatureStore(...).labeled() without touching pixels.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import fallback
+from app.feature_store import FeatureStore
+from app.preprocess import PreprocessPool
+
+IMG_SIZE = (160, 160)  # same as app.main
+
+
+def print_summary(store):
+    """Per-class feature ranges, as analyze_actual_tests.py prints them, straight from the store"""
+    features, labels, _ = store.labeled()
+    labels = np.array(labels)
+    print(f"\n{'class':<12}{'n':>6}  " + "".join(f"{name:>24}" for name in fallback.FEATURE_NAMES))
+    for label in sorted(set(labels.tolist())):
+        rows = features[labels == label]
+        ranges = "".join(
+            f"{f'{lo:.3f}-{hi:.3f} ({mean:.3f})':>24}"
+            for lo, hi, mean in zip(rows.min(axis=0), rows.max(axis=0), rows.mean(axis=0))
+        )
+        print(f"{label:<12}{len(rows):>6}  {ranges}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or refresh a fallback feature store")
+    parser.add_argument("root", help="dataset directory with one subfolder per class")
+    parser.add_argument("--store", default="feature_store", help="feature store directory")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="decode processes (0 decodes in this process)")
+    parser.add_argument("--chunk-size", type=int, default=256, help="images decoded per chunk")
+    parser.add_argument("--summary", action="store_true", help="print per-class feature ranges")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.root):
+        raise SystemExit(f"Not a directory: {args.root}")
+
+    store = FeatureStore(args.store, IMG_SIZE)
+    pool = PreprocessPool(IMG_SIZE, workers=args.workers)
+    start = time.perf_counter()
+    try:
+        counts = store.update(args.root, pool, chunk_size=args.chunk_size)
+    finally:
+        pool.shutdown()
+
+    print(f"✓ Feature store {args.store}: {store.rows} rows, {len(store.files)} files "
+          f"({time.perf_counter() - start:.1f}s)")
+    print("  " + ", ".join(f"{name} {count}" for name, count in counts.items()))
+    if args.summary:
+        print_summary(store)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""Check that the compiled fallback scorer matches the original if-chain exactly
+
+    python check_fallback_equivalence.py
+    python check_fallback_equivalence.py --rules app/fallback_rules.json --store feature_store/test
+
+app.fallback scores with a compiled decision table (interval bounds and a
+weight matrix applied with one comparison and a matmul). This script runs it
+side by side with the scalar if-chain that predict_with_fallback used
+before, on random features, on values exactly at and one float step either
+side of every threshold, on features of synthetic images and optionally on
+a feature store, and requires the same label and the same confidence to the
+last byte (compared via repr). With a rule file the reference walks that
+table rule by rule in the same scalar, dict-of-scores way. Exits non-zero if
+any rows differ.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import fallback
+
+
+# =========================
+# REFERENCE IMPLEMENTATIONS
+# =========================
+def decide_reference(scores, mean_intensity, center_concentration, edge_strength, min_confident_score=30):
+    """The original label and confidence logic over a {class: score} dict"""
+    max_score = max(scores.values())
+
+    if max_score < min_confident_score:  # Low confidence - use emergency heuristic
+        if mean_intensity > 0.32:
+            tumor_type = "notumor"
+        elif center_concentration > 0.22:
+            tumor_type = "pituitary"
+        elif edge_strength > 0.075:
+            tumor_type = "meningioma"
+        else:
+            tumor_type = "glioma"
+        confidence = 62.0
+    else:
+        tumor_type = max(scores, key=scores.get)
+        sorted_scores = sorted(scores.values(), reverse=True)
+        score_gap = sorted_scores[0] - sorted_scores[1] if len(sorted_scores) > 1 else sorted_scores[0]
+        # Confidence: Larger gap = higher confidence (range 65-88%)
+        confidence = 65.0 + min(23.0, (score_gap / 5.0))
+        confidence = min(88.0, max(65.0, confidence))
+
+    return tumor_type, round(confidence, 2)
+
+
+def predict_original(row):
+    """The hand-written if-chain from predict_with_fallback, on one feature row"""
+    mean_intensity, median_intensity, entropy, edge_strength, center_concentration = (float(v) for v in row)
+    scores = {"glioma": 0.0, "meningioma": 0.0, "notumor": 0.0, "pituitary": 0.0}
+
+    if entropy < 1.85:
+        scores["glioma"] += 50
+    if mean_intensity < 0.13:
+        scores["glioma"] += 35
+    if median_intensity < 0.03:
+        scores["glioma"] += 40
+    if edge_strength < 0.05:
+        scores["glioma"] += 35
+    if 0.17 < center_concentration < 0.26:
+        scores["glioma"] += 25
+
+    if 1.85 < entropy < 2.20:
+        scores["notumor"] += 45
+    if center_concentration > 0.30:
+        scores["notumor"] += 50
+    if 0.1 < mean_intensity < 0.25:
+        scores["notumor"] += 30
+    if edge_strength < 0.07:
+        scores["notumor"] += 20
+
+    if 2.20 < entropy < 2.50:
+        scores["pituitary"] += 45
+    if 0.17 < mean_intensity < 0.22:
+        scores["pituitary"] += 40
+    if 0.20 < center_concentration < 0.27:
+        scores["pituitary"] += 40
+    if 0.06 < edge_strength < 0.08:
+        scores["pituitary"] += 30
+    if 0.05 < median_intensity < 0.25:
+        scores["pituitary"] += 20
+
+    if entropy > 2.50:
+        scores["meningioma"] += 55
+    if edge_strength > 0.078:
+        scores["meningioma"] += 50
+    if mean_intensity > 0.25:
+        scores["meningioma"] += 40
+    if median_intensity > 0.20:
+        scores["meningioma"] += 35
+    if entropy > 2.55:
+        scores["meningioma"] += 20
+
+    return decide_reference(scores, mean_intensity, center_concentration, edge_strength)
+
+
+def predict_table(row, rules, min_confident_score):
+    """The same scalar walk for any (class, feature, lower, upper, weight) table"""
+    values = {name: float(v) for name, v in zip(fallback.FEATURE_NAMES, row)}
+    scores = {name: 0.0 for name in fallback.CLASS_NAMES}
+    for class_name, feature, lower, upper, weight in rules:
+        value = values[feature]
+        if (lower is None or lower < value) and (upper is None or value < upper):
+            scores[class_name] += weight
+    return decide_reference(
+        scores, values["mean_intensity"], values["center_concentration"], values["edge_strength"],
+        min_confident_score
+    )
+
+
+# =========================
+# INPUTS
+# =========================
+FEATURE_RANGES = {
+    "mean_intensity": (0.0, 0.45),
+    "median_intensity": (0.0, 0.40),
+    "entropy": (1.2, 2.9),
+    "edge_strength": (0.0, 0.12),
+    "center_concentration": (0.0, 0.45),
+}
+
+
+def random_features(n, seed):
+    rng = np.random.default_rng(seed)
+    low, high = zip(*(FEATURE_RANGES[name] for name in fallback.FEATURE_NAMES))
+    return rng.uniform(low, high, size=(n, len(fallback.FEATURE_NAMES)))
+
+
+def boundary_features(rules, n_per_value, seed):
+    """Random rows with one feature set exactly at, or one float step from, a threshold"""
+    edges = [
+        (fallback.FEATURE_INDEX[feature], bound)
+        for _, feature, lower, upper, _ in rules for bound in (lower, upper) if bound is not None
+    ]
+    # The emergency heuristic has thresholds of its own
+    edges += [(fallback.FEATURE_INDEX["mean_intensity"], 0.32),
+              (fallback.FEATURE_INDEX["center_concentration"], 0.22),
+              (fallback.FEATURE_INDEX["edge_strength"], 0.075)]
+    rows = []
+    for n, (feature_id, bound) in enumerate(edges):
+        for value in (np.nextafter(bound, -np.inf), bound, np.nextafter(bound, np.inf)):
+            block = random_features(n_per_value, seed + n)
+            block[:, feature_id] = value
+            rows.append(block)
+    return np.concatenate(rows)
+
+
+def image_features(n, seed):
+    from benchmark import synthetic_mri
+
+    images = np.stack([np.asarray(synthetic_mri(seed + i, 160)) for i in range(n)])
+    # Both extraction paths, as "fast" preprocessing keeps uint8 and "exact" uses floats
+    return np.concatenate([fallback.extract_features(images), fallback.extract_features(images / 255.0)])
+
+
+# =========================
+# MAIN
+# =========================
+def check(name, features, reference):
+    expected = [reference(row) for row in features]
+    actual = fallback.classify_features(features)
+    for i, (want, got) in enumerate(zip(expected, actual)):
+        if repr(want) != repr(got):
+            print(f"✗ {name}: row {i} {features[i].tolist()} gave {got!r}, expected {want!r}")
+            return False
+    print(f"✓ {name}: {len(features)} rows identical")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the compiled fallback scorer with the if-chain")
+    parser.add_argument("--rules", help="rule file to check instead of the built-in table")
+    parser.add_argument("--store", help="also check every row of this feature store")
+    parser.add_argument("--random", type=int, default=200_000, help="random feature rows")
+    parser.add_argument("--images", type=int, default=32, help="synthetic images")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.rules:
+        print(f"Checking rules {fallback.load_rules(args.rules)} from {args.rules}")
+    rules, min_score = fallback.FALLBACK_RULES, fallback.MIN_CONFIDENT_SCORE
+    if args.rules:
+        references = [("rule table", lambda row: predict_table(row, rules, min_score))]
+    else:
+        references = [("original if-chain", predict_original),
+                      ("rule table", lambda row: predict_table(row, rules, min_score))]
+
+    inputs = [
+        ("random", random_features(args.random, args.seed)),
+        ("thresholds", boundary_features(rules, 64, args.seed)),
+        ("synthetic images", image_features(args.images, args.seed)),
+    ]
+    if args.store:
+        from app.feature_store import FeatureStore
+
+        inputs.append(("feature store", FeatureStore(args.store, (160, 160)).labeled()[0]))
+
+    ok = True
+    for reference_name, reference in references:
+        for input_name, features in inputs:
+            ok &= check(f"{input_name} vs {reference_name}", features, reference)
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
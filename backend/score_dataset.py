@@ -0,0 +1,207 @@
+"""Score a class-per-subfolder image dataset with the fallback classifier
+
+    python score_dataset.py "C:\\data\\BrainTumor_1\\Test" --output test_scores.csv
+    python score_dataset.py /data/BrainTumor_1/Train --output train_scores.parquet --workers 8
+
+Every image under <root>/<class>/ is decoded and resized exactly as
+/predict-cnn does (PreprocessPool at IMG_SIZE, bicubic) and classified by
+the same rules as the API (including the tuned rule file at
+FALLBACK_RULES_PATH when there is one), but in chunks: file reads for the
+next chunk are prefetched on a thread pool while a process pool decodes the
+current one. Results stream to CSV (appended per chunk) or Parquet (one part
+file per chunk in <output>/), so an interrupted run picks up where it
+stopped when started again with the same output. Per-class accuracy and a
+confusion matrix are printed at the end.
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import fallback
+from app.feature_store import decode_tolerant, list_dataset, read_files
+from app.preprocess import PreprocessPool
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # only needed for .parquet output
+    pa = pq = None
+
+IMG_SIZE = (160, 160)  # same as app.main
+RULES_PATH = os.environ.get(
+    "FALLBACK_RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "app", "fallback_rules.json")
+)
+COLUMNS = ["path", "label", "prediction", "confidence", "correct", "error"]
+
+
+# =========================
+# SCORING
+# =========================
+def score_chunk(pool, chunk, images):
+    batch, decoded, errors = decode_tolerant(pool, images)
+    predictions = dict(zip(decoded, fallback.predict_batch(batch))) if len(decoded) else {}
+    rows = []
+    for i, (path, label) in enumerate(chunk):
+        if i in errors:
+            rows.append({"path": path, "label": label, "prediction": "", "confidence": None,
+                         "correct": False, "error": errors[i]})
+        else:
+            prediction, confidence = predictions[i]
+            rows.append({"path": path, "label": label, "prediction": prediction, "confidence": confidence,
+                         "correct": prediction == label, "error": ""})
+    return rows
+
+
+# =========================
+# OUTPUT WRITERS
+# =========================
+class CsvResults:
+    """CSV output appended per chunk; existing rows mark the work already done"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, newline="", encoding="utf-8") as f:
+            content = f.read()
+        # An interrupted write can leave a partial last line; keep only complete rows
+        if content and not content.endswith("\n"):
+            content = content[:content.rfind("\n") + 1]
+            with open(self.path, "w", newline="", encoding="utf-8") as f:
+                f.write(content)
+        return [row for row in csv.DictReader(content.splitlines()) if len(row) == len(COLUMNS)]
+
+    def write(self, rows):
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        with open(self.path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            if new_file:
+                writer.writeheader()
+            writer.writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class ParquetResults:
+    """Parquet dataset directory with one part file per chunk, each written atomically"""
+
+    def __init__(self, path):
+        if pq is None:
+            raise SystemExit("Parquet output requires pyarrow (pip install pyarrow), or use a .csv output")
+        self.path = path
+        self.schema = pa.schema([
+            ("path", pa.string()), ("label", pa.string()), ("prediction", pa.string()),
+            ("confidence", pa.float64()), ("correct", pa.bool_()), ("error", pa.string()),
+        ])
+        os.makedirs(path, exist_ok=True)
+
+    def _parts(self):
+        return sorted(name for name in os.listdir(self.path) if name.endswith(".parquet"))
+
+    def load(self):
+        rows = []
+        for name in self._parts():
+            rows.extend(pq.read_table(os.path.join(self.path, name)).to_pylist())
+        return rows
+
+    def write(self, rows):
+        name = f"part-{len(self._parts()):05d}.parquet"
+        tmp = os.path.join(self.path, name + ".tmp")
+        pq.write_table(pa.Table.from_pylist(rows, schema=self.schema), tmp)
+        os.replace(tmp, os.path.join(self.path, name))
+
+
+# =========================
+# REPORT
+# =========================
+def print_report(rows):
+    scored = [row for row in rows if not row["error"]]
+    labels = sorted({row["label"] for row in rows})
+    classes = labels + [c for c in fallback.CLASS_NAMES if c not in labels]
+    index = {name: i for i, name in enumerate(classes)}
+    matrix = np.zeros((len(labels), len(classes)), dtype=np.int64)
+    for row in scored:
+        matrix[index[row["label"]], index[row["prediction"]]] += 1
+
+    errors = len(rows) - len(scored)
+    correct = sum(matrix[i, index[label]] for i, label in enumerate(labels))
+    print("\n" + "=" * 60)
+    print(f"Scored {len(scored)} images ({errors} unreadable)")
+    if scored:
+        print(f"Overall accuracy: {100.0 * correct / len(scored):.2f}%")
+    print("-" * 60)
+    for i, label in enumerate(labels):
+        total = matrix[i].sum()
+        accuracy = 100.0 * matrix[i, index[label]] / total if total else 0.0
+        print(f"{label:<14} {accuracy:6.2f}%  ({matrix[i, index[label]]}/{total})")
+
+    width = max(len(name) for name in classes) + 2
+    print("\nConfusion matrix (rows: true class, columns: predicted)")
+    print(" " * width + "".join(f"{name:>{width}}" for name in classes))
+    for i, label in enumerate(labels):
+        print(f"{label:<{width}}" + "".join(f"{count:>{width}}" for count in matrix[i]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a class-per-subfolder image dataset")
+    parser.add_argument("root", help="dataset directory with one subfolder per class")
+    parser.add_argument("--output", default="scores.csv", help="results .csv file or .parquet directory")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="decode processes (0 decodes in this process)")
+    parser.add_argument("--chunk-size", type=int, default=256, help="images per decode/score chunk")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.root):
+        raise SystemExit(f"Not a directory: {args.root}")
+    # Score with the same rules as the API, including a tuned rule file when there is one
+    if os.path.exists(RULES_PATH):
+        print(f"Using fallback rules {fallback.load_rules(RULES_PATH)} from {RULES_PATH}")
+    results = ParquetResults(args.output) if args.output.endswith(".parquet") else CsvResults(args.output)
+
+    items = list_dataset(args.root)
+    previous = results.load()
+    done = {row["path"] for row in previous}
+    todo = [item for item in items if item[0] not in done]
+    print(f"Found {len(items)} images; {len(done)} already scored, {len(todo)} to go")
+
+    pool = PreprocessPool(IMG_SIZE, workers=args.workers)
+    reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+    chunks = [todo[i:i + args.chunk_size] for i in range(0, len(todo), args.chunk_size)]
+    new_rows = []
+    start = time.perf_counter()
+    try:
+        pending = reader.submit(read_files, args.root, chunks[0]) if chunks else None
+        for n, chunk in enumerate(chunks):
+            images = pending.result()
+            # Read the next chunk from disk while this one is decoded and scored
+            pending = reader.submit(read_files, args.root, chunks[n + 1]) if n + 1 < len(chunks) else None
+            rows = score_chunk(pool, chunk, images)
+            results.write(rows)
+            new_rows.extend(rows)
+
+            scored = len(new_rows)
+            rate = scored / (time.perf_counter() - start)
+            print(f"✓ {len(done) + scored}/{len(items)} images ({rate:.1f} img/s)")
+    except KeyboardInterrupt:
+        print(f"\n✗ Interrupted; {len(done) + len(new_rows)} images saved, rerun to resume")
+        return
+    finally:
+        reader.shutdown(wait=False, cancel_futures=True)
+        pool.shutdown()
+
+    print_report([
+        {**row, "error": row.get("error") or ""} for row in previous + new_rows
+    ])
+
+
+if __name__ == "__main__":
+    main()
@@ -6,125 +6,19 @@ sys.path.insert(0, os.path.dirname(__file__))
 import numpy as np
 from PIL import Image
 
-# Directly import the prediction logic
+from app import fallback
+
+# Use the same rules as the API, including a tuned rule file when there is one
+RULES_PATH = os.environ.get(
+    "FALLBACK_RULES_PATH", os.path.join(os.path.dirname(__file__), "app", "fallback_rules.json")
+)
+if os.path.exists(RULES_PATH):
+    print(f"Using fallback rules {fallback.load_rules(RULES_PATH)} from {RULES_PATH}")
+
 def predict_with_fallback_direct(image_array):
-    """Predict tumor type using advanced image analysis"""
-    img = image_array[0] if len(image_array.shape) == 4 else image_array
-    flat = img.flatten()
-    
-    # Calculate comprehensive statistics
-    mean_intensity = np.mean(flat)
-    std_intensity = np.std(flat)
-    median_intensity = np.median(flat)
-    min_intensity = np.min(flat)
-    max_intensity = np.max(flat)
-    contrast = max_intensity - min_intensity
-    
-    # Analyze image texture and edges
-    if len(flat) > 1:
-        diffs = np.abs(np.diff(flat))
-        edge_strength = np.sum(diffs > 0.05) / len(diffs)
-        edge_mean = np.mean(diffs)
-    else:
-        edge_strength = 0
-        edge_mean = 0
-    
-    # Analyze histogram distribution
-    hist, _ = np.histogram(flat, bins=10)
-    hist_norm = hist / np.sum(hist)
-    entropy = -np.sum(hist_norm[hist_norm > 0] * np.log2(hist_norm[hist_norm > 0] + 1e-10))
-    
-    # Analyze spatial patterns
-    h, w = img.shape[:2]
-    center = img[h//4:3*h//4, w//4:3*w//4]
-    corners = np.concatenate([
-        img[:h//4, :w//4].flatten(),
-        img[:h//4, 3*w//4:].flatten(),
-        img[3*h//4:, :w//4].flatten(),
-        img[3*h//4:, 3*w//4:].flatten()
-    ])
-    
-    center_mean = np.mean(center)
-    corners_mean = np.mean(corners) if len(corners) > 0 else 0
-    center_concentration = center_mean - corners_mean
-    
-    # Initialize tumor scores
-    scores = {
-        "glioma": 0.0,
-        "meningioma": 0.0,
-        "notumor": 0.0,
-        "pituitary": 0.0
-    }
-    
-    # NOTUMOR: Brain without tumors
-    if mean_intensity > 0.30:
-        scores["notumor"] += 50
-    if median_intensity > 0.25:
-        scores["notumor"] += 45
-    if center_concentration < 0.18:
-        scores["notumor"] += 40
-    if entropy > 2.35:
-        scores["notumor"] += 35
-    
-    # GLIOMA: Diffuse tumor
-    if mean_intensity < 0.12:
-        scores["glioma"] += 40
-    if 0.19 < center_concentration < 0.27:
-        scores["glioma"] += 45
-    if entropy < 1.75:
-        scores["glioma"] += 35
-    if median_intensity < 0.05:
-        scores["glioma"] += 40
-    if std_intensity > 0.13:
-        scores["glioma"] += 15
-    
-    # MENINGIOMA: Well-defined tumor
-    if edge_strength > 0.076:
-        scores["meningioma"] += 50
-    if 0.10 < mean_intensity < 0.14:
-        scores["meningioma"] += 35
-    if center_concentration < 0.12:
-        scores["meningioma"] += 40
-    if 0.08 < median_intensity < 0.10:
-        scores["meningioma"] += 30
-    if 1.85 < entropy < 1.95:
-        scores["meningioma"] += 25
-    if edge_mean > 0.014:
-        scores["meningioma"] += 15
-    
-    # PITUITARY: Small, compact tumor
-    if center_concentration > 0.19:
-        scores["pituitary"] += 45
-    if 0.16 < mean_intensity < 0.19:
-        scores["pituitary"] += 40
-    if 2.2 < entropy < 2.36:
-        scores["pituitary"] += 30
-    if 0.13 < median_intensity < 0.15:
-        scores["pituitary"] += 28
-    if edge_strength < 0.070:
-        scores["pituitary"] += 20
-    
-    # Determine prediction
-    max_score = max(scores.values())
-    
-    if max_score < 30:
-        if mean_intensity > 0.32:
-            tumor_type = "notumor"
-        elif center_concentration > 0.22:
-            tumor_type = "pituitary"
-        elif edge_strength > 0.075:
-            tumor_type = "meningioma"
-        else:
-            tumor_type = "glioma"
-        confidence = 62.0
-    else:
-        tumor_type = max(scores, key=scores.get)
-        sorted_scores = sorted(scores.values(), reverse=True)
-        score_gap = sorted_scores[0] - sorted_scores[1] if len(sorted_scores) > 1 else sorted_scores[0]
-        confidence = 65.0 + min(23.0, (score_gap / 5.0))
-        confidence = min(88.0, max(65.0, confidence))
-    
-    return tumor_type, round(confidence, 2)
+    """Predict tumor type with the API's fallback classifier (first image of a batch)"""
+    img = image_array[:1] if len(image_array.shape) == 4 else image_array
+    return fallback.predict_batch(img)[0]
 
 
 # Test images
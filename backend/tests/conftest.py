@@ -0,0 +1,17 @@
+"""Configure app.main for the tests before any test module imports it"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Throwaway database, no models or audit log, no cache, and a wide batching
+# window so concurrent test requests share micro-batches
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+os.environ["PREDICTION_CACHE_SIZE"] = "0"
+os.environ["INFERENCE_MAX_WAIT_MS"] = "100"
+os.environ["INFERENCE_MAX_BATCH_SIZE"] = "64"
+os.environ["AUDIT_LOG"] = "0"
+os.environ["LOAD_MODELS"] = "0"
+os.environ.pop("PREPROCESS_MODE", None)
+os.environ.pop("REQUIRE_AUTH", None)
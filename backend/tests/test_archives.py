@@ -0,0 +1,78 @@
+"""Archive uploads are bounded before their members are inflated"""
+import io
+import os
+import sys
+import tarfile
+import zipfile
+
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import main
+
+
+def make_tar(members, mode="w:gz"):
+    """A tar of (name, bytes) members; None instead of bytes makes a directory"""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as archive:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            if data is None:
+                info.type = tarfile.DIRTYPE
+                archive.addfile(info)
+            else:
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def make_zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def status(filename, data, max_images=8):
+    with pytest.raises(HTTPException) as error:
+        main.extract_archive_images(filename, data, max_images)
+    return error.value.status_code, error.value.detail
+
+
+@pytest.mark.parametrize("filename, build", [
+    ("scans.tar.gz", make_tar), ("scans.tar", lambda m: make_tar(m, "w")), ("scans.zip", make_zip),
+])
+def test_images_are_extracted_sorted(filename, build):
+    data = build([("b.png", b"2"), ("notes.txt", b"skip"), ("a/c.jpg", b"3"), ("a.png", b"1")])
+    assert main.extract_archive_images(filename, data) == [("a.png", b"1"), ("a/c.jpg", b"3"), ("b.png", b"2")]
+
+
+def test_non_archives_are_left_alone():
+    assert main.extract_archive_images("scan.png", b"\x89PNG not an archive") is None
+
+
+def test_tar_stops_reading_after_one_image_too_many():
+    data = make_tar([(f"{i:03d}.png", b"") for i in range(9)])
+    # Anything after the ninth header is never read, so a corrupt tail makes no difference
+    code, detail = status("scans.tar.gz", data + b"\x1f\x8b corrupt tail")
+    assert code == 413 and "at most" in detail
+
+
+def test_tar_with_too_many_entries_is_rejected(monkeypatch):
+    monkeypatch.setattr(main, "MAX_ARCHIVE_ENTRIES", 50)
+    data = make_tar([(f"dir{i}", None) for i in range(51)])
+    code, detail = status("scans.tar.gz", data + b"\x1f\x8b corrupt tail")
+    assert code == 413 and "more than 50 entries" in detail
+
+
+def test_oversized_members_are_rejected_from_their_headers(monkeypatch):
+    monkeypatch.setattr(main, "MAX_ARCHIVE_MEMBER_BYTES", 1000)
+    monkeypatch.setattr(main, "MAX_ARCHIVE_TOTAL_BYTES", 3000)
+    assert "larger than" in status("scans.tar.gz", make_tar([("big.png", bytes(1001))]))[1]
+    assert "larger than" in status("scans.zip", make_zip([("big.png", bytes(1001))]))[1]
+    # Non-image members of a tar still have to be inflated to skip them
+    assert "expands to more" in status("scans.tar.gz", make_tar([("a.bin", bytes(2000)), ("b.bin", bytes(2000))]))[1]
+    assert "expands to more" in status("scans.zip", make_zip([(f"{i}.png", bytes(900)) for i in range(4)]))[1]
@@ -0,0 +1,113 @@
+"""AuditLogWriter batches and the prediction rollups it maintains"""
+import os
+import sys
+import threading
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.audit import AuditLogWriter
+from app.database import Base
+from app.models import Prediction, PredictionDailyRollup, PredictionRollup
+from app.prediction_stats import prediction_stats, rebuild_rollups
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'audit.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def row(tumor_type="glioma", confidence=81.0, hospital="St Mary", model="cnn", day=18):
+    return {
+        "created_at": datetime(2026, 10, day, 9, 30), "username": "doctor", "hospital_name": hospital,
+        "model": model, "model_version": "v1", "tumor_type": tumor_type, "confidence": confidence,
+        "image_sha256": "0" * 64, "filename": "scan.png", "latency_ms": 12.0, "cached": False,
+    }
+
+
+ROWS = [
+    row("glioma", 81.0), row("glioma", 89.0), row("notumor", 65.0, day=17),
+    row("pituitary", 70.0, hospital=None), row("glioma", 75.0, model="qml"),
+]
+
+
+def count(session_factory, column=Prediction.id):
+    with session_factory() as db:
+        return db.execute(select(func.count(column))).scalar()
+
+
+def test_rows_are_written_in_batches_with_their_rollups(session_factory):
+    writer = AuditLogWriter(session_factory, batch_size=2, flush_interval=0.05)
+    writer.record(ROWS)
+    writer.shutdown()
+
+    stats = writer.stats()
+    assert stats["written"] == len(ROWS) and stats["failed"] == 0 and stats["pending"] == 0
+    assert stats["batches"] >= 3
+    assert count(session_factory) == len(ROWS)
+
+    with session_factory() as db:
+        hospital = prediction_stats(db, hospital_name="St Mary", since=date(2026, 10, 1))
+        anonymous = prediction_stats(db, hospital_name="")
+        cnn = prediction_stats(db, hospital_name="St Mary", model="cnn")
+    assert hospital["total"] == 4
+    glioma = hospital["by_tumor_type"]["glioma"]
+    assert glioma["count"] == 3 and glioma["mean_confidence"] == round((81 + 89 + 75) / 3, 2)
+    assert glioma["confidence_histogram"][8] == 2 and glioma["confidence_histogram"][7] == 1
+    assert hospital["daily"] == [{"day": "2026-10-17", "counts": {"notumor": 1}},
+                                 {"day": "2026-10-18", "counts": {"glioma": 3}}]
+    assert anonymous["by_tumor_type"] == {
+        "pituitary": {"count": 1, "confidence_histogram": [0] * 7 + [1, 0, 0], "mean_confidence": 70.0}
+    }
+    assert cnn["by_tumor_type"]["glioma"]["count"] == 2
+
+
+def test_rebuilt_rollups_match_the_incremental_ones(session_factory):
+    writer = AuditLogWriter(session_factory, batch_size=2, flush_interval=0.05)
+    writer.record(ROWS)
+    writer.shutdown()
+    with session_factory() as db:
+        incremental = prediction_stats(db, since=date(2026, 10, 1))
+        # Rollups are only rebuilt when empty
+        assert rebuild_rollups(db) == 0
+        db.query(PredictionRollup).delete()
+        db.query(PredictionDailyRollup).delete()
+        db.commit()
+        assert rebuild_rollups(db, batch_size=2) == len(ROWS)
+        assert prediction_stats(db, since=date(2026, 10, 1)) == incremental
+
+
+def test_full_queue_drops_rows_instead_of_blocking(session_factory):
+    entered, release = threading.Event(), threading.Event()
+
+    def slow_session():
+        entered.set()
+        release.wait(5)
+        return session_factory()
+
+    writer = AuditLogWriter(slow_session, batch_size=1, flush_interval=0.01, max_queue=3)
+    writer.record(ROWS[:1])
+    assert entered.wait(5)  # the writer is now stuck on its first batch
+    writer.record(ROWS)
+    assert writer.stats()["dropped"] == len(ROWS) - 3
+    release.set()
+    writer.shutdown()
+    assert writer.stats()["written"] == 4
+    assert count(session_factory) == 4
+
+
+def test_failed_batch_is_counted_and_rolled_back(session_factory):
+    writer = AuditLogWriter(session_factory, batch_size=10, flush_interval=0.05)
+    writer.record([row(), dict(row(), tumor_type=None)])
+    writer.shutdown()
+    stats = writer.stats()
+    assert stats["failed"] == 2 and stats["written"] == 0 and stats["last_error"]
+    assert count(session_factory) == 0
+    assert count(session_factory, PredictionRollup.count) == 0
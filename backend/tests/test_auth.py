@@ -0,0 +1,66 @@
+"""Session tokens on the prediction endpoints, with and without REQUIRE_AUTH"""
+import asyncio
+import os
+import sys
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import main
+from app.tokens import TokenSigner
+from benchmark import encode, synthetic_mri
+
+# Signed with another key, like a token saved in the browser before a restart without SESSION_SECRET
+STALE_TOKEN = TokenSigner(b"previous-process-key").issue({"sub": "doctor", "hospital_id": 1})
+
+
+def bearer(token):
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+def test_valid_token_gives_its_claims():
+    token = main.token_signer.issue({"sub": "doctor", "hospital_id": 1})
+    assert main.get_current_user(bearer(token))["sub"] == "doctor"
+
+
+def test_invalid_token_is_anonymous_when_auth_is_optional(monkeypatch):
+    monkeypatch.setattr(main, "REQUIRE_AUTH", False)
+    assert main.get_current_user(bearer(STALE_TOKEN)) is None
+    assert main.get_current_user(None) is None
+
+
+def test_invalid_token_is_rejected_when_auth_is_required(monkeypatch):
+    monkeypatch.setattr(main, "REQUIRE_AUTH", True)
+    for credentials in (bearer(STALE_TOKEN), None):
+        with pytest.raises(HTTPException) as error:
+            main.get_current_user(credentials)
+        assert error.value.status_code == 401
+
+
+def test_history_still_needs_a_valid_token(monkeypatch):
+    monkeypatch.setattr(main, "REQUIRE_AUTH", False)
+    with pytest.raises(HTTPException) as error:
+        main.require_current_user(main.get_current_user(bearer(STALE_TOKEN)))
+    assert error.value.status_code == 401
+
+
+def test_stale_token_can_still_predict(monkeypatch):
+    monkeypatch.setattr(main, "REQUIRE_AUTH", False)
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with main.app.router.lifespan_context(main.app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.post(
+                    "/predict-cnn",
+                    files={"file": ("scan.png", encode(synthetic_mri(0, 160), "PNG"), "image/png")},
+                    headers={"Authorization": f"Bearer {STALE_TOKEN}"},
+                )
+
+    response = asyncio.run(run())
+    assert response.status_code == 200, response.text
+    assert response.json()["tumor_type"]
@@ -0,0 +1,96 @@
+"""PredictionCache expiry, LRU eviction, version-keyed invalidation and the SQLite tier"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import fallback, main
+from app.cache import PredictionCache
+
+RESULT = {"tumor_type": "glioma", "confidence": 80.0}
+
+
+class Clock:
+    """Stands in for time.time so expiry can be tested without sleeping"""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_hit_and_miss():
+    cache = PredictionCache(max_entries=4)
+    key = PredictionCache.make_key(b"image", "cnn", "v1")
+    assert cache.get(key) is None
+    cache.put(key, RESULT)
+    assert cache.get(key) == RESULT
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, "time", clock)
+    cache = PredictionCache(max_entries=4, ttl_seconds=60)
+    cache.put("key", RESULT)
+
+    clock.now += 59
+    assert cache.get("key") == RESULT
+    clock.now += 2
+    assert cache.get("key") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = PredictionCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_a_new_model_version_misses():
+    cache = PredictionCache(max_entries=4)
+    cache.put(PredictionCache.make_key(b"image", "cnn", "v1"), RESULT)
+    assert cache.get(PredictionCache.make_key(b"image", "cnn", "v2")) is None
+    assert cache.get(PredictionCache.make_key(b"image", "qml", "v1")) is None
+    assert cache.get(PredictionCache.make_key(b"other", "cnn", "v1")) is None
+
+
+def test_new_fallback_rules_change_the_model_version(monkeypatch):
+    before = main.model_version("cnn")
+    monkeypatch.setattr(fallback, "RULES_VERSION", "tuned-test")
+    assert main.model_version("cnn") != before
+    assert "tuned-test" in main.model_version("cnn")
+
+
+def test_disabled_cache_stores_nothing():
+    cache = PredictionCache(max_entries=0)
+    cache.put("key", RESULT)
+    assert cache.get("key") is None
+    assert not cache.stats()["enabled"]
+
+
+def test_sqlite_tier_survives_a_restart_and_honours_the_ttl(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, "time", clock)
+    path = str(tmp_path / "cache.db")
+    cache = PredictionCache(max_entries=4, ttl_seconds=60, sqlite_path=path)
+    cache.put_many([("a", 1), ("b", {"nested": [2]})])
+    cache.close()
+
+    reopened = PredictionCache(max_entries=4, ttl_seconds=60, sqlite_path=path)
+    assert reopened.get("a") == 1
+    assert reopened.get("b") == {"nested": [2]}
+    assert reopened.stats()["disk_hits"] == 2
+    reopened.close()
+
+    clock.now += 61
+    expired = PredictionCache(max_entries=4, ttl_seconds=60, sqlite_path=path)
+    assert expired.get("a") is None
+    expired.close()
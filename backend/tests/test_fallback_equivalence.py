@@ -0,0 +1,72 @@
+"""The compiled fallback scorer against the scalar references in check_fallback_equivalence.py"""
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import fallback
+from check_fallback_equivalence import (
+    boundary_features, check, image_features, predict_original, predict_table, random_features
+)
+
+RULES_PATH = os.environ.get(
+    "FALLBACK_RULES_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "fallback_rules.json"),
+)
+
+
+@pytest.fixture
+def restore_rules(monkeypatch):
+    """Undo load_rules after the test"""
+    for name in ("RULES_VERSION", "FALLBACK_RULES", "MIN_CONFIDENT_SCORE"):
+        monkeypatch.setattr(fallback, name, getattr(fallback, name))
+
+
+def inputs(rules, seed=0):
+    return [
+        ("random", random_features(20_000, seed)),
+        ("thresholds", boundary_features(rules, 16, seed)),
+        ("synthetic images", image_features(8, seed)),
+    ]
+
+
+def check_table(reference_name, reference):
+    for input_name, features in inputs(fallback.FALLBACK_RULES):
+        assert check(f"{input_name} vs {reference_name}", features, reference)
+
+
+def test_built_in_table_matches_the_original_if_chain():
+    check_table("original if-chain", predict_original)
+
+
+def test_built_in_table_matches_the_rule_walk():
+    rules, min_score = fallback.FALLBACK_RULES, fallback.MIN_CONFIDENT_SCORE
+    check_table("rule table", lambda row: predict_table(row, rules, min_score))
+
+
+def test_a_tuned_rule_file_matches_the_rule_walk(tmp_path, restore_rules):
+    # The kind of table tune_thresholds.py writes: moved and opened bounds, new weights and cut-off
+    rng = np.random.default_rng(0)
+    tuned = []
+    for class_name, feature, lower, upper, weight in fallback.FALLBACK_RULES:
+        lower = None if lower is None or rng.random() < 0.2 else round(lower * rng.uniform(0.8, 1.2), 4)
+        upper = None if upper is None or rng.random() < 0.2 else round(upper * rng.uniform(0.8, 1.2), 4)
+        tuned.append((class_name, feature, lower, upper, int(rng.integers(0, 21)) * 5))
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(fallback.rules_to_dict(tuple(tuned), "test-tuned", 45.0)))
+
+    assert fallback.load_rules(str(path)) == "test-tuned"
+    rules, min_score = fallback.FALLBACK_RULES, fallback.MIN_CONFIDENT_SCORE
+    assert min_score == 45.0
+    check_table("tuned rule table", lambda row: predict_table(row, rules, min_score))
+
+
+@pytest.mark.skipif(not os.path.exists(RULES_PATH), reason="no tuned rule file")
+def test_the_deployed_rule_file_matches_the_rule_walk(restore_rules):
+    fallback.load_rules(RULES_PATH)
+    rules, min_score = fallback.FALLBACK_RULES, fallback.MIN_CONFIDENT_SCORE
+    check_table("deployed rule table", lambda row: predict_table(row, rules, min_score))
@@ -0,0 +1,141 @@
+"""Feature head features, training, the .npz format and serving as a model tier"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import fallback, main
+from app.feature_head import FEATURE_NAMES, HIST_BINS, STAT_NAMES, FeatureHead, extract_features, softmax
+from app.feature_store import decode_tolerant, read_files
+from app.preprocess import PreprocessPool
+from benchmark import encode, synthetic_mri
+from train_head import fit
+
+BATCH = np.stack([np.asarray(synthetic_mri(seed, 64)) for seed in range(6)])
+
+
+def reference_features(image):
+    """STAT_NAMES and the histogram of one uint8 image, the slow NumPy way"""
+    x = image.reshape(-1) / 255.0
+    mean, std = x.mean(), x.std()
+    stats = [mean, std, x.min(), x.max(), np.median(x), np.percentile(x, 25), np.percentile(x, 75), x.var(),
+             ((x - mean) ** 3).mean() / std ** 3, ((x - mean) ** 4).mean() / std ** 4 - 3.0]
+    hist = np.histogram(image.reshape(-1), bins=HIST_BINS, range=(0, 256))[0] / x.size
+    return np.concatenate([stats, hist])
+
+
+def random_head(seed=0, version="test-head"):
+    rng = np.random.default_rng(seed)
+    n = len(FEATURE_NAMES)
+    return FeatureHead(rng.normal(size=(n, 4)), rng.normal(size=4), rng.normal(size=n),
+                       rng.uniform(0.5, 2, size=n), fallback.CLASS_NAMES, version)
+
+
+def test_features_match_numpy_statistics():
+    features = extract_features(BATCH)
+    assert features.shape == (len(BATCH), len(FEATURE_NAMES))
+    for image, row in zip(BATCH, features):
+        np.testing.assert_allclose(row[:len(STAT_NAMES) + HIST_BINS], reference_features(image), rtol=1e-9, atol=1e-12)
+    np.testing.assert_array_equal(features[:, len(STAT_NAMES) + HIST_BINS:], fallback.extract_features(BATCH))
+
+
+def test_float_batches_get_the_same_features():
+    np.testing.assert_array_equal(extract_features(BATCH / 255.0), extract_features(BATCH))
+
+
+def test_constant_image_has_zero_skewness_and_kurtosis():
+    features = extract_features(np.full((1, 8, 8, 3), 128, dtype=np.uint8))[0]
+    assert features[FEATURE_NAMES.index("skewness")] == 0.0
+    assert features[FEATURE_NAMES.index("kurtosis")] == 0.0
+
+
+def test_fit_learns_separable_classes():
+    rng = np.random.default_rng(0)
+    labels = np.repeat(np.arange(4), 50)
+    features = rng.normal(size=(200, len(FEATURE_NAMES))) + 3 * np.eye(4, len(FEATURE_NAMES))[labels]
+    weights, bias, mean, scale = fit(features, labels, 4, l2=1e-3, iterations=300, learning_rate=0.5)
+    head = FeatureHead(weights, bias, mean, scale, fallback.CLASS_NAMES, "fit")
+    assert (head.predict_features(features).argmax(axis=1) == labels).mean() > 0.95
+
+
+def test_save_and_load_round_trip(tmp_path):
+    head = random_head()
+    path = str(tmp_path / "head.npz")
+    head.save(path, holdout_accuracy=np.array(0.5))
+    loaded = FeatureHead.load(path)
+    assert loaded.version == "test-head" and loaded.classes == fallback.CLASS_NAMES
+    np.testing.assert_array_equal(loaded.predict(BATCH), head.predict(BATCH))
+    with np.load(path) as data:
+        assert float(data["holdout_accuracy"]) == 0.5
+
+    probabilities = loaded.predict(BATCH)
+    expected = softmax((extract_features(BATCH) - head.mean) / head.scale @ head.weights + head.bias)
+    np.testing.assert_allclose(probabilities, expected)
+    np.testing.assert_allclose(probabilities.sum(axis=1), 1.0)
+    for (tumor_type, confidence), p in zip(loaded.classify(probabilities), probabilities):
+        assert tumor_type == fallback.CLASS_NAMES[p.argmax()]
+        assert confidence == round(float(p.max()) * 100, 2)
+
+
+@pytest.mark.parametrize("change, message", [
+    ({"format": 99}, "Unsupported feature head format"),
+    ({"feature_names": np.array(["mean"])}, "different features"),
+    ({"weights": np.zeros((3, 4))}, "weights have shape"),
+])
+def test_load_rejects_incompatible_files(tmp_path, change, message):
+    path = str(tmp_path / "head.npz")
+    random_head().save(path)
+    with np.load(path) as data:
+        arrays = {key: data[key] for key in data.files}
+    np.savez(path, **dict(arrays, **change))
+    with pytest.raises(ValueError, match=message):
+        FeatureHead.load(path)
+
+
+def test_head_tier_serves_predictions(monkeypatch):
+    head = random_head(version="served")
+    monkeypatch.setattr(main, "feature_head", head)
+    monkeypatch.setitem(main.MODEL_TIER, "cnn", "head")
+
+    assert main.serving_model("cnn") == ("head", head)
+    assert main.model_version("cnn").startswith("head-served-")
+    results = main.run_inference_batch("cnn", BATCH)
+    assert [r["model"] for r in results] == [f"{main.MODEL_NAMES['cnn']} (Feature Head)"] * len(BATCH)
+    assert [(r["tumor_type"], r["confidence"]) for r in results] == head.classify(head.predict(BATCH))
+
+
+def test_tier_choice(monkeypatch):
+    head = random_head()
+    monkeypatch.setattr(main, "feature_head", head)
+    monkeypatch.setattr(main, "cml_model", None)
+    monkeypatch.setitem(main.MODEL_TIER, "cnn", "auto")
+    # No TensorFlow model loaded: auto falls through to the head
+    assert main.serving_model("cnn") == ("head", head)
+    monkeypatch.setitem(main.MODEL_TIER, "cnn", "fallback")
+    assert main.serving_model("cnn") == ("fallback", None)
+    monkeypatch.setattr(main, "feature_head", None)
+    monkeypatch.setitem(main.MODEL_TIER, "cnn", "head")
+    assert main.serving_model("cnn") == ("fallback", None)
+
+
+def test_decode_tolerant_skips_unreadable_and_undecodable_files(tmp_path):
+    root = str(tmp_path)
+    os.makedirs(os.path.join(root, "glioma"))
+    for name, data in (("a.png", encode(synthetic_mri(0, 64), "PNG")), ("bad.png", b"nope"),
+                       ("c.png", encode(synthetic_mri(1, 64), "PNG"))):
+        with open(os.path.join(root, "glioma", name), "wb") as f:
+            f.write(data)
+    chunk = [("glioma/a.png", "glioma"), ("glioma/missing.png", "glioma"),
+             ("glioma/bad.png", "glioma"), ("glioma/c.png", "glioma")]
+    pool = PreprocessPool((32, 24))
+
+    batch, decoded, errors = decode_tolerant(pool, read_files(root, chunk))
+    assert decoded == [0, 3]
+    assert sorted(errors) == [1, 2] and errors[2].startswith("decode failed")
+    assert batch.shape == (2, 24, 32, 3)
+
+    batch, decoded, errors = decode_tolerant(pool, read_files(root, chunk[1:3]))
+    assert batch.shape == (0, 24, 32, 3) and decoded == [] and len(errors) == 2
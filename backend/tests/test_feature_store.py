@@ -0,0 +1,129 @@
+"""Incremental FeatureStore updates"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import fallback, feature_store
+from app.feature_store import FeatureStore
+from app.preprocess import PreprocessPool
+from benchmark import encode, synthetic_mri
+
+SIZE = (160, 160)
+
+
+def png(seed):
+    return encode(synthetic_mri(seed, 200), "PNG")
+
+
+def write(root, path, data):
+    path = os.path.join(root, path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    # Bump the mtime explicitly; writes within one clock tick can share one
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    root = str(tmp_path / "data")
+    write(root, "glioma/a.png", png(0))
+    write(root, "glioma/b.png", png(1))
+    write(root, "notumor/c.png", png(2))
+    write(root, "notumor/copy-of-a.png", png(0))
+    write(root, "notumor/readme.txt", b"not an image")
+    return root
+
+
+def update(store_path, root):
+    store = FeatureStore(store_path, SIZE)
+    return store, store.update(root, PreprocessPool(SIZE))
+
+
+def test_first_build_computes_each_distinct_image_once(tmp_path, dataset):
+    store, counts = update(str(tmp_path / "store"), dataset)
+    assert counts == {"unchanged": 0, "reused": 0, "computed": 4, "failed": 0, "removed": 0}
+    assert store.rows == 3  # a.png and copy-of-a.png share a row
+
+    features, labels, paths = store.labeled()
+    assert paths == ["glioma/a.png", "glioma/b.png", "notumor/c.png", "notumor/copy-of-a.png"]
+    assert labels == ["glioma", "glioma", "notumor", "notumor"]
+    expected = fallback.extract_features(PreprocessPool(SIZE).decode_batch([png(0), png(1), png(2), png(0)]))
+    np.testing.assert_array_equal(features, expected)
+    np.testing.assert_array_equal(store.column("entropy"), expected[:3, fallback.FEATURE_INDEX["entropy"]])
+
+
+def test_rerun_only_touches_what_changed(tmp_path, dataset):
+    store_path = str(tmp_path / "store")
+    update(store_path, dataset)
+
+    _, counts = update(store_path, dataset)
+    assert counts == {"unchanged": 4, "reused": 0, "computed": 0, "failed": 0, "removed": 0}
+
+    write(dataset, "glioma/b.png", png(1))  # touched, same content
+    write(dataset, "notumor/c.png", png(3))  # new content
+    write(dataset, "pituitary/d.png", png(2))  # content already in the store
+    os.remove(os.path.join(dataset, "glioma/a.png"))
+    store, counts = update(store_path, dataset)
+    assert counts == {"unchanged": 1, "reused": 2, "computed": 1, "failed": 0, "removed": 1}
+    assert store.rows == 4
+    assert sorted(store.files) == ["glioma/b.png", "notumor/c.png", "notumor/copy-of-a.png", "pituitary/d.png"]
+
+
+def test_store_grows_past_its_capacity(tmp_path, dataset, monkeypatch):
+    monkeypatch.setattr(feature_store, "INITIAL_CAPACITY", 2)
+    store_path = str(tmp_path / "store")
+    for seed in range(10, 15):
+        write(dataset, f"meningioma/{seed}.png", png(seed))
+    store = FeatureStore(store_path, SIZE)
+    store.update(dataset, PreprocessPool(SIZE), chunk_size=2)
+    features, _, paths = FeatureStore(store_path, SIZE).labeled()
+    assert store.rows == 8 and len(paths) == 9
+    expected = fallback.extract_features(PreprocessPool(SIZE).decode_batch([png(14)]))
+    # Batch shape can change the last bit of a BLAS sum, so compare to rounding error
+    np.testing.assert_allclose(features[paths.index("meningioma/14.png")], expected[0], rtol=1e-12)
+
+
+def test_undecodable_files_are_remembered_by_hash(tmp_path, dataset):
+    store_path = str(tmp_path / "store")
+    write(dataset, "glioma/broken.png", b"\x89PNG truncated")
+    store, counts = update(store_path, dataset)
+    assert counts["failed"] == 1 and counts["computed"] == 4
+    assert "glioma/broken.png" not in store.files
+    assert len(store.failed) == 1
+
+    # The same bytes under another name are not decoded again either
+    write(dataset, "pituitary/also-broken.png", b"\x89PNG truncated")
+    store = FeatureStore(store_path, SIZE)
+
+    class NoDecode:
+        size = SIZE
+
+        def decode_batch(self, images):
+            raise AssertionError("known bad image decoded again")
+
+    counts = store.update(dataset, NoDecode())
+    assert counts == {"unchanged": 4, "reused": 0, "computed": 0, "failed": 2, "removed": 0}
+
+
+def test_file_that_becomes_undecodable_loses_its_row(tmp_path, dataset):
+    store_path = str(tmp_path / "store")
+    update(store_path, dataset)
+    write(dataset, "glioma/b.png", b"corrupted")
+    store, counts = update(store_path, dataset)
+    assert counts["failed"] == 1
+    assert "glioma/b.png" not in store.files
+    assert "glioma/b.png" not in FeatureStore(store_path, SIZE).labeled()[2]
+
+
+def test_other_settings_start_a_new_store(tmp_path, dataset):
+    store_path = str(tmp_path / "store")
+    update(store_path, dataset)
+    store = FeatureStore(store_path, SIZE, resample="bilinear")
+    assert store.rows == 0 and not store.files
+    assert store.update(dataset, PreprocessPool(SIZE, resample="bilinear"))["computed"] == 4
@@ -0,0 +1,38 @@
+"""Which dtype each serving tier receives from classify_batch"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import fallback, main
+from benchmark import synthetic_mri
+
+BATCH = np.stack([np.asarray(synthetic_mri(seed, 160)) for seed in range(4)])
+
+
+class RecordingModel:
+    """Stands in for a Keras model and remembers the batch it was given"""
+
+    def predict(self, batch):
+        self.batch = batch
+        return np.tile([0.1, 0.2, 0.3, 0.4], (len(batch), 1))
+
+
+def test_fallback_classifies_the_uint8_batch(monkeypatch):
+    expected = fallback.predict_batch(BATCH)
+    seen = []
+    extract = fallback.extract_features
+    monkeypatch.setattr(fallback, "extract_features", lambda batch: seen.append(batch.dtype) or extract(batch))
+
+    assert main.classify_batch(None, BATCH) == expected
+    assert seen == [np.uint8]
+
+
+def test_tf_models_get_floats_in_zero_to_one():
+    model = RecordingModel()
+    results = main.classify_batch(model, BATCH)
+    assert len(results) == len(BATCH)
+    assert model.batch.dtype != np.uint8
+    np.testing.assert_allclose(model.batch, BATCH / 255.0, rtol=1e-6)
@@ -0,0 +1,61 @@
+"""PasswordHasher keeps a worker free for logins during bulk hashing"""
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.passwords import PasswordHasher
+
+
+def test_hash_many_keeps_order():
+    hasher = PasswordHasher(rounds=4, workers=3)
+    passwords = [f"password-{i}" for i in range(7)]
+    try:
+        hashed = asyncio.run(hasher.hash_many_async(passwords))
+    finally:
+        hasher.shutdown()
+    assert all(hasher.verify(p, h) for p, h in zip(passwords, hashed))
+    assert not hasher.verify(passwords[0], hashed[1])
+
+
+def test_bulk_hashing_leaves_a_worker_for_logins(monkeypatch):
+    hasher = PasswordHasher(rounds=4, workers=3, max_queue=4)
+    lock = threading.Lock()
+    running = [0, 0]  # current, peak concurrent bulk hashes
+    hash_one = hasher.hash
+
+    def slow_hash(password):
+        with lock:
+            running[0] += 1
+            running[1] = max(running[1], running[0])
+        time.sleep(0.02)
+        try:
+            return hash_one(password)
+        finally:
+            with lock:
+                running[0] -= 1
+
+    monkeypatch.setattr(hasher, "hash", slow_hash)
+    hashed_login = hash_one("login")
+
+    async def run():
+        bulk = asyncio.ensure_future(hasher.hash_many_async([f"user-{i}" for i in range(40)]))
+        await asyncio.sleep(0.05)
+        # Neither waits for the whole bulk nor finds the queue full
+        started = time.perf_counter()
+        assert await hasher.verify_async("login", hashed_login)
+        waited = time.perf_counter() - started
+        assert not bulk.done()
+        await bulk
+        return waited
+
+    try:
+        waited = asyncio.run(run())
+    finally:
+        hasher.shutdown()
+    assert waited < 0.2
+    assert running[1] == 2
+    assert hasher.stats()["rejected"] == 0
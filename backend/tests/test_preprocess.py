@@ -0,0 +1,70 @@
+"""PreprocessPool recovers when a decode worker process dies"""
+import os
+import signal
+import sys
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.preprocess import DecodePoolError, ImageDecodeError, PreprocessPool, decode_to_uint8
+from benchmark import encode, synthetic_mri
+
+SIZE = (160, 160)
+IMAGES = [encode(synthetic_mri(seed, 256), "PNG") for seed in range(3)]
+
+
+@pytest.fixture
+def pool():
+    pool = PreprocessPool(SIZE, workers=2)
+    yield pool
+    pool.shutdown()
+
+
+def expected():
+    return np.stack([decode_to_uint8(image, SIZE) for image in IMAGES])
+
+
+def kill_worker(executor):
+    """SIGKILL one worker, as the OOM killer would; the executor then marks itself broken"""
+    process = next(iter(executor._processes.values()))
+    os.kill(process.pid, signal.SIGKILL)
+    process.join()
+
+
+def test_pool_decodes_like_in_process():
+    pool = PreprocessPool(SIZE, workers=2)
+    try:
+        np.testing.assert_array_equal(pool.decode_batch(IMAGES), expected())
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGKILL"), reason="needs SIGKILL")
+def test_killed_worker_is_replaced(pool):
+    np.testing.assert_array_equal(pool.decode_batch(IMAGES), expected())
+    broken = pool._executor
+    kill_worker(broken)
+
+    np.testing.assert_array_equal(pool.decode_batch(IMAGES), expected())
+    assert pool._executor is not broken
+    np.testing.assert_array_equal(pool.decode_batch(IMAGES), expected())
+
+
+def test_bad_image_is_still_a_decode_error(pool):
+    with pytest.raises(ImageDecodeError) as error:
+        pool.decode_batch([IMAGES[0], b"not an image", IMAGES[1]])
+    assert error.value.index == 1
+    np.testing.assert_array_equal(pool.decode_batch(IMAGES), expected())
+
+
+def test_pool_that_breaks_again_raises_decode_pool_error(pool, monkeypatch):
+    def broken(executor, images, shape):
+        raise BrokenProcessPool("worker died")
+
+    monkeypatch.setattr(pool, "_decode_in_pool", broken)
+    with pytest.raises(DecodePoolError):
+        pool.decode_batch(IMAGES)
+    assert pool._executor is None
@@ -0,0 +1,84 @@
+"""InferenceScheduler micro-batches keep each request's dtype and scale"""
+import asyncio
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.scheduler import InferenceScheduler
+
+
+def mean_pixel(key, batch):
+    """Mean brightness in [0, 1] per image, whatever dtype the batch arrives in"""
+    scale = 255.0 if batch.dtype == np.uint8 else 1.0
+    assert batch.dtype == np.uint8 or batch.max() <= 1.0, "uint8 pixels were upcast without rescaling"
+    return [(key, str(batch.dtype), len(batch), float(image.mean() / scale)) for image in batch]
+
+
+def images(value, n, dtype):
+    return np.full((n, 4, 4, 3), value, dtype=dtype)
+
+
+async def submit_all(scheduler, requests):
+    try:
+        return await asyncio.gather(*(scheduler.submit(key, batch) for key, batch in requests))
+    finally:
+        await scheduler.stop()
+
+
+def test_mixed_dtypes_in_one_window_are_batched_separately():
+    scheduler = InferenceScheduler(mean_pixel, max_batch_size=64, max_wait_ms=100)
+    requests = [
+        ("cnn", images(204, 2, np.uint8)),
+        ("cnn", images(0.8, 1, np.float64)),
+        ("cnn", images(51, 1, np.uint8)),
+        ("cnn", images(0.2, 3, np.float64)),
+    ]
+    results = asyncio.run(submit_all(scheduler, requests))
+
+    for (_, batch), result in zip(requests, results):
+        assert len(result) == len(batch)
+        for key, dtype, _, mean in result:
+            assert key == "cnn"
+            assert dtype == str(batch.dtype)
+    assert [round(r[3], 6) for r in results[0]] == [0.8, 0.8]
+    assert round(results[1][0][3], 6) == 0.8
+    assert round(results[2][0][3], 6) == 0.2
+    assert [round(r[3], 6) for r in results[3]] == [0.2, 0.2, 0.2]
+
+    # Same-dtype requests still share one batch: 3 uint8 images and 4 float images
+    assert {r[0][1]: r[0][2] for r in results} == {"uint8": 3, "float64": 4}
+    assert scheduler.batches == 2
+    assert scheduler.images == 7
+
+
+def test_keys_are_batched_separately():
+    scheduler = InferenceScheduler(mean_pixel, max_batch_size=64, max_wait_ms=100)
+    results = asyncio.run(submit_all(scheduler, [
+        ("cnn", images(0.5, 2, np.float64)),
+        ("qml", images(0.25, 1, np.float64)),
+    ]))
+    assert [r[0] for r in results[0]] == ["cnn", "cnn"]
+    assert [r[0] for r in results[1]] == ["qml"]
+    assert scheduler.batches == 2
+
+
+def test_errors_reach_every_request_in_the_batch():
+    def fail(key, batch):
+        raise RuntimeError("model unavailable")
+
+    async def run():
+        scheduler = InferenceScheduler(fail, max_batch_size=64, max_wait_ms=50)
+        try:
+            return await asyncio.gather(
+                scheduler.submit("cnn", images(0.5, 1, np.float64)),
+                scheduler.submit("cnn", images(0.5, 2, np.float64)),
+                return_exceptions=True,
+            )
+        finally:
+            await scheduler.stop()
+
+    for result in asyncio.run(run()):
+        assert isinstance(result, RuntimeError)
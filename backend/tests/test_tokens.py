@@ -0,0 +1,69 @@
+"""TokenSigner rejects forged, tampered and expired tokens"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.tokens import TokenSigner, _b64decode, _b64encode
+
+SECRET = b"test-secret"
+CLAIMS = {"sub": "doctor@example.com", "hospital_id": 1}
+
+
+def test_valid_token_round_trips():
+    signer = TokenSigner(SECRET)
+    claims = signer.verify(signer.issue(CLAIMS))
+    assert claims["sub"] == CLAIMS["sub"]
+    assert claims["hospital_id"] == 1
+    # The second check is served from the cache and still returns the claims
+    assert signer.verify(signer.issue(CLAIMS)) is not None
+
+
+def test_token_from_another_secret_is_rejected():
+    forged = TokenSigner(b"attacker-secret").issue(CLAIMS)
+    assert TokenSigner(SECRET).verify(forged) is None
+
+
+def test_tampered_payload_is_rejected():
+    signer = TokenSigner(SECRET)
+    payload, signature = signer.issue(CLAIMS).split(".")
+    elevated = _b64decode(payload).replace(b'"hospital_id":1', b'"hospital_id":2')
+    assert elevated != _b64decode(payload)
+    assert signer.verify(f"{_b64encode(elevated)}.{signature}") is None
+
+
+def test_tampered_signature_is_rejected():
+    signer = TokenSigner(SECRET)
+    payload, signature = signer.issue(CLAIMS).split(".")
+    flipped = ("A" if signature[0] != "A" else "B") + signature[1:]
+    assert signer.verify(f"{payload}.{flipped}") is None
+
+
+def test_malformed_tokens_are_rejected():
+    signer = TokenSigner(SECRET)
+    for token in ("", "not-a-token", "a.b.c", "....", signer.issue(CLAIMS) + ".x"):
+        assert signer.verify(token) is None
+
+
+def test_non_ascii_tokens_are_rejected():
+    signer = TokenSigner(SECRET)
+    payload, signature = signer.issue(CLAIMS).split(".")
+    for token in (f"{payload}.{signature[:-1]}é", f"{payload}é.{signature}", "é.é", "\u2603"):
+        assert signer.verify(token) is None
+
+
+def test_expired_token_is_rejected():
+    signer = TokenSigner(SECRET, ttl_seconds=-1)
+    assert signer.verify(signer.issue(CLAIMS)) is None
+
+
+def test_cached_token_is_rejected_after_expiry(monkeypatch):
+    signer = TokenSigner(SECRET, ttl_seconds=60)
+    token = signer.issue(CLAIMS)
+    assert signer.verify(token) is not None
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert signer.verify(token) is None
+    assert signer.stats()["cached_tokens"] == 0
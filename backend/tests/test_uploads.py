@@ -0,0 +1,101 @@
+"""UploadSizeLimitMiddleware 413s and zero-copy upload buffers"""
+import asyncio
+import hashlib
+import mmap
+import os
+import sys
+
+import httpx
+from fastapi import FastAPI, File, UploadFile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.uploads import UploadSizeLimitMiddleware, upload_buffer
+
+LIMIT = 64 * 1024
+BATCH_LIMIT = 4 * 1024 * 1024
+
+
+def make_app():
+    app = FastAPI()
+    app.state.calls = 0
+
+    @app.post("/upload")
+    @app.post("/batch")
+    async def upload(file: UploadFile = File(...)):
+        app.state.calls += 1
+        data = upload_buffer(file)
+        return {"size": len(data), "sha256": hashlib.sha256(data).hexdigest(), "mmap": isinstance(data, mmap.mmap)}
+
+    @app.get("/upload")
+    async def read():
+        return {"ok": True}
+
+    app.add_middleware(UploadSizeLimitMiddleware, max_bytes=LIMIT, path_limits={"/batch": BATCH_LIMIT})
+    return app
+
+
+def send(path, content=None, chunked=False, method="POST"):
+    app = make_app()
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            if method == "GET":
+                return await client.get(path)
+            request = client.build_request(method, path, files={"file": ("scan.png", content, "image/png")})
+            if chunked:
+                body = request.read()
+
+                async def chunks():
+                    for start in range(0, len(body), 8192):
+                        yield body[start:start + 8192]
+
+                headers = {k: v for k, v in request.headers.items() if k.lower() != "content-length"}
+                request = client.build_request(method, path, content=chunks(), headers=headers)
+                assert "content-length" not in request.headers
+            return await client.send(request)
+
+    return asyncio.run(run()), app.state.calls
+
+
+def test_small_upload_passes_without_a_copy():
+    data = os.urandom(1000)
+    response, calls = send("/upload", data)
+    assert response.status_code == 200 and calls == 1
+    assert response.json() == {"size": 1000, "sha256": hashlib.sha256(data).hexdigest(), "mmap": False}
+
+
+def test_declared_length_over_the_limit_never_reaches_the_endpoint():
+    response, calls = send("/upload", bytes(LIMIT + 1))
+    assert response.status_code == 413
+    assert response.json()["detail"].startswith("Upload too large")
+    assert calls == 0
+
+
+def test_chunked_body_over_the_limit_is_cut_off():
+    response, calls = send("/upload", bytes(LIMIT + 1), chunked=True)
+    assert response.status_code == 413
+    assert calls == 0
+
+
+def test_chunked_body_under_the_limit_passes():
+    data = os.urandom(LIMIT // 2)
+    response, calls = send("/upload", data, chunked=True)
+    assert response.status_code == 200 and calls == 1
+    assert response.json()["sha256"] == hashlib.sha256(data).hexdigest()
+
+
+def test_paths_have_their_own_limit_and_large_uploads_are_mapped():
+    # Over the default limit but within /batch's, and past Starlette's 1 MB in-memory spool
+    data = os.urandom(2 * 1024 * 1024)
+    response, _ = send("/batch", data)
+    assert response.status_code == 200
+    assert response.json() == {"size": len(data), "sha256": hashlib.sha256(data).hexdigest(), "mmap": True}
+    assert send("/batch", bytes(BATCH_LIMIT + 1))[0].status_code == 413
+    assert send("/batch", bytes(BATCH_LIMIT + 1), chunked=True)[0].status_code == 413
+
+
+def test_requests_without_a_body_are_not_checked():
+    response, _ = send("/upload", method="GET")
+    assert response.status_code == 200
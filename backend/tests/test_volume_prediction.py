@@ -0,0 +1,127 @@
+"""Volume slices and image uploads sharing one inference micro-batch"""
+import asyncio
+import gzip
+import os
+import struct
+import sys
+import zlib
+
+import httpx
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import main
+from app.volumes import VolumeError, read_volume
+from benchmark import encode, synthetic_mri
+
+
+def nifti_header(z, y, x):
+    header = bytearray(352)
+    struct.pack_into("<i", header, 0, 348)
+    struct.pack_into("<8h", header, 40, 3, x, y, z, 1, 1, 1, 1)
+    struct.pack_into("<hh", header, 70, 2, 8)  # datatype uint8, 8 bits per voxel
+    struct.pack_into("<f", header, 108, 352.0)
+    header[344:348] = b"n+1\x00"
+    return bytes(header)
+
+
+def nifti(slices):
+    """Minimal uint8 NIfTI-1 file for a (Z, Y, X) stack"""
+    return nifti_header(*slices.shape) + slices.astype(np.uint8).tobytes()
+
+
+def gzip_bomb(header, zero_bytes):
+    """A gzip stream of `header` followed by `zero_bytes` zeros, without holding them in memory"""
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+    parts = [compressor.compress(header)]
+    block = bytes(1024 * 1024)
+    for _ in range(zero_bytes // len(block)):
+        parts.append(compressor.compress(block))
+    parts.append(compressor.flush())
+    return b"".join(parts)
+
+
+def grey_stack(count, size=160):
+    return np.stack([np.asarray(synthetic_mri(seed, size))[..., 0] for seed in range(count)])
+
+
+async def post(requests, params=None):
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(client.post(path, files=files, params=params) for path, files in requests))
+
+
+async def predict(requests, params=None):
+    responses = await post(requests, params)
+    for response in responses:
+        assert response.status_code == 200, response.text
+    return [response.json() for response in responses]
+
+
+def test_volume_slices_match_when_batched_with_images():
+    volume = ("/predict-cnn/volume", {"file": ("scan.nii", nifti(grey_stack(4)), "application/octet-stream")})
+    image = ("/predict-cnn", {"file": ("scan.png", encode(synthetic_mri(99, 256), "PNG"), "image/png")})
+
+    (alone,) = asyncio.run(predict([volume]))
+    together, single = asyncio.run(predict([volume, image]))
+
+    assert main.PREPROCESS_MODE == "exact"
+    assert together["slices"] == alone["slices"]
+    assert together["study"] == alone["study"]
+    # The image is unaffected by sharing the window too
+    (single_alone,) = asyncio.run(predict([image]))
+    assert single == single_alone
+
+
+def test_volume_batch_matches_decoded_image_dtype():
+    batch, foreground, _, _ = main.load_volume("scan.nii", nifti(grey_stack(2)), "cnn", None)
+    image = main.decode_images([encode(synthetic_mri(0, 160), "PNG")])
+    # Both reach the scheduler as uint8; only TF models get floats, in classify_batch
+    assert batch.dtype == image.dtype == np.uint8
+    assert foreground.shape == (2,)
+
+
+def test_volume_slices_score_like_the_same_slice_uploaded_as_png():
+    slices = np.stack([np.asarray(synthetic_mri(seed, 512))[..., 0] for seed in range(6)])
+    volume = ("/predict-cnn/volume", {"file": ("scan.nii", nifti(slices), "application/octet-stream")})
+    images = [("/predict-cnn", {"file": (f"{i}.png", encode(synthetic_mri(i, 512), "PNG"), "image/png")})
+              for i in range(len(slices))]
+    # A 0-255 window leaves uint8 slices unchanged, so both paths start from the same pixels
+    (result,) = asyncio.run(predict([volume], {"window_center": 127.5, "window_width": 255}))
+    expected = asyncio.run(predict(images))
+
+    batch, _, _, _ = main.load_volume("scan.nii", nifti(slices), "cnn", (0.0, 255.0))
+    np.testing.assert_array_equal(batch, main.decode_images([files["file"][1] for _, files in images]))
+    for slice_result, image_result in zip(result["slices"], expected):
+        assert slice_result["tumor_type"] == image_result["tumor_type"]
+        assert slice_result["confidence"] == image_result["confidence"]
+
+
+def test_gzip_volume_is_not_decompressed_past_the_limit():
+    # Declares 64 x 512 x 512 uint8 (16 MB) and really expands that far
+    bomb = gzip_bomb(nifti_header(64, 512, 512), 16 * 1024 * 1024)
+    assert len(bomb) < 64 * 1024
+    with pytest.raises(VolumeError, match="at most 1048576"):
+        read_volume("scan.nii.gz", bomb, max_bytes=1024 * 1024)
+    with pytest.raises(VolumeError, match="at most 16 are supported"):
+        read_volume("scan.nii.gz", bomb, max_slices=16)
+    slices, _, _ = read_volume("scan.nii.gz", bomb)
+    assert slices.shape == (64, 512, 512)
+
+
+def test_gzip_bomb_upload_is_rejected():
+    # Declares 1000 slices of 2048 x 2048, far more than the 1 GB volume limit, over 64 MB of zeros
+    bomb = gzip_bomb(nifti_header(1000, 2048, 2048), 64 * 1024 * 1024)
+    volume = ("/predict-cnn/volume", {"file": ("scan.nii.gz", bomb, "application/octet-stream")})
+    (response,) = asyncio.run(post([volume]))
+    assert response.status_code == 400
+    assert "at most" in response.json()["detail"]
+
+
+def test_truncated_gzip_volume_is_rejected():
+    data = gzip.compress(nifti(grey_stack(2))[:-100])
+    with pytest.raises(VolumeError, match="truncated"):
+        read_volume("scan.nii.gz", data)
@@ -0,0 +1,127 @@
+"""Train the NumPy logistic-regression head served as the "head" model tier
+
+    python train_head.py "C:\\data\\BrainTumor_1\\Train" --output app/feature_head.npz
+
+Images are decoded exactly as /predict-cnn does (PreprocessPool at
+IMG_SIZE), turned into app.feature_head.FEATURE_NAMES and fitted with
+full-batch gradient descent on the L2-regularised softmax loss. The weights
+are written as a .npz that app.main loads at startup (FEATURE_HEAD_PATH), so
+serving needs only NumPy. A holdout split reports how well it generalises.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import fallback
+from app.feature_head import FeatureHead, extract_features, softmax
+from app.feature_store import decode_tolerant, list_dataset, read_files
+from app.preprocess import PreprocessPool
+
+IMG_SIZE = (160, 160)  # same as app.main
+
+
+# =========================
+# FEATURES
+# =========================
+def dataset_features(root, workers, chunk_size):
+    """(features, labels) for every decodable image with a known class folder"""
+    items = [(path, label) for path, label in list_dataset(root) if label in fallback.CLASS_INDEX]
+    print(f"Found {len(items)} images in {len(set(label for _, label in items))} classes")
+    pool = PreprocessPool(IMG_SIZE, workers=workers)
+    features, labels = [], []
+    try:
+        for start in range(0, len(items), chunk_size):
+            chunk = items[start:start + chunk_size]
+            batch, decoded, errors = decode_tolerant(pool, read_files(root, chunk))
+            for i, error in errors.items():
+                print(f"✗ Skipping {chunk[i][0]}: {error}")
+            if len(decoded):
+                features.append(extract_features(batch))
+                labels.extend(fallback.CLASS_INDEX[chunk[i][1]] for i in decoded)
+            print(f"✓ {min(start + chunk_size, len(items))}/{len(items)} images")
+    finally:
+        pool.shutdown()
+    if not labels:
+        raise SystemExit("No decodable images with a known class folder")
+    return np.concatenate(features), np.array(labels)
+
+
+# =========================
+# TRAINING
+# =========================
+def fit(features, labels, n_classes, l2, iterations, learning_rate):
+    """Standardization and softmax-regression weights by full-batch gradient descent"""
+    mean = features.mean(axis=0)
+    scale = features.std(axis=0)
+    scale[scale == 0] = 1.0
+    x = (features - mean) / scale
+    targets = np.eye(n_classes)[labels]
+
+    weights = np.zeros((x.shape[1], n_classes))
+    bias = np.zeros(n_classes)
+    for iteration in range(iterations):
+        probabilities = softmax(x @ weights + bias)
+        error = (probabilities - targets) / len(x)
+        weights -= learning_rate * (x.T @ error + l2 * weights)
+        bias -= learning_rate * error.sum(axis=0)
+        if (iteration + 1) % max(1, iterations // 5) == 0:
+            loss = -np.log(probabilities[np.arange(len(x)), labels] + 1e-12).mean()
+            print(f"  iteration {iteration + 1}: loss {loss:.4f}")
+    return weights, bias, mean, scale
+
+
+def accuracy(head, features, labels):
+    if not len(labels):
+        return None
+    return round(float((head.predict_features(features).argmax(axis=1) == labels).mean()), 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the NumPy feature head")
+    parser.add_argument("root", help="dataset directory with one subfolder per class")
+    parser.add_argument("--output", default=os.path.join("app", "feature_head.npz"), help="weights file to write")
+    parser.add_argument("--version", help="head version (default: timestamp)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="decode processes (0 decodes in this process)")
+    parser.add_argument("--chunk-size", type=int, default=256, help="images decoded per chunk")
+    parser.add_argument("--l2", type=float, default=1e-3, help="L2 regularisation strength")
+    parser.add_argument("--iterations", type=int, default=2000, help="gradient descent steps")
+    parser.add_argument("--learning-rate", type=float, default=0.5)
+    parser.add_argument("--holdout", type=float, default=0.2, help="fraction of images held out for reporting")
+    parser.add_argument("--seed", type=int, default=0, help="holdout split seed")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.root):
+        raise SystemExit(f"Not a directory: {args.root}")
+    features, labels = dataset_features(args.root, args.workers, args.chunk_size)
+
+    train = np.ones(len(labels), dtype=bool)
+    if args.holdout > 0:
+        order = np.random.default_rng(args.seed).permutation(len(labels))
+        train[order[:int(round(len(labels) * args.holdout))]] = False
+
+    print(f"Training on {train.sum()} images ({(~train).sum()} held out)")
+    start = time.perf_counter()
+    weights, bias, mean, scale = fit(
+        features[train], labels[train], len(fallback.CLASS_NAMES), args.l2, args.iterations, args.learning_rate
+    )
+    version = args.version or datetime.now().strftime("%Y%m%d%H%M%S")
+    head = FeatureHead(weights, bias, mean, scale, fallback.CLASS_NAMES, version)
+    train_accuracy = accuracy(head, features[train], labels[train])
+    holdout_accuracy = accuracy(head, features[~train], labels[~train])
+    print(f"✓ Trained in {time.perf_counter() - start:.1f}s: accuracy {train_accuracy} train, "
+          f"{holdout_accuracy} holdout")
+
+    head.save(args.output, train_accuracy=np.array(train_accuracy, dtype=float),
+              holdout_accuracy=np.array(np.nan if holdout_accuracy is None else holdout_accuracy))
+    print(f"✓ Feature head {version} written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
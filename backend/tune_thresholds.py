@@ -0,0 +1,276 @@
+"""Tune the fallback threshold table on a feature store and write a rule file
+
+    python build_feature_store.py "C:\\data\\BrainTumor_1\\Train" --store feature_store/train
+    python tune_thresholds.py feature_store/train --output app/fallback_rules.json
+
+Starting from the current table (the built-in FALLBACK_RULES or --start),
+each rule's lower bound, upper bound and weight, and the inconclusive-score
+cut-off, are improved one at a time by coordinate search: every candidate
+value for a coordinate is scored against the whole feature set in one
+vectorized pass, and rounds repeat until nothing improves. The result is a
+versioned JSON rule file that app.main loads at startup (FALLBACK_RULES_PATH),
+so retuning needs no code edits. A holdout split reports how well the tuned
+table generalises.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import fallback
+from app.feature_store import FeatureStore
+
+IMG_SIZE = (160, 160)  # same as app.main
+WEIGHT_CANDIDATES = np.arange(0, 105, 5, dtype=np.float64)
+MIN_SCORE_CANDIDATES = np.arange(0, 105, 5, dtype=np.float64)
+# Candidates x images evaluated per pass; bounds the (candidates, N, classes) score array
+MAX_CANDIDATE_CELLS = 2_000_000
+THRESHOLD_DECIMALS = 4
+
+
+# =========================
+# EVALUATION
+# =========================
+def objective(predictions, labels, balanced):
+    """Accuracy, or mean per-class recall, of (..., N) predicted class indices"""
+    correct = predictions == labels
+    if not balanced:
+        return correct.mean(axis=-1)
+    return np.mean([correct[..., labels == k].mean(axis=-1) for k in np.unique(labels)], axis=0)
+
+
+def per_class_recall(predictions, labels):
+    return {
+        fallback.CLASS_NAMES[k]: round(float((predictions[labels == k] == k).mean()), 4)
+        for k in np.unique(labels)
+    }
+
+
+def rule_hits(values, lower, upper):
+    """(C, N) hits of C candidate (lower, upper) intervals; open sides are -inf/+inf"""
+    lower = np.asarray(lower, dtype=np.float64).reshape(-1, 1)
+    upper = np.asarray(upper, dtype=np.float64).reshape(-1, 1)
+    return (values > lower) & (values < upper)
+
+
+def evaluate_candidates(features, labels, rest, class_id, values, lowers, uppers, weights,
+                        min_score, balanced):
+    """Objective for each candidate (lower, upper, weight) of one rule on top of `rest` scores"""
+    n = len(labels)
+    step = max(1, MAX_CANDIDATE_CELLS // max(n, 1))
+    results = []
+    for start in range(0, len(lowers), step):
+        stop = start + step
+        hits = rule_hits(values, lowers[start:stop], uppers[start:stop])
+        scores = np.repeat(rest[None], hits.shape[0], axis=0)
+        scores[:, :, class_id] += weights[start:stop, None] * hits
+        predictions, _ = fallback.decide(features, scores, min_score)
+        results.append(objective(predictions, labels, balanced))
+    return np.concatenate(results)
+
+
+# =========================
+# COORDINATE SEARCH
+# =========================
+class RuleTable:
+    """Mutable copy of a threshold table that keeps its (N, n_classes) scores up to date"""
+
+    def __init__(self, rules, min_confident_score, features):
+        self.rules = [
+            [class_name, feature, -np.inf if lower is None else lower, np.inf if upper is None else upper, weight]
+            for class_name, feature, lower, upper, weight in rules
+        ]
+        self.min_confident_score = float(min_confident_score)
+        self.features = features
+        self.scores = np.zeros((len(features), len(fallback.CLASS_NAMES)))
+        for i in range(len(self.rules)):
+            self._apply(i, 1)
+
+    def values(self, i):
+        return self.features[:, fallback.FEATURE_INDEX[self.rules[i][1]]]
+
+    def class_id(self, i):
+        return fallback.CLASS_INDEX[self.rules[i][0]]
+
+    def _apply(self, i, sign):
+        _, _, lower, upper, weight = self.rules[i]
+        hits = rule_hits(self.values(i), lower, upper)[0]
+        self.scores[:, self.class_id(i)] += sign * weight * hits
+
+    def set_rule(self, i, lower, upper, weight):
+        self._apply(i, -1)
+        self.rules[i][2:] = [float(lower), float(upper), float(weight)]
+        self._apply(i, 1)
+
+    def as_rules(self):
+        return tuple(
+            (class_name, feature, None if np.isinf(lower) else lower, None if np.isinf(upper) else upper,
+             int(weight) if float(weight).is_integer() else weight)
+            for class_name, feature, lower, upper, weight in self.rules
+        )
+
+
+def threshold_candidates(values, current, grid):
+    """Quantiles of a feature, the current bound and 'open', rounded for a readable rule file"""
+    quantiles = np.quantile(values, np.linspace(0, 1, grid)) if len(values) else np.empty(0)
+    candidates = np.round(np.append(quantiles, current), THRESHOLD_DECIMALS)
+    return np.unique(np.append(candidates, [-np.inf, np.inf]))
+
+
+def tune(table, labels, grid, rounds, balanced):
+    """Improve `table` in place by coordinate search; returns (objective, candidates evaluated)"""
+    features = table.features
+    predictions, _ = fallback.decide(features, table.scores, table.min_confident_score)
+    best = float(objective(predictions, labels, balanced))
+    evaluated = 1
+
+    for round_number in range(1, rounds + 1):
+        improved = False
+        for i in range(len(table.rules)):
+            class_id = table.class_id(i)
+            values = table.values(i)
+            for coordinate in ("lower", "upper", "weight"):
+                _, _, lower, upper, weight = table.rules[i]
+                rest = table.scores.copy()
+                rest[:, class_id] -= weight * rule_hits(values, lower, upper)[0]
+
+                if coordinate == "weight":
+                    candidates = np.unique(np.append(WEIGHT_CANDIDATES, weight))
+                    lowers, uppers = np.full_like(candidates, lower), np.full_like(candidates, upper)
+                    weights = candidates
+                else:
+                    candidates = threshold_candidates(values, lower if coordinate == "lower" else upper, grid)
+                    lowers = candidates if coordinate == "lower" else np.full_like(candidates, lower)
+                    uppers = candidates if coordinate == "upper" else np.full_like(candidates, upper)
+                    weights = np.full_like(candidates, weight)
+
+                results = evaluate_candidates(features, labels, rest, class_id, values, lowers, uppers,
+                                              weights, table.min_confident_score, balanced)
+                evaluated += len(candidates)
+                j = int(results.argmax())
+                if results[j] > best + 1e-12:
+                    best = float(results[j])
+                    table.set_rule(i, lowers[j], uppers[j], weights[j])
+                    improved = True
+
+        # The inconclusive cut-off only changes which images take the emergency heuristic
+        candidates = np.unique(np.append(MIN_SCORE_CANDIDATES, table.min_confident_score))
+        predictions, _ = fallback.decide(features, table.scores[None], candidates[:, None])
+        results = objective(predictions, labels, balanced)
+        evaluated += len(candidates)
+        j = int(results.argmax())
+        if results[j] > best + 1e-12:
+            best = float(results[j])
+            table.min_confident_score = float(candidates[j])
+            improved = True
+
+        print(f"  round {round_number}: objective {best:.4f} ({evaluated} candidates so far)")
+        if not improved:
+            break
+    return best, evaluated
+
+
+# =========================
+# MAIN
+# =========================
+def split(n, holdout, seed):
+    """Boolean train mask with `holdout` of the rows held out"""
+    train = np.ones(n, dtype=bool)
+    if holdout > 0:
+        order = np.random.default_rng(seed).permutation(n)
+        train[order[:int(round(n * holdout))]] = False
+    return train
+
+
+def report(name, rules, min_score, features, labels):
+    if not len(labels):
+        return {}
+    predictions, _ = fallback.decide(features, fallback.score_features(features, rules), min_score)
+    metrics = {
+        "images": int(len(labels)),
+        "accuracy": round(float(objective(predictions, labels, False)), 4),
+        "balanced_accuracy": round(float(objective(predictions, labels, True)), 4),
+        "recall": per_class_recall(predictions, labels),
+    }
+    print(f"  {name:<18} accuracy {metrics['accuracy']:.4f}  balanced {metrics['balanced_accuracy']:.4f}  "
+          f"({metrics['images']} images)")
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune the fallback threshold table")
+    parser.add_argument("store", help="feature store directory from build_feature_store.py")
+    parser.add_argument("--output", default=os.path.join("app", "fallback_rules.json"), help="rule file to write")
+    parser.add_argument("--start", help="rule file to start from (default: built-in rules)")
+    parser.add_argument("--version", help="rule version (default: derived from the tuned table)")
+    parser.add_argument("--grid", type=int, default=64, help="quantile candidates per threshold")
+    parser.add_argument("--rounds", type=int, default=5, help="maximum coordinate search rounds")
+    parser.add_argument("--objective", choices=("balanced", "accuracy"), default="balanced",
+                        help="mean per-class recall, or plain accuracy")
+    parser.add_argument("--holdout", type=float, default=0.2, help="fraction of images held out for reporting")
+    parser.add_argument("--seed", type=int, default=0, help="holdout split seed")
+    args = parser.parse_args()
+
+    if not os.path.exists(os.path.join(args.store, "index.json")):
+        raise SystemExit(f"No feature store at {args.store}; run build_feature_store.py first")
+    store = FeatureStore(args.store, IMG_SIZE)
+    features, label_names, _ = store.labeled()
+    known = [name in fallback.CLASS_INDEX for name in label_names]
+    if not all(known):
+        print(f"✗ Ignoring {known.count(False)} images whose folder is not one of {fallback.CLASS_NAMES}")
+    features = features[known]
+    labels = np.array([fallback.CLASS_INDEX[name] for name in label_names if name in fallback.CLASS_INDEX])
+    if not len(labels):
+        raise SystemExit("Feature store has no labelled images")
+
+    if args.start:
+        start_version = fallback.load_rules(args.start)
+    else:
+        start_version = fallback.RULES_VERSION
+    start_rules, start_min_score = fallback.FALLBACK_RULES, fallback.MIN_CONFIDENT_SCORE
+
+    train = split(len(labels), args.holdout, args.seed)
+    print(f"Tuning rules {start_version} on {train.sum()} images ({(~train).sum()} held out)")
+    table = RuleTable(start_rules, start_min_score, features[train])
+    began = time.perf_counter()
+    _, evaluated = tune(table, labels[train], args.grid, args.rounds, args.objective == "balanced")
+    elapsed = time.perf_counter() - began
+    print(f"✓ Evaluated {evaluated} candidate tables in {elapsed:.1f}s")
+
+    rules = table.as_rules()
+    metrics = {}
+    for name, mask in (("train", train), ("holdout", ~train)):
+        metrics[name] = {
+            "before": report(f"{name} (before)", start_rules, start_min_score, features[mask], labels[mask]),
+            "after": report(f"{name} (after)", rules, table.min_confident_score, features[mask], labels[mask]),
+        }
+
+    digest = hashlib.sha256(
+        json.dumps([rules, table.min_confident_score], sort_keys=True).encode()
+    ).hexdigest()[:12]
+    version = args.version or f"tuned-{digest}"
+    content = fallback.rules_to_dict(
+        rules, version, table.min_confident_score,
+        created_at=datetime.now().isoformat(timespec="seconds"),
+        tuned_from=start_version,
+        feature_store={"path": os.path.abspath(args.store), "settings": store.settings},
+        search={"objective": args.objective, "grid": args.grid, "rounds": args.rounds,
+                "holdout": args.holdout, "seed": args.seed, "candidates": evaluated},
+        metrics=metrics,
+    )
+    tmp = args.output + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(content, f, indent=2)
+    os.replace(tmp, args.output)
+    print(f"✓ Rules {version} written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,7 @@ function CML() {
   const [result, setResult] = useState(null);
   const [loading, setLoading] = useState(false);
   const username = localStorage.getItem("username");
+  const token = localStorage.getItem("token");
 
   const handleImage = (e) => {
     const file = e.target.files && e.target.files[0];
@@ -33,6 +34,7 @@ function CML() {
     try {
       const response = await fetch("http://127.0.0.1:8000/predict-cnn", {
         method: "POST",
+        headers: token ? { Authorization: `Bearer ${token}` } : {},
         body: formData,
       });
       let data;
@@ -41,6 +43,12 @@ function CML() {
       } catch (e) {
         data = { error: 'Invalid JSON response from server' };
       }
+      if (response.status === 401) {
+        // The saved session is no longer valid (e.g. the server restarted): sign in again
+        setLoading(false);
+        handleLogout();
+        return;
+      }
       if (!response.ok) {
         setResult({ error: data.detail || data.error || 'Server returned an error' });
       } else {
@@ -61,6 +69,7 @@ function CML() {
   const handleLogout = () => {
     localStorage.removeItem("username");
     localStorage.removeItem("hospital");
+    localStorage.removeItem("token");
     navigate("/", { replace: true });
   };
 
@@ -10,6 +10,7 @@ function Dashboard() {
   const handleLogout = () => {
     localStorage.removeItem("username");
     localStorage.removeItem("hospital");
+    localStorage.removeItem("token");
     navigate("/", { replace: true });
   };
 
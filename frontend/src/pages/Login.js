@@ -72,6 +72,7 @@ const Login = () => {
       if (response.ok) {
         localStorage.setItem("username", username);
         localStorage.setItem("hospital", data.hospital || "");
+        localStorage.setItem("token", data.access_token || "");
         alert("✓ Login successful! Welcome to Brain Tumor Classification.");
         // Delay navigation slightly to ensure localStorage is set before page loads
         setTimeout(() => {
@@ -9,6 +9,7 @@ function QML() {
   const [result, setResult] = useState(null);
   const [loading, setLoading] = useState(false);
   const username = localStorage.getItem("username");
+  const token = localStorage.getItem("token");
 
   const handleImage = (e) => {
     const file = e.target.files && e.target.files[0];
@@ -35,6 +36,7 @@ function QML() {
     try {
       const response = await fetch("http://127.0.0.1:8000/predict-qml", {
         method: "POST",
+        headers: token ? { Authorization: `Bearer ${token}` } : {},
         body: formData,
       });
       let data;
@@ -43,6 +45,12 @@ function QML() {
       } catch (e) {
         data = { error: 'Invalid JSON response from server' };
       }
+      if (response.status === 401) {
+        // The saved session is no longer valid (e.g. the server restarted): sign in again
+        setLoading(false);
+        handleLogout();
+        return;
+      }
       if (!response.ok) {
         setResult({ error: data.detail || data.error || 'Server returned an error' });
       } else {
@@ -64,6 +72,7 @@ function QML() {
   const handleLogout = () => {
     localStorage.removeItem("username");
     localStorage.removeItem("hospital");
+    localStorage.removeItem("token");
     navigate("/", { replace: true });
   };
 